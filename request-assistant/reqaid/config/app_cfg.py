@@ -5,11 +5,13 @@ Global configuration file for TG2-specific settings in reqaid.
 This file complements development/deployment.ini.
 
 """
-from tg.configuration import AppConfig
+from tg.configuration import AppConfig, milestones
 
 import reqaid
 from reqaid import model, lib
 
+import os
+import threading
 import transaction
 
 base_config = AppConfig()
@@ -158,6 +160,59 @@ base_config.sa_auth.post_login_url = '/post_login'
 # You may optionally define a page where you want users to be redirected to
 # on logout:
 base_config.sa_auth.post_logout_url = '/post_logout'
+
+
+def _configure_oci():
+    """Apply the oci.* settings of the .ini file to the OCI-P tools."""
+    from tg import config
+    from tg.support.converters import asbool, asint, aslist
+    from reqaid.controllers.server import tools
+    settings = {}
+    for k in ['max_sessions', 'max_idle', 'acquire_timeout']:
+        if config.get('oci.pool.%s' % k):
+            settings[k] = asint(config['oci.pool.%s' % k])
+    tools.configure_oci_pool(**settings)
+    tools.configure_oci_transport(
+        transport=config.get('oci.transport'),
+        oci_host=config.get('oci.tcp.host'),
+        oci_port=config.get('oci.tcp.port') and
+        asint(config['oci.tcp.port']),
+        oci_tls=config.get('oci.tcp.tls') and asbool(config['oci.tcp.tls']),
+        oci_ca_certs=config.get('oci.tcp.ca_certs'))
+    tools.configure_oci_cache(
+        config.get('oci.cache.max_entries') and
+        asint(config['oci.cache.max_entries']),
+        config.get('oci.cache.ttl') and asint(config['oci.cache.ttl']))
+    tools.configure_outbound(
+        enabled=config.get('outbound.enabled') and
+        asbool(config['outbound.enabled']),
+        **dict((k, config.get('outbound.%s' % k) and
+                float(config['outbound.%s' % k]))
+               for k in ['initial_limit', 'min_limit', 'max_limit',
+                         'target_latency', 'backoff', 'queue_timeout']))
+    tools.configure_traffic(
+        config.get('traffic.record'), config.get('traffic.replay'),
+        config.get('traffic.replay_latency') and
+        float(config['traffic.replay_latency']),
+        asbool(config.get('traffic.replay_passthrough', False)))
+    tools.configure_oci_coalescing(
+        config.get('oci.coalesce.window_ms') and
+        asint(config['oci.coalesce.window_ms']) / 1000.0)
+    tools.configure_wsdl_cache(
+        config.get('oci.wsdl.cache_dir') or
+        (config.get('cache_dir') and
+         os.path.join(config['cache_dir'], 'oci_wsdl')),
+        config.get('oci.wsdl.max_age') and asint(config['oci.wsdl.max_age']))
+    prewarm = aslist(config.get('oci.wsdl.prewarm'), ',', strip=True)
+    if prewarm:
+        # Do not hold up the startup with WSDL downloads
+        t = threading.Thread(target=tools.prewarm_wsdl_cache, args=prewarm,
+                             name="OciWsdlPrewarm")
+        t.daemon = True
+        t.start()
+
+milestones.config_ready.register(_configure_oci)
+
 '''
 try:
     # Enable DebugBar if available, install tgext.debugbar to turn it on
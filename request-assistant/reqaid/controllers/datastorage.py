@@ -60,10 +60,10 @@ class DataStorage:
         if user_data.get("deviceTypes"):
             return user_data["deviceTypes"]
         if user_data.get("admin_username") and user_data.get("admin_password"):
-            oci = tools.create_oci_tool(username=user_data.get("admin_username"),
-                                        password=user_data.get("admin_password"),
-                                        server=user_data.get("server"))
-            user_data["userSCAList"] = oci.user_get_sca_list(self._user())
+            with tools.oci_session(username=user_data.get("admin_username"),
+                                   password=user_data.get("admin_password"),
+                                   server=user_data.get("server")) as oci:
+                user_data["userSCAList"] = oci.user_get_sca_list(self._user())
             return [item['Device Type'] for item in user_data["userSCAList"]]
         return []
 
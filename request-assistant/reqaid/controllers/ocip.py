@@ -49,32 +49,41 @@ class OCIPController(BaseController):
         self.base_dict["output"] = ''
         return self.base_dict
 
+    def _request_arguments(self, method, kw):
+        args = []
+        _kwargs = False
+        for a in self.REQUESTS[method].arguments:
+            if a.type == 'bool':
+                self.ds.set_user_prop(a.name, {"checked" : "on" if kw.get(a.name) else "off"})
+                kw[a.name] = bool(kw.get(a.name) and kw[a.name] in ['on'])
+            elif a.type == 'file':
+                # Uploads are passed on as the spooled file, not read here
+                assert hasattr(kw.get(a.name), 'file'), "missing file %s" % a.name
+                kw[a.name] = kw[a.name].file
+            else:
+                assert a.name in kw, "missing argument %s" % a.name
+                self.ds.set_user_prop(a.name, utils.xml_string(kw[a.name]))
+            if a.encode:
+                kw[a.name] = base64.b64encode(kw[a.name])
+            if a.optional and kw[a.name] == '':
+                  kw[a.name] = a.value
+            if a.pos > -1:
+                args.insert(a.pos, kw[a.name])
+            else:
+                _kwargs = True
+        return args, _kwargs
+
     def _execute_reqest(self, method, **kw):
         log.debug("[OCIP] execute %s(%s)" % (method, kw))
-        oci = tools.create_oci_tool(username=self.ds.get_admin_username(),
-                                    password=self.ds.get_admin_password(),
-                                    server=self.ds.get_server())
         try:
-            func = getattr(oci, method)
-            args = []
-            _kwargs = False
-            for a in self.REQUESTS[method].arguments:
-                if a.type == 'bool':
-                    self.ds.set_user_prop(a.name, {"checked" : "on" if kw.get(a.name) else "off"})
-                    kw[a.name] = bool(kw.get(a.name) and kw[a.name] in ['on'])
-                else:
-                    assert a.name in kw, "missing argument %s" % a.name
-                    self.ds.set_user_prop(a.name, utils.xml_string(kw[a.name]))
-                if a.encode:
-                    kw[a.name] = base64.b64encode(kw[a.name])
-                if a.optional and kw[a.name] == '':
-                      kw[a.name] = a.value
-                if a.pos > -1:
-                    args.insert(a.pos, kw[a.name])
-                else:
-                    _kwargs = True
-            log.info("Call %s with %s and %s" % (method, args, kw))
-            res = func(*args, **kw) if _kwargs else func(*args)
+            with tools.oci_session(username=self.ds.get_admin_username(),
+                                   password=self.ds.get_admin_password(),
+                                   server=self.ds.get_server()) as oci:
+                func = getattr(oci, method)
+                args, _kwargs = self._request_arguments(method, kw)
+                log.info("Call %s with %s and %s" % (method, args, kw))
+                res = func(*args, **kw) if _kwargs else func(*args)
+                oci_command = oci.oci_command
         except AttributeError as ae:
             flash('Please set xsi user settings', 'error')
         except AssertionError as ae:
@@ -82,7 +91,55 @@ class OCIPController(BaseController):
             self.base_dict["output"] = "%s" % ae
             return self.base_dict
         self.base_dict["output"] = "OCI Command: \n%s\n" \
-                                   "OCI Response:\n%s\n" % (oci.oci_command, utils.xml_string(res))
+                                   "OCI Response:\n%s\n" % (oci_command, utils.xml_string(res))
+        return self.base_dict
+
+    def _teardown_users(self, user_ids, dry_run):
+        users = [u.strip() for u in user_ids.replace(',', '\n').splitlines()
+                 if u.strip()]
+        report = tools.teardown_users(users, dry_run=dry_run,
+                                      username=self.ds.get_admin_username(),
+                                      password=self.ds.get_admin_password(),
+                                      server=self.ds.get_server())
+        if dry_run:
+            return "%s\n\nPlanned:\n%s" % (report,
+                                             report.workflow.describe())
+        return "%s\n\n%s" % (report, "\n".join(
+            "%-8s %s" % (s.status, s.name) for s in report.workflow.steps))
+
+    def _sync_custom_tags(self, tag_lines, exact, dry_run):
+        tags = []
+        for line in tag_lines.splitlines():
+            if not line.strip():
+                continue
+            device, _, tag = line.strip().partition(' ')
+            tag = tag.strip()
+            if tag.startswith('-'):
+                tags.append((device, {tag[1:]: None}))
+            else:
+                assert '=' in tag, "expected 'device %%TAG%%=value', " \
+                                   "got '%s'" % line
+                name, _, value = tag.partition('=')
+                tags.append((device, {name: value}))
+        report = tools.sync_custom_tags(tags, exact=exact, dry_run=dry_run,
+                                        username=self.ds.get_admin_username(),
+                                        password=self.ds.get_admin_password(),
+                                        server=self.ds.get_server())
+        return "%s%s" % ("Dry run, nothing changed\n" if dry_run else "",
+                         report)
+
+    # Requests which run on many sessions instead of one OciClient method
+    BULK_REQUESTS = {"teardown_users": _teardown_users,
+                     "sync_custom_tags": _sync_custom_tags}
+
+    def _execute_bulk_request(self, method, **kw):
+        log.debug("[OCIP] execute bulk %s(%s)" % (method, kw))
+        try:
+            args, _kwargs = self._request_arguments(method, kw)
+            self.base_dict["output"] = self.BULK_REQUESTS[method](self, *args)
+        except AssertionError as ae:
+            flash('OCI call failed: %s' % ae, 'error')
+            self.base_dict["output"] = "%s" % ae
         return self.base_dict
 
     @expose('reqaid.templates.ociprequest')
@@ -95,6 +152,8 @@ class OCIPController(BaseController):
             redirect("ocipsettings", action="set_device_type")
         if pagename in self.REQUESTS.keys():
             return self._render_page(pagename, **kw)
+        elif pagename[0:5] == 'call_' and pagename[5:] in self.BULK_REQUESTS:
+            return self._execute_bulk_request(pagename[5:], **kw)
         elif pagename[0:5] == 'call_' and pagename[5:] in self.REQUESTS.keys():
             return self._execute_reqest(pagename[5:], **kw)
         else:
@@ -141,6 +200,11 @@ class OCIPController(BaseController):
                 return False
         return True
 
+    @expose('json')
+    def outbound_stats(self, **kw):
+        """Live concurrency budgets and queue depths per server."""
+        return tools.outbound_stats()
+
     @expose('reqaid.templates.ociprequest')
     def index(self):
         log.debug("[OCIP] index")
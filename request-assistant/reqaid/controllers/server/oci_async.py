@@ -0,0 +1,122 @@
+"""
+Concurrent OCI-P client for bulk operations.
+
+OciClient sends one command at a time. AsyncOciClient runs the same
+command methods on N worker threads, each one borrowing an authenticated
+session from its own OciSessionPool, and returns AsyncResult objects
+(multiprocessing.pool) instead of responses:
+
+    with AsyncOciClient(tools.create_oci_tool, concurrency=8,
+                        username=.., password=.., server=..) as oci:
+        results = oci.map('user_get_data', [(u,) for u in user_ids])
+        data = oci.gather(results)
+
+At most 'concurrency' commands are in flight and at most 'concurrency'
+sessions are logged in, so N independent reads take roughly 1/N of the
+time they take through a single OciClient.
+"""
+import logging
+from multiprocessing.pool import ThreadPool
+
+from oci_pool import OciSessionPool
+from outbound import priority, BULK
+from oci_tool import OciClient
+
+log = logging.getLogger(__name__)
+
+
+class AsyncOciClient(object):
+    """
+    OciClient counterpart whose command methods run concurrently and return
+    multiprocessing.pool.AsyncResult objects. Use gather() to wait for
+    them.
+    """
+
+    def __init__(self, factory, concurrency=4, pool=None, **kwargs):
+        """
+        :param factory: Callable creating a logged in OciClient from kwargs,
+                        e.g. tools.create_oci_tool
+        :param concurrency: Maximum number of commands in flight, and of
+                            sessions logged in
+        :param pool: Optional OciSessionPool to borrow sessions from.
+                     Defaults to a private pool of 'concurrency' sessions.
+        :param kwargs: Arguments of 'factory' (username, password,
+                       server, ...)
+        """
+        self.concurrency = concurrency
+        self.kwargs = kwargs
+        self._own_pool = pool is None
+        self.pool = pool or OciSessionPool(factory, max_sessions=concurrency,
+                                           reap_interval=None)
+        self._workers = ThreadPool(concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or \
+                not callable(getattr(OciClient, name, None)):
+            raise AttributeError(name)
+
+        def _command(*args, **kwargs):
+            return self.submit(_call, name, *args, **kwargs)
+        _command.__name__ = name
+        _command.__doc__ = getattr(OciClient, name).__doc__
+        return _command
+
+    def _run(self, func, args, kwargs):
+        # Interactive requests go ahead of bulk ones, see outbound
+        with priority(BULK), self.pool.session(**self.kwargs) as oci:
+            return func(oci, *args, **kwargs)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Runs func(oci, *args, **kwargs) on a worker with a borrowed session.
+        Use it for sequences of dependent commands.
+
+        :return: AsyncResult
+        """
+        return self._workers.apply_async(self._run, (func, args, kwargs))
+
+    def map(self, method, args_list):
+        """
+        Calls an OciClient method once per argument tuple.
+
+        :param method: OciClient method name, e.g. 'user_get_sca_list'
+        :param args_list: Iterable of argument tuples
+        :return: List of AsyncResult, in the order of args_list
+        """
+        return [self.submit(_call, method, *args) for args in args_list]
+
+    @staticmethod
+    def gather(results, return_exceptions=False):
+        """
+        Waits for AsyncResults and returns their values in order.
+
+        :param return_exceptions: When 'True' failed calls give their
+                                  exception instead of raising the first
+                                  one
+        """
+        values = []
+        for result in results:
+            try:
+                values.append(result.get())
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                values.append(e)
+        return values
+
+    def close(self):
+        """Waits for submitted calls and logs the sessions out."""
+        self._workers.close()
+        self._workers.join()
+        if self._own_pool:
+            self.pool.close()
+
+
+def _call(oci, method, *args, **kwargs):
+    return getattr(oci, method)(*args, **kwargs)
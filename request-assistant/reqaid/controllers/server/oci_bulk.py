@@ -0,0 +1,819 @@
+"""
+Bulk provisioning of UC-One test users from a manifest, and bulk teardown
+of users with their devices.
+
+A manifest is a CSV file with a header row, or a JSON list of objects,
+with the arguments of OciClient.create_ucone_test_user() per user:
+
+    first_name,last_name,password,primary_device,sca_devices,clid_suffix
+    Alice,Anderson,Welcom3,Polycom-550,Connect - Mobile;Business ...,
+
+'sca_devices' is a ';' separated list in CSV files. Empty
+'primary_device' / 'sca_devices' fields mean the defaults of
+create_ucone_test_user(), "-" means none.
+
+The group's domain is fetched once, numbers are reserved from the group's
+oci_numbers.NumberPool, and users are created concurrently on an
+oci_async.AsyncOciClient. The outcome of every
+user is appended to a state file as one JSON object per line, so a run
+can be resumed: users already created are skipped.
+
+BulkTeardown deletes users given by id or fnmatch pattern. The devices of
+all users are looked up concurrently, and the deletions run as one
+oci_workflow.Workflow: for each user, every device is detached and
+deleted, and the user is deleted last.
+
+BulkTagSync brings the custom tags of many access devices to a desired
+state. The current tags of the devices are read concurrently, and only
+the tags which differ are added, modified or deleted, in batches sent in
+parallel.
+
+ConfigRollout uploads device config files. The hash of the content last
+uploaded to each device of a server and group is kept in a state file, so
+unchanged files are not sent again. The other files are uploaded
+concurrently, and rebuilt with one group level rebuild when most of the
+group's devices of their type were touched.
+"""
+import base64
+import hashlib
+import io
+import csv
+import json
+import time
+import fnmatch
+import threading
+import logging
+
+from oci_tool import ucone_user_part
+from oci_response import OciError
+from oci_search import starts_with
+from utils import value_to_str
+from oci_workflow import Workflow
+
+log = logging.getLogger(__name__)
+
+_USER_FIELDS = ['first_name', 'last_name', 'password', 'primary_device',
+                'sca_devices', 'clid_suffix']
+
+
+def load_manifest(path):
+    """
+    Reads a CSV or JSON (.json) manifest.
+
+    :return: List of create_ucone_test_user() keyword argument dicts
+    """
+    with io.open(path, encoding='utf-8-sig') as f:
+        text = f.read()
+    if path.lower().endswith('.json'):
+        rows = json.loads(text)
+    else:
+        rows = list(csv.DictReader(text.encode('utf-8').splitlines()))
+        rows = [dict((k, v.decode('utf-8')) for k, v in row.iteritems()
+                     if v) for row in rows]
+        for row in rows:
+            if 'sca_devices' in row:
+                row['sca_devices'] = [d.strip() for d in
+                                      row['sca_devices'].split(';')
+                                      if d.strip()]
+    users = []
+    for row in rows:
+        user = dict((k, v) for k, v in row.iteritems()
+                    if k in _USER_FIELDS and v != '')
+        assert all(k in user for k in _USER_FIELDS[:3]), \
+            "Manifest user %s lacks first_name, last_name or password" % row
+        if user.get('primary_device') == '-':
+            user['primary_device'] = None
+        if user.get('sca_devices') in ('-', ['-']):
+            user['sca_devices'] = []
+        users.append(user)
+    return users
+
+
+def read_state(path, key='user'):
+    """
+    Returns the last recorded outcome of each user of a state file,
+    {user part: record}.
+
+    :param key: Record field identifying the records, e.g. 'device', or a
+                tuple of fields. The state is then keyed by the tuple of
+                their values.
+    """
+    state = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if isinstance(key, tuple):
+                        state[tuple(record.get(k) for k in key)] = record
+                    else:
+                        state[record[key]] = record
+    except IOError:
+        pass
+    return state
+
+
+class BulkProvisioner(object):
+    """
+    Creates many test users with create_ucone_test_user() concurrently.
+    """
+
+    def __init__(self, oci, state_file=None, progress=None, cleanup=True):
+        """
+        :param oci: oci_async.AsyncOciClient
+        :param state_file: Optional path of the state file. When given,
+                           users recorded there as done are skipped.
+        :param progress: Optional callable called with the record of each
+                         user as soon as it is done or has failed
+        :param cleanup: When 'True' a user which failed half way is deleted
+                        with its devices, so that it can be created again
+                        on the next run
+        """
+        self.oci = oci
+        self.state_file = state_file
+        self.progress = progress
+        self.cleanup = cleanup
+        self._lock = threading.Lock()
+
+    def run(self, users, **kwargs):
+        """
+        Creates the users of a manifest.
+
+        :param users: List of create_ucone_test_user() keyword arguments,
+                      see load_manifest()
+        :param kwargs: See OciClient._group_requests()
+        :return: List of the records of this run, in manifest order. Each
+                 record has 'user', 'status' ('done', 'failed' or
+                 'skipped'), and 'user_id', 'phone_number' or 'error'.
+        """
+        state = read_state(self.state_file) if self.state_file else {}
+        pending = []
+        records = {}
+        for user in users:
+            key = ucone_user_part(user['first_name'], user['last_name'])
+            if state.get(key, {}).get('status') == 'done':
+                records[key] = dict(state[key], status='skipped')
+            else:
+                pending.append((key, user))
+        if pending:
+            domain = self.oci.submit(_default_domain, kwargs).get()
+            log.info("[BulkProvisioner] creating %d users" % len(pending))
+            results = [self.oci.submit(self._create, name, args, domain,
+                                       kwargs)
+                       for name, args in pending]
+            for result in results:
+                record = result.get()
+                records[record['user']] = record
+        return [records[ucone_user_part(u['first_name'], u['last_name'])]
+                for u in users]
+
+    def _create(self, oci, key, user, domain, kwargs):
+        record = {'user': key}
+        pool = oci.number_pool(**kwargs)
+        number = None
+        try:
+            number = pool.reserve(
+                lambda: oci.group_get_available_numbers(**kwargs))
+            created = oci.create_ucone_test_user(
+                domain=domain, phone_number=number, **dict(kwargs, **user))
+            record.update(status='done', user_id=created['userId'],
+                          phone_number=number)
+            pool.release(number, used=True)
+        except Exception as e:
+            log.error("[BulkProvisioner] %s failed: %s" % (key, e))
+            record.update(status='failed', error=str(e))
+            if number is not None:
+                # The number goes back to the pool only once it is known
+                # not to be assigned, otherwise it stays out of it
+                free = self._cleanup(oci, '%s@%s' % (key, domain), number,
+                                     kwargs)
+                pool.release(number, used=not free)
+        self._record(record)
+        return record
+
+    def _cleanup(self, oci, user_id, number, kwargs):
+        """
+        Deletes a user which failed half way, when 'cleanup' is set.
+
+        :return: 'True' when the number is known to be free again
+        """
+        try:
+            data = oci.user_get_data(user_id)
+        except OciError as e:
+            # Not created, the number was never assigned
+            return e.code == 4008
+        except Exception as e:
+            log.info("[BulkProvisioner] no cleanup of %s: %s" % (user_id, e))
+            return False
+        # Only a user holding the number handed out by this run is one we
+        # created, never delete a user which existed before
+        if data.get('phoneNumber') != number:
+            return True
+        if not self.cleanup:
+            return False
+        try:
+            oci.delete_user_and_devices(user_id, **kwargs)
+        except Exception as e:
+            log.info("[BulkProvisioner] no cleanup of %s: %s" % (user_id, e))
+            return False
+        return True
+
+    def _record(self, record):
+        with self._lock:
+            if self.state_file:
+                with open(self.state_file, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            if self.progress is not None:
+                self.progress(record)
+
+
+def _default_domain(oci, kwargs):
+    return oci.group_get_assigned_domains(limit=1, **kwargs)[0]
+
+
+class TeardownReport(object):
+
+    def __init__(self, users, failed, commands, elapsed, workflow):
+        self.users = users
+        self.failed = failed
+        self.commands = commands
+        self.elapsed = elapsed
+        self.workflow = workflow
+
+    def __str__(self):
+        lines = ["%d users, %d failed, %d OCI commands in %.3fs" %
+                 (len(self.users), len(self.failed), self.commands,
+                  self.elapsed)]
+        lines.extend("  %s: %s" % kv for kv in sorted(self.failed.items()))
+        return "\n".join(lines)
+
+
+class BulkTeardown(object):
+    """
+    Deletes many users and their devices concurrently.
+    """
+
+    def __init__(self, oci):
+        """
+        :param oci: oci_async.AsyncOciClient
+        """
+        self.oci = oci
+        self.commands = 0
+
+    def resolve(self, users, **kwargs):
+        """
+        Returns the user ids matching given ids and fnmatch patterns, e.g.
+        'test*@lab.example.com'. The group's user list is only fetched when
+        there are patterns; when every pattern starts with a literal
+        prefix, only the users starting with it are fetched.
+
+        :param kwargs: See OciClient._group_requests()
+        """
+        patterns = [u for u in users if any(c in u for c in '*?[')]
+        ret = [u for u in users if u not in patterns]
+        if patterns:
+            group_users, reads = self.oci.submit(_group_user_ids, patterns,
+                                                 kwargs).get()
+            self.commands += reads
+            ret.extend(u for u in group_users
+                       if any(fnmatch.fnmatchcase(u, p) for p in patterns))
+        seen = set()
+        return [u for u in ret if not (u in seen or seen.add(u))]
+
+    def plan(self, user_ids, **kwargs):
+        """
+        Looks up the devices of the users and returns the deletions.
+
+        :return: (Workflow, {user id: error of users which could not be
+                 looked up})
+        """
+        flow = Workflow()
+        failed = {}
+        results = [(u, self.oci.submit(_plan_user, u, kwargs))
+                   for u in user_ids]
+        for user_id, result in results:
+            try:
+                user_flow, reads = result.get()
+            except Exception as e:
+                failed[user_id] = str(e)
+                continue
+            self.commands += reads
+            flow.add('%s: delete user' % user_id, 'user_delete', (user_id,),
+                     after=flow.include(user_flow, '%s: ' % user_id))
+        return flow, failed
+
+    def run(self, users, dry_run=False, **kwargs):
+        """
+        Deletes given users and their devices.
+
+        :param users: User ids and fnmatch patterns of user ids
+        :param dry_run: When 'True' the devices are looked up, but nothing
+                        is deleted
+        :param kwargs: See OciClient._group_requests()
+        :return: TeardownReport
+        """
+        start = time.time()
+        self.commands = 0
+        user_ids = self.resolve(users, **kwargs)
+        flow, failed = self.plan(user_ids, **kwargs)
+        result = flow.run(self.oci, dry_run=dry_run)
+        for step in result.steps:
+            if step.status in ('done', 'failed'):
+                self.commands += 1
+            if step.status in ('failed', 'skipped'):
+                user_id = step.name.split(': ')[0]
+                failed.setdefault(user_id, "%s %s" % (step.name, step.error
+                                                      or step.status))
+        report = TeardownReport(user_ids, failed, self.commands,
+                                time.time() - start, flow)
+        log.info("[BulkTeardown] %s" % report)
+        return report
+
+
+class TagChanges(object):
+    """Custom tag changes of one device."""
+
+    def __init__(self, device):
+        self.device = device
+        self.added = {}       # {tag: value}
+        self.modified = {}    # {tag: (old value, new value)}
+        self.deleted = {}     # {tag: old value}
+
+    def __len__(self):
+        return len(self.added) + len(self.modified) + len(self.deleted)
+
+    def __str__(self):
+        return ", ".join(
+            ["+%s=%s" % kv for kv in sorted(self.added.items())] +
+            ["~%s=%s" % (k, v[1]) for k, v in sorted(self.modified.items())] +
+            ["-%s" % k for k in sorted(self.deleted)])
+
+
+class TagSyncReport(object):
+
+    def __init__(self, devices, changes, failed, commands, elapsed):
+        self.devices = devices
+        self.changes = changes
+        self.failed = failed
+        self.commands = commands
+        self.elapsed = elapsed
+
+    def __str__(self):
+        lines = ["%d devices, %d changed, %d tag changes, %d failed, "
+                 "%d OCI commands in %.3fs" %
+                 (len(self.devices), len(self.changes),
+                  sum(len(c) for c in self.changes.values()),
+                  len(self.failed), self.commands, self.elapsed)]
+        lines.extend("  %s: %s" % (d, c)
+                     for d, c in sorted(self.changes.items()))
+        lines.extend("  %s failed: %s" % kv
+                     for kv in sorted(self.failed.items()))
+        return "\n".join(lines)
+
+
+class BulkTagSync(object):
+    """
+    Synchronises the custom tags of many access devices concurrently.
+    """
+
+    def __init__(self, oci, max_commands=15):
+        """
+        :param oci: oci_async.AsyncOciClient
+        :param max_commands: Tag commands sent per OCI-P document
+        """
+        self.oci = oci
+        self.max_commands = max_commands
+        self.commands = 0
+
+    def resolve(self, tags, **kwargs):
+        """
+        Returns the desired tags per device.
+
+        :param tags: {device name or fnmatch pattern: {tag: value}}, or a
+                     list of (device or pattern, {tag: value}) applied in
+                     order. A value of None deletes the tag. Device names
+                     take precedence over patterns.
+        :param kwargs: See OciClient._group_requests()
+        :return: {device name: {tag: value}}
+        """
+        items = tags.items() if isinstance(tags, dict) else list(tags)
+        patterns = [(d, t) for d, t in items if any(c in d for c in '*?[')]
+        desired = {}
+        if patterns:
+            devices, reads = self.oci.submit(
+                _group_device_names, [p for p, _ in patterns], kwargs).get()
+            self.commands += reads
+            for pattern, pattern_tags in patterns:
+                for device in devices:
+                    if fnmatch.fnmatchcase(device, pattern):
+                        desired.setdefault(device, {}).update(pattern_tags)
+        for device, device_tags in items:
+            if not any(c in device for c in '*?['):
+                desired.setdefault(device, {}).update(device_tags)
+        return desired
+
+    def diff(self, desired, exact=False, **kwargs):
+        """
+        Reads the current tags of the devices concurrently and returns the
+        changes.
+
+        :param desired: {device name: {tag: value}}, see resolve()
+        :param exact: When 'True' tags not in 'desired' are deleted too
+        :return: ({device name: TagChanges} of the devices needing changes,
+                 {device name: error} of the devices which could not be
+                 read)
+        """
+        changes = {}
+        failed = {}
+        results = [(d, self.oci.submit(_device_tags, d, kwargs))
+                   for d in sorted(desired)]
+        for device, result in results:
+            try:
+                current, reads = result.get()
+            except Exception as e:
+                failed[device] = str(e)
+                continue
+            self.commands += reads
+            device_changes = _tag_changes(device, current, desired[device],
+                                          exact)
+            if device_changes:
+                changes[device] = device_changes
+        return changes, failed
+
+    def apply(self, changes, **kwargs):
+        """
+        Sends the tag commands of the changes, 'max_commands' per batch,
+        the batches in parallel. The deletions of a device are sent as one
+        list command.
+
+        :param changes: {device name: TagChanges}, see diff()
+        :return: {device name: error} of the devices whose changes failed
+        """
+        jobs, job = [], []
+        for device in sorted(changes):
+            job.extend(_tag_commands(changes[device]))
+            if len(job) >= self.max_commands:
+                jobs.append(job)
+                job = []
+        if job:
+            jobs.append(job)
+        failed = {}
+        results = [self.oci.submit(_send_tag_commands, commands,
+                                   self.max_commands, kwargs)
+                   for commands in jobs]
+        for job, result in zip(jobs, results):
+            try:
+                errors, sent = result.get()
+            except Exception as e:
+                errors = [(c[1], c[0], str(e)) for c in job]
+                sent = 0
+            self.commands += sent
+            for device, method, error in errors:
+                failed.setdefault(device, "%s: %s" % (method, error))
+        return failed
+
+    def run(self, tags, exact=False, dry_run=False, **kwargs):
+        """
+        Brings the custom tags of the devices to the desired values.
+
+        :param tags: Desired tags per device or pattern, see resolve()
+        :param exact: When 'True' tags not given are deleted
+        :param dry_run: When 'True' the changes are computed, but not sent
+        :param kwargs: See OciClient._group_requests()
+        :return: TagSyncReport
+        """
+        start = time.time()
+        self.commands = 0
+        desired = self.resolve(tags, **kwargs)
+        changes, failed = self.diff(desired, exact, **kwargs)
+        if not dry_run:
+            failed.update(self.apply(changes, **kwargs))
+        report = TagSyncReport(sorted(desired), changes, failed,
+                               self.commands, time.time() - start)
+        log.info("[BulkTagSync] %s" % report)
+        return report
+
+
+class RolloutReport(object):
+
+    def __init__(self, records, group_rebuild, commands, elapsed):
+        self.records = records
+        self.group_rebuild = group_rebuild
+        self.commands = commands
+        self.elapsed = elapsed
+
+    def count(self, status):
+        return len([r for r in self.records if r['status'] == status])
+
+    def __str__(self):
+        lines = ["%d devices, %d uploaded, %d skipped, %d failed, %s, "
+                 "%d OCI commands in %.3fs" %
+                 (len(self.records), self.count('done'),
+                  self.count('skipped'), self.count('failed'),
+                  "group rebuild" if self.group_rebuild
+                  else "device rebuilds", self.commands, self.elapsed)]
+        for r in self.records:
+            if r['status'] == 'skipped':
+                continue
+            lines.append("  %-8s %s upload %.3fs rebuild %s%s" % (
+                r['status'], r['device'], r.get('upload_time', 0),
+                "%.3fs" % r['rebuild_time'] if 'rebuild_time' in r
+                else "(group)" if self.group_rebuild else "-",
+                ": %s" % r['error'] if 'error' in r else ""))
+        return "\n".join(lines)
+
+
+class ConfigRollout(object):
+    """
+    Uploads the config files of many devices concurrently, skipping the
+    files whose content has not changed since they were last uploaded.
+    """
+
+    # Fields identifying a device in the state file
+    STATE_KEY = ('server', 'service_provider', 'group', 'device')
+
+    def __init__(self, oci, state_file=None, group_rebuild_threshold=10,
+                 group_rebuild_share=0.5, file_format='config.xml'):
+        """
+        :param oci: oci_async.AsyncOciClient
+        :param state_file: Optional path of the state file keeping the hash
+                           of the content uploaded to each device. Without
+                           it every file is uploaded.
+        :param group_rebuild_threshold: Minimum number of uploaded devices
+                                        for a group rebuild, see
+                                        'group_rebuild_share'
+        :param group_rebuild_share: When the devices of a run's device
+                                    type are uploaded, and make up at least
+                                    this share of the group's devices of
+                                    that type, their config files are
+                                    rebuilt with one command for all the
+                                    devices of the type instead of one per
+                                    device
+        :param file_format: Device file, e.g. 'config.xml'
+        """
+        self.oci = oci
+        self.state_file = state_file
+        self.group_rebuild_threshold = group_rebuild_threshold
+        self.group_rebuild_share = group_rebuild_share
+        self.file_format = file_format
+        self.commands = 0
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def content_hash(self, content):
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        return hashlib.sha1(
+            '%s\0%s' % (self.file_format, content)).hexdigest()
+
+    def plan(self, configs, force=False, **kwargs):
+        """
+        Returns the records of the devices whose file is unchanged, status
+        'skipped', and the (device, content, hash) to upload.
+
+        :param configs: {device name: file content}
+        :param force: When 'True' nothing is skipped
+        :param kwargs: See OciClient._group_requests()
+        """
+        state = read_state(self.state_file, self.STATE_KEY) \
+            if self.state_file and not force else {}
+        target = self._target(kwargs) if state else ()
+        skipped, pending = [], []
+        for device in sorted(configs):
+            digest = self.content_hash(configs[device])
+            if state.get(target + (device,), {}).get('sha1') == digest:
+                skipped.append({'device': device, 'status': 'skipped',
+                                'sha1': digest})
+            else:
+                pending.append((device, configs[device], digest))
+        return skipped, pending
+
+    def run(self, configs, force=False, device_type=None, **kwargs):
+        """
+        Uploads the changed config files and rebuilds them.
+
+        :param configs: {device name: file content}
+        :param force: When 'True' unchanged files are uploaded too
+        :param device_type: Optional type of all the devices. Without it
+                            the devices are always rebuilt one by one,
+                            see 'group_rebuild_share'.
+        :param kwargs: See OciClient._group_requests()
+        :return: RolloutReport, with one record per device: 'device',
+                 'status' ('done', 'failed' or 'skipped'), 'upload_time'
+                 and 'rebuild_time' in seconds, or 'error'
+        """
+        start = time.time()
+        self.commands = 0
+        skipped, pending = self.plan(configs, force, **kwargs)
+        results = [self.oci.submit(_upload_config, device, content,
+                                   self.file_format, kwargs)
+                   for device, content, _ in pending]
+        uploaded = []
+        for (device, _, digest), result in zip(pending, results):
+            record, sent = result.get()
+            self.commands += sent
+            record['sha1'] = digest
+            uploaded.append(record)
+        done = [r for r in uploaded if r['status'] == 'done']
+        group_rebuild = self._use_group_rebuild(len(done), device_type,
+                                                kwargs)
+        if group_rebuild:
+            self._group_rebuild(done, device_type, kwargs)
+        else:
+            results = [self.oci.submit(_rebuild_config, r['device'], kwargs)
+                       for r in done]
+            for record, result in zip(done, results):
+                rebuild_time, error, sent = result.get()
+                self.commands += sent
+                record['rebuild_time'] = rebuild_time
+                if error:
+                    record.update(status='failed', error=error)
+        recorded = [r for r in uploaded if r['status'] == 'done']
+        if recorded and self.state_file:
+            target = dict(zip(self.STATE_KEY, self._target(kwargs)))
+            for record in recorded:
+                self._record(dict(target, device=record['device'],
+                                  sha1=record['sha1']))
+        by_device = dict((r['device'], r) for r in skipped + uploaded)
+        report = RolloutReport([by_device[d] for d in sorted(by_device)],
+                               group_rebuild, self.commands,
+                               time.time() - start)
+        log.info("[ConfigRollout] %s" % report)
+        return report
+
+    def _target(self, kwargs):
+        """(server, service provider, group) the devices belong to."""
+        key = tuple(sorted(kwargs.items()))
+        if key not in self._targets:
+            self._targets[key] = self.oci.submit(_group_target,
+                                                 kwargs).get()
+        return self._targets[key]
+
+    def _use_group_rebuild(self, uploaded, device_type, kwargs):
+        """
+        A group rebuild rebuilds every device of the type in the group, it
+        only pays off when most of them were uploaded.
+        """
+        if device_type is None or uploaded < self.group_rebuild_threshold:
+            return False
+        total, sent = self.oci.submit(_count_devices, device_type,
+                                      kwargs).get()
+        self.commands += sent
+        return uploaded >= self.group_rebuild_share * total
+
+    def _group_rebuild(self, done, device_type, kwargs):
+        log.info("[ConfigRollout] rebuilding the group's config files for "
+                 "%d devices" % len(done))
+        result = self.oci.submit(_rebuild_group, device_type, kwargs)
+        error, sent = result.get()
+        self.commands += sent
+        if error:
+            for record in done:
+                record.update(status='failed', error="group rebuild: %s" %
+                              error)
+
+    def _record(self, record):
+        with self._lock:
+            with open(self.state_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+def _upload_config(oci, device, content, file_format, kwargs):
+    count = oci.command_count
+    record = {'device': device}
+    start = time.time()
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    try:
+        oci.group_device_modify_config_file(
+            device, 'Custom', base64.b64encode(content), file_format,
+            **kwargs)
+        record['status'] = 'done'
+    except Exception as e:
+        record.update(status='failed', error=str(e))
+    record['upload_time'] = time.time() - start
+    return record, oci.command_count - count
+
+
+def _rebuild_config(oci, device, kwargs):
+    count = oci.command_count
+    start = time.time()
+    error = None
+    try:
+        oci.group_device_rebuild_config_file(device, **kwargs)
+    except Exception as e:
+        error = str(e)
+    return time.time() - start, error, oci.command_count - count
+
+
+def _group_target(oci, kwargs):
+    return (oci.host, kwargs.get('service_provider_id', oci.service_provider),
+            kwargs.get('group_id', oci.group))
+
+
+def _count_devices(oci, device_type, kwargs):
+    count = oci.command_count
+    total = sum(1 for d in oci.iter_group_devices(prefetch=False, **kwargs)
+                if d['Device Type'] == device_type)
+    return total, oci.command_count - count
+
+
+def _rebuild_group(oci, device_type, kwargs):
+    count = oci.command_count
+    error = None
+    try:
+        oci.group_rebuild_config_files(device_type, **kwargs)
+    except Exception as e:
+        error = str(e)
+    return error, oci.command_count - count
+
+
+def _tag_changes(device, current, desired, exact):
+    changes = TagChanges(device)
+    for tag, value in desired.iteritems():
+        if value is None:
+            if tag in current:
+                changes.deleted[tag] = current[tag]
+            continue
+        value = value_to_str(value)
+        if tag not in current:
+            changes.added[tag] = value
+        elif (current[tag] or '') != value:
+            changes.modified[tag] = (current[tag], value)
+    if exact:
+        for tag in current:
+            if tag not in desired:
+                changes.deleted[tag] = current[tag]
+    return changes
+
+
+def _tag_commands(changes):
+    """Returns the (method, device, args) of the commands of TagChanges."""
+    device = changes.device
+    return ([('group_device_delete_custom_tag', device, (tag,))
+             for tag in sorted(changes.deleted)] +
+            [('group_device_modify_custom_tag', device, (tag, value[1]))
+             for tag, value in sorted(changes.modified.items())] +
+            [('group_device_add_custom_tag', device, (tag, value))
+             for tag, value in sorted(changes.added.items())])
+
+
+def _send_tag_commands(oci, commands, max_commands, kwargs):
+    count = oci.command_count
+    with oci.batch(max_commands=max_commands):
+        results = [(device, method,
+                    getattr(oci, method)(device, *args, **kwargs))
+                   for method, device, args in commands]
+    errors = [(device, method, result.error)
+              for device, method, result in results if result.error]
+    return errors, oci.command_count - count
+
+
+def _device_tags(oci, device, kwargs):
+    count = oci.command_count
+    tags = oci.group_device_get_custom_tags(device, **kwargs)
+    return tags, oci.command_count - count
+
+
+def _group_device_names(oci, patterns, kwargs):
+    count = oci.command_count
+    devices = []
+    for search in _prefix_searches('deviceName', patterns):
+        devices.extend(d['Device Name'] for d in oci.iter_group_devices(
+            prefetch=False, search=search, **kwargs))
+    return devices, oci.command_count - count
+
+
+def _pattern_prefix(pattern):
+    """Returns the literal part of an fnmatch pattern before any wildcard."""
+    for i, c in enumerate(pattern):
+        if c in '*?[':
+            return pattern[:i]
+    return pattern
+
+
+def _prefix_searches(field, patterns):
+    """
+    Returns the searches fetching the candidates of fnmatch patterns: one
+    per literal prefix, or a single unfiltered one.
+    """
+    prefixes = set(_pattern_prefix(p) for p in patterns)
+    if '' in prefixes:
+        return [None]
+    return [[starts_with(field, p, case_insensitive=False)]
+            for p in sorted(prefixes)]
+
+
+def _group_user_ids(oci, patterns, kwargs):
+    count = oci.command_count
+    users = []
+    for search in _prefix_searches('userId', patterns):
+        users.extend(oci.group_get_user_table(
+            ['User Id'], search=search, **kwargs).column('User Id'))
+    return users, oci.command_count - count
+
+
+def _plan_user(oci, user_id, kwargs):
+    count = oci.command_count
+    flow = oci.user_delete_all_devices_workflow(user_id, **kwargs)
+    return flow, oci.command_count - count
@@ -0,0 +1,208 @@
+"""
+Read-through cache of OCI-P Get responses.
+
+Many reads are repeated back to back: user_get_data() and
+user_get_primary_device() both send UserGetRequest21 for the same user, the
+group's domains are read for every user creation, and OCIP pages read the
+same tables on every render. An OciClient given an OciCache answers
+repeated *Get* commands from the cache:
+
+    oci = OciClient(..., cache=OciCache(max_entries=1000, ttl=30))
+
+Entries are keyed by the command xml, bounded in number (least recently
+used entries are evicted first) and in age. Every other command, except
+the login commands, invalidates the entries about the same userId or
+deviceName, and the lists (entries not about one user or device, e.g.
+the group's users or available numbers), as it may have changed them.
+Deleting or modifying an access device also drops the entries about
+users, whose endpoints and SCA tables may name the device. Domain lists
+only change with domain commands and are kept. Batched commands
+invalidate too.
+
+Counters: hits, misses, invalidations and evictions, see stats().
+"""
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+_COMMAND = re.compile(r'<command\b.*?</command>|<command\b[^>]*/>',
+                      re.DOTALL)
+_COMMAND_TYPE = re.compile(r'xsi:type="([^"]+)"')
+_READ = re.compile(r'Get[A-Z]')
+_ENTITY = re.compile(r'<(userId|deviceName)>([^<]*)</\1>')
+_NOT_WRITES = ('AuthenticationRequest', 'LoginRequest14sp4', 'LogoutRequest')
+# Device writes showing in the responses about the users of the device
+_USER_DEVICE_WRITES = re.compile(r'GroupAccessDevice(Delete|Modify)Request')
+# Lists only commands of the same prefix change
+_STABLE_LISTS = ('GroupDomain', 'ServiceProviderDomain', 'SystemDomain')
+
+
+def _stable_prefix(cmd):
+    for prefix in _STABLE_LISTS:
+        if cmd.startswith(prefix):
+            return prefix
+    return None
+
+
+def _is_read(cmd):
+    return _READ.search(cmd) is not None
+
+
+def _commands(document):
+    """Yields (command type, command xml, entities) of a request document."""
+    for m in _COMMAND.finditer(document):
+        command = m.group(0)
+        cmd = _COMMAND_TYPE.search(command)
+        yield (cmd.group(1) if cmd else None, command,
+               frozenset(_ENTITY.findall(command)))
+
+
+class _Entry(object):
+
+    __slots__ = ('response', 'expires', 'entities')
+
+    def __init__(self, response, expires, entities):
+        self.response = response
+        self.expires = expires
+        self.entities = entities
+
+
+class OciCache(object):
+    """LRU and TTL bounded cache of OCI Get responses."""
+
+    def __init__(self, max_entries=1000, ttl=30):
+        """
+        :param max_entries: Number of responses kept
+        :param ttl: Seconds a response is kept. Changes made by others than
+                    the clients using the cache show after this long at the
+                    latest.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._by_entity = {}    # {entity: set of keys}
+        self._lists = {}        # {key: command type} of the lists
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns the counters and the current number of entries."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions, 'entries': len(self._entries)}
+
+    def send(self, scope, document, send):
+        """
+        Answers a single command request document from the cache, or sends
+        it with send(document).
+
+        :param scope: Whom the responses are for, e.g. (server, admin),
+                      part of the key when clients share a cache
+        :param document: OCI request document
+        :param send: Callable sending the document, returning the response
+        :return: Response
+        """
+        commands = list(_commands(document))
+        cmd, command, entities = commands[0] if len(commands) == 1 else \
+            (None, None, None)
+        if cmd is None or not _is_read(cmd):
+            try:
+                return send(document)
+            finally:
+                self.invalidate_document(document)
+        key = (scope, command)
+        response = self.get(key)
+        if response is None:
+            response = send(document)
+            if response:
+                self.put(key, response, cmd, entities)
+        return response
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Most recently used last
+            del self._entries[key]
+            self._entries[key] = entry
+            return entry.response
+
+    def put(self, key, response, cmd, entities):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(response, time.time() + self.ttl,
+                                        entities)
+            for entity in entities:
+                self._by_entity.setdefault(entity, set()).add(key)
+            if not entities:
+                self._lists[key] = cmd
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, entities, cmd=''):
+        """
+        Drops the entries about any of the entities, and the lists a
+        command of type 'cmd' may change.
+
+        :param entities: (element name, value) tuples, e.g.
+                         ('userId', 'alice@example.com')
+        """
+        prefix = _stable_prefix(cmd)
+        users = _USER_DEVICE_WRITES.match(cmd) is not None
+        with self._lock:
+            keys = set(k for k, list_cmd in self._lists.iteritems()
+                       if _stable_prefix(list_cmd) in (None, prefix) or
+                       prefix is None and not entities)
+            for entity in entities:
+                keys.update(self._by_entity.get(entity, ()))
+            if users:
+                for entity, entity_keys in self._by_entity.iteritems():
+                    if entity[0] == 'userId':
+                        keys.update(entity_keys)
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if keys:
+            log.debug("[OciCache] %d entries invalidated" % len(keys))
+
+    def invalidate_document(self, document):
+        """Invalidates for every write command of a request document."""
+        for cmd, _, entities in _commands(document):
+            if cmd is None or not _is_read(cmd) and cmd not in _NOT_WRITES:
+                self.invalidate(entities, cmd or '')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_entity = {}
+            self._lists = {}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for entity in entry.entities:
+            keys = self._by_entity.get(entity)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_entity[entity]
+        self._lists.pop(key, None)
@@ -0,0 +1,223 @@
+"""
+Coalescing of single item OCI-P list commands.
+
+Some OCI-P commands take a list: UserServiceAssignListRequest assigns
+many services, GroupDnActivateListRequest activates many numbers, and
+GroupAccessDeviceCustomTagDeleteListRequest deletes many tags of a device.
+Callers such as create_ucone_test_user() send them one item at a time.
+Commands of the same type and target (user, group or device) are merged
+into one request:
+
+  - inside OciClient.batch(), into the queued command of the same target
+    (see OciBatch.add()), and
+  - between callers of clients given a shared OciCoalescer, when issued
+    within its window:
+
+        oci = OciClient(..., coalescer=OciCoalescer(window=0.01))
+
+Every caller still gets its own outcome. BroadWorks executes a list
+command as a whole, so when a merged command fails the items of every
+caller are sent again one caller at a time, and only the callers whose
+items fail get an error.
+"""
+import time
+import threading
+import logging
+from xml.sax.saxutils import escape
+
+from oci_templates import render_command
+from oci_response import OciError
+
+log = logging.getLogger(__name__)
+
+# {command type: list item elements}
+COALESCED = {
+    'UserServiceAssignListRequest': ('serviceName', 'servicePackName'),
+    'UserServiceUnassignListRequest': ('serviceName', 'servicePackName'),
+    'GroupDnActivateListRequest': ('phoneNumber',),
+    'GroupAccessDeviceCustomTagDeleteListRequest': ('tagName',),
+}
+
+
+def _name(elem):
+    return [k for k in elem if k != 'parent'][0]
+
+
+class ListCommand(object):
+    """
+    One list command split into its target elements (e.g. userId) and its
+    list items (e.g. serviceName).
+    """
+
+    def __init__(self, cmd, target, items):
+        self.cmd = cmd
+        self.target = target
+        self.items = items
+        self.key = (cmd, tuple(tuple(sorted(e.items())) for e in target))
+        # The user, group or device the command is about
+        self.entity = target[-1][_name(target[-1])] if target else None
+
+    @property
+    def xml(self):
+        """The command alone, as "command" node xml."""
+        return render_command(self.cmd, self.target + self.items)
+
+    def names(self, xml):
+        """Tells whether a command xml names the target of this command."""
+        return self.entity is not None and \
+            '>%s<' % escape(self.entity) in xml
+
+
+def list_command(cmd, cmd_elements):
+    """
+    Returns the ListCommand of a command which can be coalesced, otherwise
+    None.
+
+    :param cmd_elements: Element dicts, see OciClient._oci_xml()
+    """
+    names = COALESCED.get(cmd)
+    if names is None:
+        return None
+    target, items = [], []
+    for elem in cmd_elements:
+        if elem.get('parent') in names:
+            # Structured items are not merged
+            return None
+        (items if _name(elem) in names else target).append(elem)
+    return ListCommand(cmd, target, items)
+
+
+class Coalesced(object):
+    """
+    List commands of one target merged into one command.
+
+    :ivar parts: (ListCommand, outcome) of every caller
+    """
+
+    def __init__(self, command, outcome):
+        self.cmd = command.cmd
+        self.key = command.key
+        self.parts = [(command, outcome)]
+        self._xml = None
+
+    def add(self, command, outcome):
+        assert command.key == self.key
+        self.parts.append((command, outcome))
+        self._xml = None
+
+    @property
+    def xml(self):
+        """The merged command as "command" node xml. Items are sent once."""
+        if self._xml is None:
+            self._xml = self._render()
+        return self._xml
+
+    def _render(self):
+        first = self.parts[0][0]
+        items, seen = [], set()
+        for command, _ in self.parts:
+            for item in command.items:
+                key = tuple(sorted(item.items()))
+                if key not in seen:
+                    seen.add(key)
+                    items.append(item)
+        return render_command(self.cmd, first.target + items)
+
+
+class _Outcome(object):
+
+    __slots__ = ('response', 'error', 'done')
+
+    def __init__(self):
+        self.response = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class OciCoalescer(object):
+    """
+    Merges the list commands which clients of one admin send to the same
+    target within 'window' seconds.
+    """
+
+    def __init__(self, window=0.01, max_items=100):
+        """
+        :param window: Seconds the first caller waits for others before
+                       sending. Every list command is delayed this long.
+        :param max_items: Callers merged into one command at most
+        """
+        self.window = window
+        self.max_items = max_items
+        self.commands = 0
+        self.requests = 0
+        self._open = {}     # {(scope, key): Coalesced} still taking callers
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Returns the number of list commands and of requests sent."""
+        return {'commands': self.commands, 'requests': self.requests}
+
+    def send(self, scope, command, send):
+        """
+        Sends a list command merged with the ones other callers send to the
+        same target within the window.
+
+        :param scope: Whom the commands are sent as, e.g. (server, admin)
+        :param command: ListCommand
+        :param send: Callable sending a "command" node xml, returning the
+                     response or raising oci_response.OciError
+        :return: Response of the merged command
+        :raise oci_response.OciError: When the items of this caller failed
+        """
+        key = (scope, command.key)
+        outcome = _Outcome()
+        with self._lock:
+            self.commands += 1
+            merged = self._open.get(key)
+            leader = merged is None
+            if leader:
+                merged = self._open[key] = Coalesced(command, outcome)
+            else:
+                merged.add(command, outcome)
+            if len(merged.parts) >= self.max_items:
+                del self._open[key]
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                if self._open.get(key) is merged:
+                    del self._open[key]
+                self.requests += 1
+            self._send(merged, send)
+        else:
+            outcome.done.wait()
+        if outcome.error is not None:
+            raise outcome.error
+        return outcome.response
+
+    def _send(self, merged, send):
+        parts = merged.parts
+        if len(parts) > 1:
+            log.debug("[OciCoalescer] %d %s merged" % (len(parts),
+                                                       merged.cmd))
+        try:
+            try:
+                response = send(merged.xml)
+                for _, outcome in parts:
+                    outcome.response = response
+            except OciError as e:
+                if len(parts) == 1:
+                    parts[0][1].error = e
+                    return
+                # Find out whose items failed
+                for command, outcome in parts:
+                    try:
+                        outcome.response = send(command.xml)
+                    except OciError as e:
+                        outcome.error = e
+        except Exception as e:
+            for _, outcome in parts:
+                if outcome.response is None and outcome.error is None:
+                    outcome.error = e
+        finally:
+            for _, outcome in parts:
+                outcome.done.set()
@@ -0,0 +1,184 @@
+"""
+Reservable pools of a group's available phone numbers.
+
+Without a pool every user creation downloads the group's whole available
+DN list (GroupDnGetAvailableListRequest) and takes the first number, and
+two parallel creations take the same one. A NumberPool fetches the list
+once and hands each caller its own number:
+
+    with oci.reserve_number() as dn:
+        oci.user_add(..., phone_number=dn)
+
+The number is released when the block fails, and the list is fetched
+again when the pool runs empty, low or old. Numbers are kept as sorted
+integer arrays per prefix and count of trailing digits, e.g. "+1-" and
+10 digits for "+1-2145550100", so groups with tens of thousands of DNs
+take a few hundred kilobytes.
+"""
+import re
+import time
+import bisect
+import threading
+import logging
+from array import array
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r'^(.*?)(\d{1,18})$')
+
+
+class NumberPool(object):
+    """Available phone numbers of one group."""
+
+    def __init__(self, low_water=10, refresh_interval=30, max_age=600):
+        """
+        :param low_water: The list is fetched again when fewer numbers
+                          than this are left, at most every
+                          'refresh_interval' seconds
+        :param refresh_interval: See 'low_water'
+        :param max_age: Seconds after which the list is fetched again,
+                        numbers may have been taken by others meanwhile
+        """
+        self.low_water = low_water
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.reserved = set()
+        self.used = set()
+        self.fetched = None
+        self._series = {}   # {(prefix, digits): array of -number, sorted}
+        self._keys = []     # keys of _series, sorted
+        self._other = []    # numbers not ending with digits
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(a) for a in self._series.values()) + len(self._other)
+
+    def _add(self, number):
+        m = _NUMBER.match(number)
+        if m is None:
+            self._other.append(number)
+            return
+        key = (m.group(1), len(m.group(2)))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = array('l')
+            bisect.insort(self._keys, key)
+        value = -int(m.group(2))
+        i = bisect.bisect_left(series, value)
+        if i == len(series) or series[i] != value:
+            series.insert(i, value)
+
+    def _pop(self):
+        """Takes the lowest number of the first series."""
+        for prefix, digits in self._keys:
+            series = self._series[prefix, digits]
+            if series:
+                return "%s%0*d" % (prefix, digits, -series.pop())
+        if self._other:
+            return self._other.pop(0)
+        return None
+
+    def refresh(self, fetch):
+        """
+        Replaces the pool content with a freshly fetched list, keeping the
+        current reservations. BroadWorks can not list the changes since a
+        previous request, so the whole list is fetched again.
+
+        :param fetch: Callable returning the available numbers, e.g.
+                      OciClient.group_get_available_numbers
+        """
+        with self._lock:
+            self._refresh(fetch)
+
+    def _refresh(self, fetch):
+        numbers = fetch()
+        # A number used moments ago may still be listed
+        self.used &= set(numbers)
+        # Sorted once per series, inserting one by one is quadratic
+        series = {}
+        self._other = []
+        for number in numbers:
+            if number in self.reserved or number in self.used:
+                continue
+            m = _NUMBER.match(number)
+            if m is None:
+                self._other.append(number)
+            else:
+                series.setdefault((m.group(1), len(m.group(2))),
+                                  set()).add(-int(m.group(2)))
+        self._series = dict((key, array('l', sorted(values)))
+                            for key, values in series.iteritems())
+        self._keys = sorted(self._series)
+        self.fetched = time.time()
+        log.debug("[NumberPool] %d numbers available, %d reserved" %
+                  (len(self), len(self.reserved)))
+
+    def reserve(self, fetch):
+        """
+        Takes a number out of the pool. It must be given back with
+        release() unless it got used.
+
+        :param fetch: See refresh()
+        :return: Phone number
+        """
+        with self._lock:
+            age = time.time() - (self.fetched or 0)
+            if not len(self) or age > self.max_age or \
+                    (len(self) < self.low_water and
+                     age > self.refresh_interval):
+                self._refresh(fetch)
+            number = self._pop()
+            assert number is not None, "No available phone numbers left"
+            self.reserved.add(number)
+            return number
+
+    def release(self, number, used=False):
+        """
+        Ends a reservation.
+
+        :param used: When 'False' the number goes back to the pool
+        """
+        with self._lock:
+            self.reserved.discard(number)
+            if used:
+                self.used.add(number)
+            else:
+                self._add(number)
+
+    @contextmanager
+    def reservation(self, fetch):
+        """
+        reserve() as a context manager: the number counts as used when the
+        block succeeds and is released when it fails.
+        """
+        number = self.reserve(fetch)
+        try:
+            yield number
+        except:
+            self.release(number)
+            raise
+        self.release(number, used=True)
+
+
+class NumberPools(object):
+    """NumberPool per (server, service provider, group)."""
+
+    def __init__(self, **pool_kwargs):
+        self.pool_kwargs = pool_kwargs
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = NumberPool(**self.pool_kwargs)
+            return pool
+
+    def clear(self):
+        with self._lock:
+            self._pools = {}
+
+
+number_pools = NumberPools()
@@ -0,0 +1,103 @@
+"""
+Paged reads of large OCI-P lists.
+
+BroadWorks' PagedSortedList commands return one page of a list per
+request (responsePagingControl: responseStartIndex, responsePageSize).
+iter_pages() walks such a list page by page and, with prefetch, has the
+next page fetched by a helper thread while the caller processes the
+current one:
+
+    for page in iter_pages(fetch, 500):
+        for row in page.dicts():
+            ...
+
+At most the page being processed and the page fetched ahead are in
+memory, so lists of any length are walked in bounded memory.
+"""
+import Queue
+import threading
+import logging
+
+from outbound import priority, current_priority
+
+log = logging.getLogger(__name__)
+
+# Largest responsePageSize BroadWorks accepts
+MAX_PAGE_SIZE = 1000
+
+_DONE = object()
+
+
+def iter_pages(fetch, page_size=500, prefetch=True):
+    """
+    Yields the pages of a list until a page is not full.
+
+    :param fetch: Callable fetch(start_index, page_size) returning a page
+                  (e.g. an oci_tables.OciTable) with len(); start_index
+                  is 1 based
+    :param page_size: Rows per page, at most MAX_PAGE_SIZE
+    :param prefetch: When 'True' the next page is fetched by a helper
+                     thread while the current one is processed. Its errors
+                     are raised in the caller.
+    """
+    assert 0 < page_size <= MAX_PAGE_SIZE, \
+        "Page size must be 1..%d" % MAX_PAGE_SIZE
+    if not prefetch:
+        start = 1
+        while True:
+            page = fetch(start, page_size)
+            yield page
+            if len(page) < page_size:
+                return
+            start += page_size
+    pages = Queue.Queue(maxsize=1)
+    stop = threading.Event()
+    level = current_priority()
+
+    def _fetch_all():
+        try:
+            # Same priority as the caller, see outbound
+            with priority(level):
+                _fetch_pages()
+        except Exception as e:
+            _put(pages, stop, (None, e))
+        _put(pages, stop, (_DONE, None))
+
+    def _fetch_pages():
+        start = 1
+        while not stop.is_set():
+            page = fetch(start, page_size)
+            _put(pages, stop, (page, None))
+            if len(page) < page_size:
+                break
+            start += page_size
+
+    fetcher = threading.Thread(target=_fetch_all, name="OciPagePrefetch")
+    fetcher.daemon = True
+    fetcher.start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is _DONE:
+                return
+            yield page
+    finally:
+        # The caller may stop early: let the fetcher finish its page
+        stop.set()
+        while fetcher.is_alive():
+            try:
+                pages.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+
+
+def _put(pages, stop, item):
+    """Queues an item unless the consumer has gone."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return
+        except Queue.Full:
+            pass
@@ -0,0 +1,203 @@
+"""
+Pool of authenticated, long-lived OCI-P sessions.
+
+Creating an OciClient costs a WSDL download plus the two phase
+AuthenticationRequest / LoginRequest14sp4 login, so web requests borrow
+already logged in clients from the pool instead.
+"""
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class _PoolEntry(object):
+
+    def __init__(self, password):
+        self.password = password
+        self.idle = []      # [(client, last_used), ...], most recent last
+        self.busy = 0
+
+
+class OciSessionPool(object):
+    """
+    Hands out authenticated OciClient instances keyed by (server, admin
+    username).
+
+    - At most 'max_sessions' clients exist per key. When all of them are
+      borrowed, acquire() waits up to 'acquire_timeout' seconds.
+    - Clients idle for more than 'max_idle' seconds are logged out
+      (LogoutRequest) and dropped.
+    - Expired sessions are re-logged in by OciClient itself, see
+      OciClient.relogin().
+    """
+
+    def __init__(self, factory, max_sessions=4, max_idle=300,
+                 acquire_timeout=30, reap_interval=60):
+        """
+        :param factory: Callable creating a logged in client from the keyword
+                        arguments given to acquire(), e.g.
+                        tools.create_oci_tool
+        :param max_sessions: Maximum number of sessions per admin user
+        :param max_idle: Seconds after which an idle session is evicted
+        :param acquire_timeout: Seconds to wait for a free session
+        :param reap_interval: Seconds between background idle sweeps. If
+                              None, idle sessions are only swept when the
+                              pool is used.
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.acquire_timeout = acquire_timeout
+        self.reap_interval = reap_interval
+        self._entries = {}
+        self._lock = threading.Condition()
+        self._reaper = None
+
+    def configure(self, **kwargs):
+        for k in ['max_sessions', 'max_idle', 'acquire_timeout',
+                  'reap_interval']:
+            if kwargs.get(k) is not None:
+                setattr(self, k, kwargs[k])
+
+    @staticmethod
+    def _key(kwargs):
+        return (kwargs.get("url", kwargs.get("server")),
+                kwargs.get("username"))
+
+    def acquire(self, **kwargs):
+        """
+        Borrow a logged in client. Keyword arguments are the ones of
+        tools.create_oci_tool(). The client must be given back with
+        release().
+        """
+        key = self._key(kwargs)
+        deadline = time.time() + self.acquire_timeout
+        evicted = []
+        with self._lock:
+            self._start_reaper()
+            evicted.extend(self._sweep())
+            entry = self._entries.get(key)
+            if entry is not None and entry.password != kwargs.get("password"):
+                # Admin password changed, sessions of the old one are useless
+                evicted.extend(c for c, _ in entry.idle)
+                entry.idle = []
+                entry.password = kwargs.get("password")
+            if entry is None:
+                entry = self._entries[key] = _PoolEntry(kwargs.get("password"))
+            while not entry.idle and entry.busy >= self.max_sessions:
+                remaining = deadline - time.time()
+                assert remaining > 0, \
+                    "All %d OCI sessions of '%s' are in use" % \
+                    (self.max_sessions, key[1])
+                self._lock.wait(remaining)
+            client = entry.idle.pop()[0] if entry.idle else None
+            entry.busy += 1
+        self._logout(evicted)
+        if client is not None:
+            return client
+        try:
+            client = self.factory(**kwargs)
+        except:
+            with self._lock:
+                entry.busy -= 1
+                self._lock.notify()
+            raise
+        client._pool_key = key
+        log.debug("[OciSessionPool] new session for %s", key)
+        return client
+
+    def release(self, client, discard=False):
+        """
+        Give a borrowed client back to the pool.
+
+        :param discard: When 'True' the client is logged out and dropped,
+                        e.g. after a transport failure.
+        """
+        with self._lock:
+            entry = self._entries.get(client._pool_key)
+            if entry is not None:
+                entry.busy -= 1
+                if not discard and entry.password == client.password:
+                    entry.idle.append((client, time.time()))
+                    client = None
+            self._lock.notify()
+        if client is not None:
+            self._logout([client])
+
+    @contextmanager
+    def session(self, **kwargs):
+        """
+        Context manager around acquire() / release(). Clients are kept
+        after OCI error responses (AssertionError) but dropped after any
+        other failure.
+        """
+        client = self.acquire(**kwargs)
+        discard = False
+        try:
+            yield client
+        except AssertionError:
+            raise
+        except:
+            discard = True
+            raise
+        finally:
+            self.release(client, discard)
+
+    def evict_idle(self):
+        """Log out and drop sessions idle for more than 'max_idle'."""
+        with self._lock:
+            evicted = self._sweep()
+        self._logout(evicted)
+        return len(evicted)
+
+    def close(self):
+        """Log out all idle sessions."""
+        with self._lock:
+            evicted = []
+            for entry in self._entries.values():
+                evicted.extend(c for c, _ in entry.idle)
+                entry.idle = []
+        self._logout(evicted)
+
+    def stats(self):
+        with self._lock:
+            return dict((k, {"idle": len(e.idle), "busy": e.busy})
+                        for k, e in self._entries.iteritems())
+
+    def _sweep(self):
+        limit = time.time() - self.max_idle
+        evicted = []
+        for key, entry in self._entries.items():
+            evicted.extend(c for c, t in entry.idle if t < limit)
+            entry.idle = [(c, t) for c, t in entry.idle if t >= limit]
+            if not entry.idle and not entry.busy:
+                del self._entries[key]
+        return evicted
+
+    def _logout(self, clients):
+        for client in clients:
+            try:
+                client.logout_request()
+            except Exception as e:
+                log.info("[OciSessionPool] logout failed: %s" % e)
+            # Native OCI-P transports hold a connection open
+            close = getattr(getattr(client, 'transport', None), 'close', None)
+            if close is not None:
+                close()
+
+    def _start_reaper(self):
+        if self._reaper is not None or not self.reap_interval:
+            return
+
+        def _reap():
+            while True:
+                time.sleep(self.reap_interval)
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=_reap,
+                                        name="OciSessionPoolReaper")
+        self._reaper.daemon = True
+        self._reaper.start()
@@ -0,0 +1,112 @@
+"""
+Parsed OCI-P responses.
+
+OciClient._send() returns the response document as an OciResponse: the
+string the transport returned (str or unicode), which also carries the
+parsed tree, so callers use response.tree instead of parsing the string
+again. Callers which expect a string keep working unchanged.
+
+Responses up to PARSE_LIMIT characters are parsed once when they are
+received. Larger ones, table responses of big enterprises, are only
+checked for errors up to their first command; their tree is parsed when
+it is first used, and the oci_tables readers stream them instead.
+
+Error responses raise OciError, an AssertionError carrying the summary,
+detail and error number.
+"""
+import re
+import xml.etree.ElementTree as Etree
+
+from oci_tables import response_error
+
+PARSE_LIMIT = 1 << 16
+
+_ERROR_CODE = re.compile(r'\[Error (\d+)\]')
+
+
+class OciError(AssertionError):
+    """
+    Error response of an OCI-P command.
+
+    :ivar summary: Error summary, e.g. "[Error 4008] User not found"
+    :ivar detail: Error detail or None
+    :ivar code: BroadWorks error number, e.g. 4008, or None
+    :ivar command: The OCI request xml
+    :ivar response: The OciResponse
+    """
+
+    def __init__(self, summary, detail=None, command=None, response=None):
+        AssertionError.__init__(self, summary)
+        self.summary = summary
+        self.detail = detail
+        m = _ERROR_CODE.search(summary or '')
+        self.code = int(m.group(1)) if m else None
+        self.command = command
+        self.response = response
+
+    def __str__(self):
+        return "Error response received\n" \
+               "OCI Command: \n%s\n" \
+               "OCI Response:\n%s\n" % (self.command, self.response)
+
+
+class OciResponse(object):
+    """
+    Parsed OCI response document, see make_response(). Base of the str and
+    unicode response types.
+    """
+
+    _tree = None
+    _error = False      # not looked up yet
+
+    @property
+    def parsed(self):
+        """The root element when already parsed, otherwise None."""
+        return self._tree
+
+    @property
+    def tree(self):
+        """The root element of the response document."""
+        if self._tree is None:
+            self._tree = Etree.fromstring(self)
+        return self._tree
+
+    @property
+    def command(self):
+        """The first response command element."""
+        return self.tree.find('.//command')
+
+    @property
+    def error(self):
+        """OciError of an Error response, otherwise None."""
+        if self._error is False:
+            self._error = None
+            if self._tree is not None or response_error(self) is not None:
+                command = self.command
+                if command is not None and command.get('type') == 'Error':
+                    self._error = OciError(command.findtext('summary'),
+                                           command.findtext('detail'),
+                                           response=self)
+        return self._error
+
+
+class _StrResponse(OciResponse, str):
+    pass
+
+
+class _UnicodeResponse(OciResponse, unicode):
+    pass
+
+
+def make_response(text):
+    """
+    Wraps a response document into an OciResponse. Documents up to
+    PARSE_LIMIT characters are parsed right away.
+    """
+    if isinstance(text, OciResponse) or not text:
+        return text
+    cls = _UnicodeResponse if isinstance(text, unicode) else _StrResponse
+    response = cls(text)
+    if len(text) <= PARSE_LIMIT:
+        response._tree = Etree.fromstring(text)
+    return response
@@ -0,0 +1,127 @@
+"""
+OCI-P search criteria for the list helpers of OciClient.
+
+List requests such as UserGetListInGroupRequest take a responseSizeLimit
+and searchCriteria* elements, so that BroadWorks returns only the rows
+asked for:
+
+    oci.group_get_user_list(limit=10,
+                            search=[starts_with('userId', 'test')])
+
+Criteria name a field of the list (see USER_FIELDS, DEVICE_FIELDS); all
+criteria must match. Lists whose request takes no criteria (available
+numbers, domains) apply them while the response is read, and stop
+reading at the limit.
+"""
+from utils import value_to_str
+
+_MODES = {'starts with': 'Starts With', 'contains': 'Contains',
+          'equals': 'Equal To'}
+
+# (field, searchCriteria element), in the order of the OCI-P schema
+USER_FIELDS = [('lastName', 'searchCriteriaUserLastName'),
+               ('firstName', 'searchCriteriaUserFirstName'),
+               ('phoneNumber', 'searchCriteriaDn'),
+               ('emailAddress', 'searchCriteriaEmailAddress'),
+               ('userId', 'searchCriteriaUserId'),
+               ('extension', 'searchCriteriaExtension')]
+DEVICE_FIELDS = [('deviceName', 'searchCriteriaDeviceName'),
+                 ('macAddress', 'searchCriteriaDeviceMACAddress'),
+                 ('netAddress', 'searchCriteriaDeviceNetAddress')]
+
+
+class SearchCriteria(object):
+    """One OCI-P search criteria: field, mode, value."""
+
+    def __init__(self, field, value, mode='starts with',
+                 case_insensitive=True):
+        """
+        :param field: List field, e.g. 'userId'
+        :param mode: 'starts with', 'contains' or 'equals'
+        """
+        assert mode in _MODES, "Unknown search mode '%s'" % mode
+        self.field = field
+        self.value = value
+        self.mode = mode
+        self.case_insensitive = case_insensitive
+
+    def __repr__(self):
+        return "%s %s %r" % (self.field, self.mode, self.value)
+
+    def matches(self, value):
+        """Applies the criteria to a value, for lists without criteria."""
+        if value is None:
+            return False
+        expected = self.value
+        if self.case_insensitive:
+            value, expected = value.lower(), expected.lower()
+        if self.mode == 'starts with':
+            return value.startswith(expected)
+        if self.mode == 'contains':
+            return expected in value
+        return value == expected
+
+    def elements(self, name):
+        """Returns the request element dicts of a searchCriteria* element."""
+        return [{name: None},
+                {'mode': _MODES[self.mode], 'parent': name},
+                {'value': self.value, 'parent': name},
+                {'isCaseInsensitive': value_to_str(self.case_insensitive),
+                 'parent': name}]
+
+
+def starts_with(field, value, case_insensitive=True):
+    return SearchCriteria(field, value, 'starts with', case_insensitive)
+
+
+def contains(field, value, case_insensitive=True):
+    return SearchCriteria(field, value, 'contains', case_insensitive)
+
+
+def equals(field, value, case_insensitive=True):
+    return SearchCriteria(field, value, 'equals', case_insensitive)
+
+
+def search_elements(fields, search=None, limit=None):
+    """
+    Returns the responseSizeLimit and searchCriteria* element dicts of a
+    list request.
+
+    :param fields: USER_FIELDS or DEVICE_FIELDS
+    :param search: Optional list of SearchCriteria
+    :param limit: Optional maximum number of rows
+    """
+    elements = []
+    if limit is not None:
+        elements.append({'responseSizeLimit': str(limit)})
+    return elements + criteria_elements(fields, search)
+
+
+def criteria_elements(fields, search=None):
+    """Returns the searchCriteria* element dicts, in schema order."""
+    names = dict(fields)
+    order = [f for f, _ in fields]
+    for criteria in search or []:
+        assert criteria.field in names, \
+            "Cannot search by '%s', only by %s" % (criteria.field, order)
+    elements = []
+    for criteria in sorted(search or [], key=lambda c: order.index(c.field)):
+        elements.extend(criteria.elements(names[criteria.field]))
+    return elements
+
+
+def matching(values, search=None, limit=None):
+    """
+    Yields the values matching all criteria, at most 'limit' of them, for
+    lists whose request takes no criteria. Stops consuming 'values' at the
+    limit.
+    """
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+    for value in values:
+        if all(c.matches(value) for c in search or []):
+            yield value
+            count += 1
+            if count == limit:
+                return
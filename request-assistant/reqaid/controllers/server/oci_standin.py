@@ -0,0 +1,703 @@
+"""
+Stateful OCI-P stand-in for load and regression tests.
+
+OciStandIn extends oci_stub.OciStub with the in-memory state of one group:
+its domains and phone numbers, users with their services, primary and SCA
+endpoints, and access devices with their custom tags and config files.
+The commands OciClient sends read and change that state like BroadWorks
+does, errors included (adding a user twice, deleting a device which is
+still in use, ...), so that whole workflows such as
+create_ucone_test_user(), BulkTeardown or BulkTagSync run against it.
+
+OciStubServer serves it as ProvisioningService (WSDL and
+processOCIMessage), OciStubTcpServer as native OCI-P:
+
+    standin = OciStandIn(passwords={'admin': 'secret'},
+                         numbers=['+1-555%07d' % i for i in range(100)])
+    server = OciStubServer(standin).start()
+    oci = OciClient('admin', 'secret', server.xsp, True)
+
+Every request document takes 'latency' seconds plus a random delay of up
+to 'jitter' seconds. A random share 'error_rate' of the commands fails
+with 'error_summary' (by default a throttling error), and
+inject_error() fails the next commands of a type. expire_sessions() ends
+every session, as a restart of BroadWorks does.
+
+For load tests it also runs on its own:
+
+    python reqaid/controllers/server/oci_standin.py --port 8088 \\
+        --users 1000 --latency 0.05
+"""
+import time
+import base64
+import random
+import argparse
+import threading
+import logging
+from xml.sax.saxutils import escape
+
+from oci_stub import OciStub, OciStubServer, OciStubTcpServer, \
+    oci_table, response_command, success_command, error_command
+from oci_search import SearchCriteria, USER_FIELDS, DEVICE_FIELDS
+
+log = logging.getLogger(__name__)
+
+_XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+_XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+# Commands which need no session
+_LOGIN_COMMANDS = ('AuthenticationRequest', 'LoginRequest14sp4',
+                   'LogoutRequest')
+
+# Services listed by UserServiceGetAssignmentListRequest, besides the
+# assigned ones
+SERVICES = ['Anonymous Call Rejection', 'Call Forwarding Always',
+            'Call Waiting', 'Do Not Disturb', 'Integrated IMP',
+            'Remote Office', 'Shared Call Appearance',
+            'Simultaneous Ring Personal', 'Voice Messaging User']
+
+# User fields set by UserAddRequest17sp4 and UserModifyRequest17sp4, in
+# the order of UserGetResponse21
+_USER_FIELDS = ['lastName', 'firstName', 'callingLineIdLastName',
+                'callingLineIdFirstName', 'phoneNumber', 'extension',
+                'department', 'emailAddress']
+
+_SCA_SETTINGS = ['alertAllAppearancesForClickToDialCalls',
+                 'alertAllAppearancesForGroupPagingCalls',
+                 'allowSCACallRetrieve', 'multipleCallArrangementIsActive',
+                 'allowBridgingBetweenLocations', 'bridgeWarningTone',
+                 'enableCallParkNotification']
+
+_ENDPOINT_FLAGS = ['isActive', 'allowOrigination', 'allowTermination']
+
+_MODES = {'Starts With': 'starts with', 'Contains': 'contains',
+          'Equal To': 'equals'}
+
+
+class OciFault(Exception):
+    """A command fails with this BroadWorks error summary."""
+
+
+def _fields(*pairs):
+    """Elements of (name, value) pairs, in order, skipping None values."""
+    return "".join('<%s>%s</%s>' % (k, escape(v), k)
+                   for k, v in pairs if v is not None)
+
+
+def _is_nil(elem):
+    return elem.get(_XSI_NIL) == 'true' or \
+        (len(elem) == 0 and not (elem.text or '').strip())
+
+
+def _endpoint(elem):
+    """(device name, line port) of an accessDeviceEndpoint element."""
+    return (elem.findtext('accessDevice/deviceName'),
+            elem.findtext('linePort'))
+
+
+def _endpoint_xml(device_name, line_port):
+    return '<accessDeviceEndpoint><accessDevice><deviceLevel>Group' \
+           '</deviceLevel><deviceName>%s</deviceName></accessDevice>' \
+           '<linePort>%s</linePort></accessDeviceEndpoint>' % \
+           (escape(device_name), escape(line_port))
+
+
+def _select(command, rows, fields, key):
+    """
+    Applies the search criteria, sort order, paging and size limit of a
+    list request to rows.
+
+    :param rows: Dicts of field values
+    :param fields: oci_search.USER_FIELDS or DEVICE_FIELDS
+    :param key: Field the rows are sorted by
+    """
+    search = [SearchCriteria(field, e.findtext('value') or '',
+                             _MODES[e.findtext('mode')],
+                             e.findtext('isCaseInsensitive') != 'false')
+              for field, name in fields for e in command.findall(name)]
+    rows = sorted((r for r in rows
+                   if all(c.matches(r.get(c.field)) for c in search)),
+                  key=lambda r: r[key].lower(),
+                  reverse=command.findtext('*/isAscending') == 'false')
+    start = command.findtext('responsePagingControl/responseStartIndex')
+    if start is not None:
+        start = int(start) - 1
+        rows = rows[start:start + int(command.findtext(
+            'responsePagingControl/responsePageSize'))]
+    limit = command.findtext('responseSizeLimit')
+    return rows[:int(limit)] if limit is not None else rows
+
+
+class OciStandIn(OciStub):
+    """
+    OciStub keeping the users, devices, numbers and domains of its group.
+
+    :ivar users: {user id: dict of the user's fields and state}
+    :ivar devices: {device name: dict of the device's fields and state}
+    :ivar numbers: {phone number of the group: activated}
+    """
+
+    def __init__(self, service_provider="Enterprise", group="Group",
+                 domains=('example.com',), numbers=(), passwords=None,
+                 responses=None, latency=0, jitter=0, error_rate=0,
+                 error_summary="[Error 5000] Server busy, too many "
+                               "requests"):
+        """
+        :param domains: Domains of the group, the first is the default
+        :param numbers: Phone numbers of the group
+        :param passwords: Optional {admin user id: password} verified at
+                          login. Other admins log in with any password.
+        :param responses: Optional canned responses, see OciStub
+        :param latency: Seconds each request document takes
+        :param jitter: Maximum random delay added to the latency
+        :param error_rate: Share of the commands failing with
+                           'error_summary', 0..1
+        """
+        OciStub.__init__(self, service_provider, group, responses, latency)
+        self.passwords.update(passwords or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_summary = error_summary
+        self.errors_injected = 0
+        self.domains = list(domains)
+        self.numbers = dict((n, False) for n in numbers)
+        self.users = {}
+        self.devices = {}
+        self._assigned = {}         # {phone number: user id}
+        self._line_ports = {}       # {line port: (user id, device name)}
+        self._injected = {}         # {command type: [error summary]}
+        self._state_lock = threading.RLock()
+
+    def process(self, oci_command):
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
+        return OciStub.process(self, oci_command)
+
+    def _respond(self, session_id, cmd, command):
+        if cmd not in _LOGIN_COMMANDS:
+            error = self._injected_error(cmd)
+            if error is not None:
+                return error_command(error)
+            if cmd not in self.responses and \
+                    self.sessions.get(session_id) is None:
+                return error_command("[Error 4901] Not logged in")
+        try:
+            with self._state_lock:
+                return OciStub._respond(self, session_id, cmd, command)
+        except OciFault as e:
+            return error_command(str(e))
+
+    def inject_error(self, cmd, summary=None, count=1):
+        """Fails the next 'count' commands of type 'cmd' with 'summary'."""
+        with self._lock:
+            self._injected.setdefault(cmd, []).extend(
+                [summary or self.error_summary] * count)
+
+    def _injected_error(self, cmd):
+        with self._lock:
+            errors = self._injected.get(cmd)
+            if errors:
+                self.errors_injected += 1
+                return errors.pop(0)
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors_injected += 1
+                return self.error_summary
+        return None
+
+    def expire_sessions(self):
+        """Ends every session, their next commands fail as not logged in."""
+        with self._lock:
+            self.sessions.clear()
+
+    def add_user(self, user_id, last_name, first_name, password='',
+                 phone_number=None, **fields):
+        """
+        Adds a user like UserAddRequest17sp4, e.g. to fill the group
+        before a test. 'fields' are further _USER_FIELDS.
+        """
+        with self._state_lock:
+            if user_id in self.users:
+                raise OciFault("[Error 4200] User already exists: %s" %
+                               user_id)
+            domain = user_id.partition('@')[2]
+            if domain not in self.domains:
+                raise OciFault("[Error 4320] Domain not assigned to the "
+                               "group: %s" % domain)
+            if phone_number:
+                self._assign_number(phone_number, user_id)
+            user = dict((k, v) for k, v in fields.iteritems()
+                        if k in _USER_FIELDS and v is not None)
+            user.update(userId=user_id, lastName=last_name,
+                        firstName=first_name, phoneNumber=phone_number,
+                        password=password, services=set(), imp=False,
+                        endpoint=None, sca=[],
+                        scaSettings=dict((k, 'false')
+                                         for k in _SCA_SETTINGS),
+                        securityClassification=None, voiceMessaging={})
+            self.users[user_id] = user
+            return user
+
+    def add_device(self, device_name, device_type, **fields):
+        """
+        Adds an access device like GroupAccessDeviceAddRequest14. 'fields'
+        may set 'userName', 'password', 'macAddress' and 'netAddress'.
+        """
+        with self._state_lock:
+            if device_name in self.devices:
+                raise OciFault("[Error 4202] Access device already exists: "
+                               "%s" % device_name)
+            device = dict(fields, deviceName=device_name,
+                          deviceType=device_type, tags={}, files={},
+                          rebuilds=0, line_ports=set())
+            self.devices[device_name] = device
+            return device
+
+    def populate(self, count, prefix='loadtest'):
+        """Adds 'count' users with available numbers, for load tests."""
+        available = sorted(n for n in self.numbers if n not in self._assigned)
+        for i in range(count):
+            self.add_user('%s%05d@%s' % (prefix, i, self.domains[0]),
+                          'User%05d' % i, prefix.capitalize(),
+                          phone_number=available[i]
+                          if i < len(available) else None)
+
+    # State helpers
+
+    def _check_group(self, command):
+        for name, value in [('serviceProviderId', self.service_provider),
+                            ('groupId', self.group)]:
+            given = command.findtext(name)
+            if given is not None and given != value:
+                raise OciFault("[Error 4010] Group not found: %s" % given)
+
+    def _user(self, command):
+        user_id = command.findtext('userId')
+        user = self.users.get(user_id)
+        if user is None:
+            raise OciFault("[Error 4008] User not found: %s" % user_id)
+        return user
+
+    def _device(self, command):
+        self._check_group(command)
+        name = command.findtext('deviceName')
+        device = self.devices.get(name)
+        if device is None:
+            raise OciFault("[Error 4011] Device not found: %s" % name)
+        return device
+
+    def _assign_number(self, number, user_id):
+        if number not in self.numbers:
+            raise OciFault("[Error 4405] Invalid phone number: %s" % number)
+        owner = self._assigned.get(number)
+        if owner is not None and owner != user_id:
+            raise OciFault("[Error 4208] Phone number already assigned: %s"
+                           % number)
+        self._assigned[number] = user_id
+
+    def _add_line_port(self, user, device_name, line_port):
+        device = self.devices.get(device_name)
+        if device is None:
+            raise OciFault("[Error 4011] Device not found: %s" % device_name)
+        if line_port in self._line_ports:
+            raise OciFault("[Error 4516] Line/Port is already in use: %s" %
+                           line_port)
+        self._line_ports[line_port] = (user['userId'], device_name)
+        device['line_ports'].add(line_port)
+
+    def _remove_line_port(self, line_port):
+        _, device_name = self._line_ports.pop(line_port)
+        device = self.devices.get(device_name)
+        if device is not None:
+            device['line_ports'].discard(line_port)
+
+    def _user_rows(self):
+        return [dict(u, activated=self.numbers.get(u['phoneNumber']))
+                for u in self.users.itervalues()]
+
+    # Users
+
+    def _UserAddRequest17sp4(self, session_id, command):
+        self._check_group(command)
+        self.add_user(command.findtext('userId'),
+                      command.findtext('lastName'),
+                      command.findtext('firstName'),
+                      command.findtext('password') or '',
+                      command.findtext('phoneNumber'),
+                      **dict((f, command.findtext(f)) for f in _USER_FIELDS
+                             if f not in ('lastName', 'firstName',
+                                          'phoneNumber')))
+        return success_command()
+
+    def _UserGetRequest21(self, session_id, command):
+        user = self._user(command)
+        endpoint = _endpoint_xml(*user['endpoint']) if user['endpoint'] \
+            else ''
+        return response_command('UserGetResponse21', _fields(
+            ('serviceProviderId', self.service_provider),
+            ('groupId', self.group),
+            *[(f, user.get(f)) for f in _USER_FIELDS]) + endpoint)
+
+    def _UserModifyRequest17sp4(self, session_id, command):
+        user = self._user(command)
+        number = command.find('phoneNumber')
+        if number is not None:
+            if user['phoneNumber']:
+                del self._assigned[user['phoneNumber']]
+            if _is_nil(number):
+                user['phoneNumber'] = None
+            else:
+                self._assign_number(number.text, user['userId'])
+                user['phoneNumber'] = number.text
+        for f in _USER_FIELDS:
+            if f != 'phoneNumber' and command.find(f) is not None:
+                user[f] = command.findtext(f)
+        endpoint = command.find('endpoint')
+        if endpoint is not None:
+            if user['endpoint']:
+                self._remove_line_port(user['endpoint'][1])
+                user['endpoint'] = None
+            if not _is_nil(endpoint):
+                device_name, line_port = _endpoint(
+                    endpoint.find('accessDeviceEndpoint'))
+                self._add_line_port(user, device_name, line_port)
+                user['endpoint'] = (device_name, line_port)
+        return success_command()
+
+    def _UserDeleteRequest(self, session_id, command):
+        user = self._user(command)
+        self._assigned.pop(user['phoneNumber'], None)
+        line_ports = [e['linePort'] for e in user['sca']]
+        if user['endpoint']:
+            line_ports.append(user['endpoint'][1])
+        for line_port in line_ports:
+            self._remove_line_port(line_port)
+        del self.users[user['userId']]
+        return success_command()
+
+    def _UserGetListInGroupRequest(self, session_id, command):
+        self._check_group(command)
+        rows = _select(command, self._user_rows(), USER_FIELDS, 'userId')
+        return response_command(
+            command.get(_XSI_TYPE).replace('Request', 'Response'),
+            oci_table('userTable',
+                      ['User Id', 'Last Name', 'First Name', 'Department',
+                       'Phone Number', 'Phone Number Activated',
+                       'Email Address', 'Extension'],
+                      [[r['userId'], r['lastName'], r['firstName'],
+                        r.get('department') or '', r['phoneNumber'] or '',
+                        'true' if r['activated'] else 'false',
+                        r.get('emailAddress') or '',
+                        r.get('extension') or ''] for r in rows]))
+
+    _UserGetListInGroupPagedSortedListRequest = _UserGetListInGroupRequest
+
+    # Services and settings
+
+    def _UserServiceAssignListRequest(self, session_id, command):
+        user = self._user(command)
+        user['services'].update(
+            e.text for e in command if e.tag in ('serviceName',
+                                                 'servicePackName'))
+        return success_command()
+
+    def _UserServiceUnassignListRequest(self, session_id, command):
+        user = self._user(command)
+        user['services'].difference_update(
+            e.text for e in command if e.tag in ('serviceName',
+                                                 'servicePackName'))
+        if 'Integrated IMP' not in user['services']:
+            user['imp'] = False
+        return success_command()
+
+    def _UserServiceGetAssignmentListRequest(self, session_id, command):
+        user = self._user(command)
+        return response_command(
+            'UserServiceGetAssignmentListResponse',
+            oci_table('servicePacksAssignmentTable',
+                      ['Service Pack Name', 'Assigned', 'Description'],
+                      []) +
+            oci_table('userServicesAssignmentTable',
+                      ['Service Name', 'Assigned'],
+                      [[s, 'true' if s in user['services'] else 'false']
+                       for s in sorted(set(SERVICES) | user['services'])]))
+
+    def _UserIntegratedIMPModifyRequest(self, session_id, command):
+        user = self._user(command)
+        if 'Integrated IMP' not in user['services']:
+            raise OciFault("[Error 4410] Service not assigned: Integrated "
+                           "IMP")
+        user['imp'] = command.findtext('isActive') == 'true'
+        return success_command()
+
+    def _UserSecurityClassificationGetRequest(self, session_id, command):
+        user = self._user(command)
+        return response_command(
+            'UserSecurityClassificationGetResponse',
+            _fields(('securityClassification',
+                     user['securityClassification'])))
+
+    def _UserSecurityClassificationModifyRequest(self, session_id, command):
+        user = self._user(command)
+        elem = command.find('securityClassification')
+        user['securityClassification'] = None if _is_nil(elem) \
+            else elem.text
+        return success_command()
+
+    def _UserNetworkConferencingGetRequest(self, session_id, command):
+        self._user(command)
+        return response_command('UserNetworkConferencingGetResponse')
+
+    def _voice_messaging(self, session_id, command):
+        user = self._user(command)
+        user['voiceMessaging'].update((e.tag, e.text) for e in command
+                                      if e.tag != 'userId')
+        return success_command()
+
+    _UserVoiceMessagingUserModifyGreetingRequest20 = _voice_messaging
+    _UserVoiceMessagingUserModifyVoiceManagementRequest = _voice_messaging
+
+    # Shared call appearance
+
+    def _UserSharedCallAppearanceGetRequest21sp1(self, session_id,
+                                                 command):
+        user = self._user(command)
+        return response_command(
+            command.get(_XSI_TYPE).replace('Request', 'Response'),
+            _fields(*[(k, user['scaSettings'][k]) for k in _SCA_SETTINGS]) +
+            oci_table('endpointTable',
+                      ['Device Level', 'Device Name', 'Device Type',
+                       'Line/Port', 'SIP Contact', 'Is Active',
+                       'Allow Origination', 'Allow Termination'],
+                      [['Group', e['deviceName'],
+                        self.devices[e['deviceName']]['deviceType'],
+                        e['linePort'], '', e['isActive'],
+                        e['allowOrigination'], e['allowTermination']]
+                       for e in user['sca']]))
+
+    _UserSharedCallAppearanceGetRequest16sp2 = \
+        _UserSharedCallAppearanceGetRequest21sp1
+
+    def _UserSharedCallAppearanceModifyRequest(self, session_id, command):
+        user = self._user(command)
+        user['scaSettings'].update((e.tag, e.text) for e in command
+                                   if e.tag in _SCA_SETTINGS)
+        return success_command()
+
+    def _sca_endpoint(self, user, elem):
+        device_name, line_port = _endpoint(elem)
+        for endpoint in user['sca']:
+            if (endpoint['deviceName'], endpoint['linePort']) == \
+                    (device_name, line_port):
+                return endpoint
+        raise OciFault("[Error 4466] Endpoint not found: %s" % line_port)
+
+    def _UserSharedCallAppearanceAddEndpointRequest14sp2(self, session_id,
+                                                         command):
+        user = self._user(command)
+        device_name, line_port = _endpoint(
+            command.find('accessDeviceEndpoint'))
+        self._add_line_port(user, device_name, line_port)
+        endpoint = dict((k, command.findtext(k) or 'true')
+                        for k in _ENDPOINT_FLAGS)
+        endpoint.update(deviceName=device_name, linePort=line_port)
+        user['sca'].append(endpoint)
+        return success_command()
+
+    def _UserSharedCallAppearanceGetEndpointRequest(self, session_id,
+                                                    command):
+        user = self._user(command)
+        endpoint = self._sca_endpoint(user,
+                                      command.find('accessDeviceEndpoint'))
+        return response_command(
+            'UserSharedCallAppearanceGetEndpointResponse',
+            _fields(*[(k, endpoint[k]) for k in _ENDPOINT_FLAGS]))
+
+    def _UserSharedCallAppearanceDeleteEndpointListRequest14(
+            self, session_id, command):
+        user = self._user(command)
+        endpoints = [self._sca_endpoint(user, e)
+                     for e in command.findall('accessDeviceEndpoint')]
+        for endpoint in endpoints:
+            user['sca'].remove(endpoint)
+            self._remove_line_port(endpoint['linePort'])
+        return success_command()
+
+    # Access devices
+
+    def _GroupAccessDeviceAddRequest14(self, session_id, command):
+        self._check_group(command)
+        self.add_device(
+            command.findtext('deviceName'), command.findtext('deviceType'),
+            userName=command.findtext('accessDeviceCredentials/userName'),
+            password=command.findtext('accessDeviceCredentials/password'),
+            macAddress=command.findtext('macAddress'),
+            netAddress=command.findtext('netAddress'))
+        return success_command()
+
+    def _GroupAccessDeviceGetRequest18sp1(self, session_id, command):
+        device = self._device(command)
+        credentials = '<accessDeviceCredentials>%s' \
+                      '</accessDeviceCredentials>' % \
+                      _fields(('userName', device['userName'])) \
+            if device.get('userName') else ''
+        return response_command('GroupAccessDeviceGetResponse18sp1', _fields(
+            ('deviceType', device['deviceType']), ('protocol', 'SIP 2.0'),
+            ('netAddress', device.get('netAddress')),
+            ('macAddress', device.get('macAddress')), ('status', 'Online'),
+            ('numberOfAssignedPorts', str(len(device['line_ports']))),
+            ('useCustomUserNamePassword',
+             'true' if device.get('userName') else 'false')) + credentials)
+
+    def _GroupAccessDeviceDeleteRequest(self, session_id, command):
+        device = self._device(command)
+        if device['line_ports']:
+            raise OciFault("[Error 4453] Access device is in use: %s" %
+                           device['deviceName'])
+        del self.devices[device['deviceName']]
+        return success_command()
+
+    def _GroupAccessDeviceGetPagedSortedListRequest(self, session_id,
+                                                    command):
+        self._check_group(command)
+        rows = _select(command, self.devices.values(), DEVICE_FIELDS,
+                       'deviceName')
+        return response_command(
+            'GroupAccessDeviceGetPagedSortedListResponse',
+            oci_table('accessDeviceTable',
+                      ['Device Name', 'Device Type', 'Available Ports',
+                       'Net Address', 'MAC Address', 'Status', 'Version'],
+                      [[d['deviceName'], d['deviceType'], 'Unlimited',
+                        d.get('netAddress') or '',
+                        d.get('macAddress') or '', 'Online', '']
+                       for d in rows]))
+
+    def _GroupAccessDeviceCustomTagGetListRequest(self, session_id,
+                                                  command):
+        device = self._device(command)
+        return response_command(
+            'GroupAccessDeviceCustomTagGetListResponse',
+            oci_table('deviceCustomTagsTable', ['Tag Name', 'Tag Value'],
+                      sorted(device['tags'].iteritems())))
+
+    def _GroupAccessDeviceCustomTagAddRequest(self, session_id, command):
+        device = self._device(command)
+        tag = command.findtext('tagName')
+        if tag in device['tags']:
+            raise OciFault("[Error 4451] Custom tag already exists: %s" %
+                           tag)
+        device['tags'][tag] = command.findtext('tagValue') or ''
+        return success_command()
+
+    def _GroupAccessDeviceCustomTagModifyRequest(self, session_id, command):
+        device = self._device(command)
+        tag = command.findtext('tagName')
+        if tag not in device['tags']:
+            raise OciFault("[Error 4452] Custom tag not found: %s" % tag)
+        device['tags'][tag] = command.findtext('tagValue') or ''
+        return success_command()
+
+    def _GroupAccessDeviceCustomTagDeleteListRequest(self, session_id,
+                                                     command):
+        device = self._device(command)
+        tags = [e.text for e in command.findall('tagName')]
+        for tag in tags:
+            if tag not in device['tags']:
+                raise OciFault("[Error 4452] Custom tag not found: %s" % tag)
+        for tag in tags:
+            del device['tags'][tag]
+        return success_command()
+
+    def _GroupAccessDeviceFileModifyRequest14sp8(self, session_id, command):
+        device = self._device(command)
+        file_format = command.findtext('fileFormat')
+        content = command.findtext('uploadFile/fileContent')
+        if command.findtext('fileSource') == 'Custom' and content:
+            device['files'][file_format] = base64.b64decode(content)
+        elif command.findtext('fileSource') == 'Default':
+            device['files'].pop(file_format, None)
+        return success_command()
+
+    def _GroupCPEConfigRebuildDeviceConfigFileRequest(self, session_id,
+                                                      command):
+        self._device(command)['rebuilds'] += 1
+        return success_command()
+
+    def _GroupCPEConfigRebuildConfigFileRequest(self, session_id, command):
+        self._check_group(command)
+        device_type = command.findtext('deviceType')
+        for device in self.devices.itervalues():
+            if device_type in (None, device['deviceType']):
+                device['rebuilds'] += 1
+        return success_command()
+
+    # Numbers and domains
+
+    def _GroupDnGetAvailableListRequest(self, session_id, command):
+        self._check_group(command)
+        return response_command(
+            'GroupDnGetAvailableListResponse',
+            "".join('<phoneNumber>%s</phoneNumber>' % escape(n)
+                    for n in sorted(self.numbers)
+                    if n not in self._assigned))
+
+    def _GroupDnActivateListRequest(self, session_id, command):
+        self._check_group(command)
+        numbers = [e.text for e in command.findall('phoneNumber')]
+        for number in numbers:
+            if number not in self.numbers:
+                raise OciFault("[Error 4405] Invalid phone number: %s" %
+                               number)
+        for number in numbers:
+            self.numbers[number] = True
+        return success_command()
+
+    def _GroupDomainGetAssignedListRequest(self, session_id, command):
+        self._check_group(command)
+        return response_command(
+            'GroupDomainGetAssignedListResponse',
+            _fields(('groupDefaultDomain', self.domains[0]),
+                    *[('domain', d) for d in self.domains[1:]]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local stateful OCI-P server for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088,
+                        help="HTTP port of ProvisioningService")
+    parser.add_argument('--tcp-port', type=int,
+                        help="Also serve native OCI-P on this port")
+    parser.add_argument('--admin', default='admin')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--numbers', type=int, default=10000,
+                        help="Phone numbers of the group")
+    parser.add_argument('--users', type=int, default=0,
+                        help="Users added at startup")
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    standin = OciStandIn(
+        passwords={args.admin: args.password},
+        numbers=['+1-555%07d' % i for i in range(args.numbers)],
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate)
+    standin.populate(args.users)
+    servers = [OciStubServer(standin, args.host, args.port).start()]
+    log.info("ProvisioningService at %s/webservice/services/"
+             "ProvisioningService" % servers[0].xsp)
+    if args.tcp_port:
+        servers.append(OciStubTcpServer(standin, args.host,
+                                        args.tcp_port).start())
+        log.info("OCI-P at %s:%d" % (servers[1].host, servers[1].port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
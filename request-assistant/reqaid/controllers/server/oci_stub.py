@@ -0,0 +1,450 @@
+"""
+Local OCI-P stand-in for tests and benchmarks.
+
+OciStub answers OCI request documents: AuthenticationRequest with a nonce,
+LoginRequest14sp4 with the admin's enterprise and group, everything else
+with a SuccessResponse unless a canned response is registered. It has the
+same process(oci_command) method as the transports in oci_transport, so it
+can be given to OciClient directly. OciStubServer serves it over HTTP as
+ProvisioningService (WSDL and processOCIMessage), OciStubTcpServer as
+native OCI-P over TCP.
+"""
+import re
+import time
+import random
+import socket
+import hashlib
+import threading
+import logging
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn, TCPServer, StreamRequestHandler
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as Etree
+
+from oci_transport import oci_response, recv_document, StreamedDocument
+
+log = logging.getLogger(__name__)
+
+_XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+
+PROVISIONING_WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<wsdl:definitions targetNamespace="urn:com:broadsoft:webservice"
+    xmlns:apachesoap="http://xml.apache.org/xml-soap"
+    xmlns:impl="urn:com:broadsoft:webservice"
+    xmlns:intf="urn:com:broadsoft:webservice"
+    xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"
+    xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:wsdlsoap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <wsdl:message name="processOCIMessageRequest">
+    <wsdl:part name="in0" type="xsd:string"/>
+  </wsdl:message>
+  <wsdl:message name="processOCIMessageResponse">
+    <wsdl:part name="processOCIMessageReturn" type="xsd:string"/>
+  </wsdl:message>
+  <wsdl:portType name="BWProvisioningService">
+    <wsdl:operation name="processOCIMessage" parameterOrder="in0">
+      <wsdl:input message="impl:processOCIMessageRequest"
+                  name="processOCIMessageRequest"/>
+      <wsdl:output message="impl:processOCIMessageResponse"
+                   name="processOCIMessageResponse"/>
+    </wsdl:operation>
+  </wsdl:portType>
+  <wsdl:binding name="ProvisioningServiceSoapBinding"
+                type="impl:BWProvisioningService">
+    <wsdlsoap:binding style="rpc"
+                      transport="http://schemas.xmlsoap.org/soap/http"/>
+    <wsdl:operation name="processOCIMessage">
+      <wsdlsoap:operation soapAction=""/>
+      <wsdl:input name="processOCIMessageRequest">
+        <wsdlsoap:body
+            encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"
+            namespace="urn:com:broadsoft:webservice" use="encoded"/>
+      </wsdl:input>
+      <wsdl:output name="processOCIMessageResponse">
+        <wsdlsoap:body
+            encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"
+            namespace="urn:com:broadsoft:webservice" use="encoded"/>
+      </wsdl:output>
+    </wsdl:operation>
+  </wsdl:binding>
+  <wsdl:service name="BWProvisioningServiceService">
+    <wsdl:port binding="impl:ProvisioningServiceSoapBinding"
+               name="ProvisioningService">
+      <wsdlsoap:address
+          location="%(xsp)s/webservice/services/ProvisioningService"/>
+    </wsdl:port>
+  </wsdl:service>
+</wsdl:definitions>
+"""
+
+_SOAP_RESPONSE = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<soapenv:Envelope'
+    ' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<soapenv:Body>'
+    '<ns1:processOCIMessageResponse'
+    ' soapenv:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"'
+    ' xmlns:ns1="urn:com:broadsoft:webservice">'
+    '<processOCIMessageReturn xsi:type="xsd:string">%s'
+    '</processOCIMessageReturn>'
+    '</ns1:processOCIMessageResponse>'
+    '</soapenv:Body></soapenv:Envelope>')
+
+_IN0 = re.compile(r'<in0\b[^>]*>(.*?)</in0>', re.DOTALL)
+
+
+def oci_document(session_id, *commands):
+    """Wraps response command elements into a BroadsoftDocument."""
+    return ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+            '<BroadsoftDocument protocol="OCI" xmlns="C" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            '<sessionId xmlns="">%s</sessionId>%s</BroadsoftDocument>' %
+            (escape(session_id), "".join(commands)))
+
+
+def response_command(cmd, body=''):
+    """Returns a response <command> element of given type."""
+    return '<command echo="" xsi:type="%s" xmlns="">%s</command>' % \
+           (cmd, body)
+
+
+def oci_table(table, headings, rows):
+    """
+    Returns an OCI table element.
+
+    :param table: Table element name, e.g. 'userTable'
+    :param headings: Column headings
+    :param rows: Lists of column values
+    """
+    return '<%s>%s%s</%s>' % (
+        table,
+        "".join('<colHeading>%s</colHeading>' % escape(h) for h in headings),
+        "".join('<row>%s</row>' % "".join('<col>%s</col>' % escape(v)
+                                          for v in row) for row in rows),
+        table)
+
+
+def response_table(cmd, table, headings, rows, body=''):
+    """Returns a response <command> carrying an OCI table, see oci_table()."""
+    return response_command(cmd, body + oci_table(table, headings, rows))
+
+
+def success_command():
+    return '<command echo="" xsi:type="c:SuccessResponse" xmlns="" ' \
+           'xmlns:c="C"/>'
+
+
+def error_command(summary, detail=''):
+    return '<command type="Error" echo="" xsi:type="c:ErrorResponse" ' \
+           'xmlns:c="C" xmlns=""><summary>%s</summary>' \
+           '<summaryEnglish>%s</summaryEnglish>%s</command>' % \
+           (escape(summary), escape(summary),
+            '<detail>%s</detail>' % escape(detail) if detail else '')
+
+
+class Rendezvous(object):
+    """
+    Canned response holding each command until 'count' commands wait at
+    the same time, or 'timeout' seconds passed. 'peak' is the most commands
+    seen waiting at once: 'count' only when they ran concurrently.
+    """
+
+    def __init__(self, count, response=None, timeout=2):
+        self.count = count
+        self.response = response or success_command()
+        self.timeout = timeout
+        self.waiting = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def __call__(self, session_id, command):
+        with self._condition:
+            self.waiting += 1
+            self.peak = max(self.peak, self.waiting)
+            self._condition.notify_all()
+            end = time.time() + self.timeout
+            while self.peak < self.count and time.time() < end:
+                self._condition.wait(end - time.time())
+            self.waiting -= 1
+        return self.response
+
+
+def _text(**fields):
+    return "".join('<%s>%s</%s>' % (k, escape(v), k)
+                   for k, v in sorted(fields.iteritems()))
+
+
+class OciStub(object):
+    """
+    In-memory OCI-P server side. Verifies the two phase login and answers
+    each command of a request document.
+    """
+
+    def __init__(self, service_provider="Enterprise", group="Group",
+                 responses=None, latency=0):
+        """
+        :param service_provider: serviceProviderId returned by the login
+        :param group: groupId returned by the login
+        :param responses: Optional dict {command type: response command
+                          xml} of canned responses. A response may also be
+                          a callable taking the session id and the command
+                          element.
+        :param latency: Seconds each request document takes, to simulate
+                        the round trip to BroadWorks
+        """
+        self.service_provider = service_provider
+        self.group = group
+        self.responses = dict(responses or {})
+        self.latency = latency
+        self.passwords = {}
+        self.sessions = {}
+        self.commands = []
+        self.documents = 0
+        self._nonces = {}
+        self._lock = threading.Lock()
+
+    def process(self, oci_command):
+        if isinstance(oci_command, StreamedDocument):
+            oci_command = oci_command.getvalue()
+        if isinstance(oci_command, unicode):
+            oci_command = oci_command.encode('ISO-8859-1')
+        request = Etree.fromstring(oci_command)
+        session_id = request.findtext('sessionId')
+        with self._lock:
+            self.documents += 1
+        if self.latency:
+            time.sleep(self.latency)
+        responses = []
+        for command in request.findall('command'):
+            cmd = command.get(_XSI_TYPE)
+            with self._lock:
+                self.commands.append(cmd)
+            responses.append(self._respond(session_id, cmd, command))
+        return oci_document(session_id, *responses)
+
+    def _respond(self, session_id, cmd, command):
+        """Returns the response "command" xml of one request command."""
+        handler = getattr(self, '_%s' % cmd, None)
+        if cmd in self.responses:
+            response = self.responses[cmd]
+            return response(session_id, command) if callable(response) \
+                else response
+        if handler is not None:
+            return handler(session_id, command)
+        if self.sessions.get(session_id) is None:
+            return error_command("[Error 4901] Not logged in")
+        return success_command()
+
+    def _AuthenticationRequest(self, session_id, command):
+        nonce = "%d" % random.randint(10 ** 12, 10 ** 13)
+        with self._lock:
+            self.sessions[session_id] = None
+            self._nonces[session_id] = nonce
+        return response_command(
+            'AuthenticationResponse',
+            _text(userId=command.findtext('userId'), nonce=nonce,
+                  passwordAlgorithm='MD5'))
+
+    def _LoginRequest14sp4(self, session_id, command):
+        user_id = command.findtext('userId')
+        nonce = self._nonces.get(session_id)
+        password = self.passwords.get(user_id)
+        if nonce is None:
+            return error_command("[Error 4961] Authentication required")
+        if password is not None and command.findtext('signedPassword') != \
+                _digest(password, nonce):
+            return error_command("[Error 4962] Invalid password")
+        with self._lock:
+            self.sessions[session_id] = user_id
+        return response_command(
+            'LoginResponse14sp4',
+            _text(loginType='Group', locale='en_US', encoding='ISO-8859-1',
+                  groupId=self.group, serviceProviderId=self.service_provider,
+                  isEnterprise='true', userDomain='example.com'))
+
+    def _LogoutRequest(self, session_id, command):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+        return success_command()
+
+
+def _digest(password, nonce):
+    return hashlib.md5("%s:%s" % (nonce, hashlib.sha1(password).hexdigest())
+                       ).hexdigest()
+
+
+class _ConnectionTracking(ThreadingMixIn):
+    """Threading server which can close its kept alive connections."""
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+    def process_request_thread(self, request, client_address):
+        self.connections[client_address] = (request,
+                                            threading.current_thread())
+        try:
+            ThreadingMixIn.process_request_thread(self, request,
+                                                  client_address)
+        finally:
+            self.connections.pop(client_address, None)
+
+    def handle_error(self, request, client_address):
+        # Kept alive connections are reset when clients go away
+        pass
+
+    def close_connections(self):
+        for request, thread in self.connections.values():
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join(1)
+
+
+class _ThreadingHTTPServer(_ConnectionTracking, HTTPServer):
+
+    def __init__(self, *args):
+        HTTPServer.__init__(self, *args)
+        self.connections = {}
+
+
+class _ThreadingTCPServer(_ConnectionTracking, TCPServer):
+
+    def __init__(self, *args):
+        TCPServer.__init__(self, *args)
+        self.connections = {}
+
+
+class OciStubServer(object):
+    """
+    Serves an OciStub as ProvisioningService on a local HTTP port:
+
+        server = OciStubServer().start()
+        oci = OciClient("admin", "pwd", server.xsp, True)
+        ...
+        server.stop()
+    """
+
+    def __init__(self, stub=None, host="127.0.0.1", port=0):
+        self.stub = stub or OciStub()
+        self.wsdl = PROVISIONING_WSDL
+        self.wsdl_requests = 0
+        self._server = _ThreadingHTTPServer((host, port), self._handler())
+        self.xsp = "http://%s:%d" % self._server.server_address
+
+    def _handler(self):
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _reply(self, code, body):
+                self.send_response(code)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                outer.wsdl_requests += 1
+                self._reply(200, outer.wsdl % {"xsp": outer.xsp})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if not self.path.endswith("/ProvisioningService"):
+                    return self._reply(404, "Not found")
+                m = _IN0.search(body)
+                if m is None:
+                    return self._reply(500, "<faultstring>No in0"
+                                            "</faultstring>")
+                request = oci_response(
+                    "<processOCIMessageReturn>%s</processOCIMessageReturn>"
+                    % m.group(1))
+                response = outer.stub.process(request)
+                if isinstance(response, unicode):
+                    response = response.encode('utf-8')
+                self._reply(200, _SOAP_RESPONSE % escape(response))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        t = threading.Thread(target=self._server.serve_forever,
+                             name="OciStubServer")
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.close_connections()
+
+
+class OciStubTcpServer(object):
+    """
+    Serves an OciStub as native OCI-P on a local TCP port:
+
+        server = OciStubTcpServer().start()
+        transport = TcpTransport(server.host, server.port)
+        oci = OciClient("admin", "pwd", "", transport=transport)
+        ...
+        server.stop()
+
+    Like BroadWorks, sessions logged in on a connection are dropped when
+    the connection closes.
+    """
+
+    def __init__(self, stub=None, host="127.0.0.1", port=0):
+        self.stub = stub or OciStub()
+        self.connections = 0
+        self._server = _ThreadingTCPServer((host, port), self._handler())
+        self.host, self.port = self._server.server_address
+
+    def _handler(self):
+        outer = self
+
+        class Handler(StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                outer.connections += 1
+                sessions = set()
+                pending = ''
+                try:
+                    while True:
+                        request, pending = recv_document(self.connection,
+                                                         pending)
+                        sessions.add(Etree.fromstring(request).findtext(
+                            'sessionId'))
+                        response = outer.stub.process(request)
+                        if isinstance(response, unicode):
+                            response = response.encode('ISO-8859-1')
+                        self.connection.sendall(response + '\n')
+                except socket.error:
+                    pass
+                finally:
+                    with outer.stub._lock:
+                        for session_id in sessions:
+                            outer.stub.sessions.pop(session_id, None)
+
+        return Handler
+
+    def start(self):
+        t = threading.Thread(target=self._server.serve_forever,
+                             name="OciStubTcpServer")
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.close_connections()
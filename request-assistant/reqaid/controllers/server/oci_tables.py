@@ -0,0 +1,251 @@
+"""
+Streaming readers of OCI-P responses.
+
+Table responses (group DN lists, user lists, SCA and custom tag tables)
+of large enterprises are megabytes of XML. Etree.fromstring() keeps the
+whole tree in memory while it is walked with findall('.//row'). The
+readers here parse the response incrementally and yield the rows of an
+OCI table (colHeading / row / col elements) as soon as they are parsed,
+dropping every row from the tree once it has been yielded:
+
+    for values in iter_rows(response, 'userServicesAssignmentTable'):
+        ...
+
+so memory stays flat however many rows the table has.
+
+decode_table() reads a whole table into an OciTable, which keeps the
+headings once and the values column by column, with equal values shared,
+instead of one dict per row:
+
+    table = decode_table(response, 'userTable')
+    table.column('User Id')
+    table.where('Department', 'Lab').dicts()
+"""
+import io
+from itertools import izip
+from xml.etree import cElementTree
+
+_DECLARATION_END = '?>'
+
+
+def _source(response):
+    """
+    Returns the response as a byte stream. Unicode responses are given to
+    the parser as UTF-8 without their XML declaration, which may name
+    another encoding.
+    """
+    if isinstance(response, unicode):
+        response = response.lstrip()
+        if response.startswith(u'<?xml'):
+            response = response[response.index(_DECLARATION_END) +
+                                len(_DECLARATION_END):]
+        response = response.encode('utf-8')
+    return io.BytesIO(response)
+
+
+def _iterparse(response):
+    """
+    Returns an iterator of (element, parent) as each element of the
+    response ends, and whether the elements may be dropped from the tree.
+    The tree of an oci_response.OciResponse which is already parsed is
+    walked instead, and left as it is.
+    """
+    tree = getattr(response, 'parsed', None)
+    if tree is not None:
+        return _walk(tree, None), False
+    return _parse(response), True
+
+
+def _walk(elem, parent):
+    for child in elem:
+        for end in _walk(child, elem):
+            yield end
+    yield elem, parent
+
+
+def _parse(response):
+    stack = []
+    for event, elem in cElementTree.iterparse(_source(response),
+                                              ('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+        else:
+            stack.pop()
+            yield elem, stack[-1] if stack else None
+
+
+def _drop(elem, parent):
+    elem.clear()
+    if parent is not None:
+        parent.remove(elem)
+
+
+def response_error(response):
+    """
+    Returns the summary of the first response command when it is an Error,
+    otherwise None. Parsing stops at the first command.
+    """
+    tree = getattr(response, 'parsed', None)
+    if tree is not None:
+        command = tree.find('.//command')
+        if command is None or command.get('type') != 'Error':
+            return None
+        return command.findtext('summary') or ''
+    for event, elem in cElementTree.iterparse(_source(response),
+                                              ('start', 'end')):
+        if elem.tag != 'command':
+            continue
+        if event == 'start' and elem.get('type') != 'Error':
+            return None
+        if event == 'end':
+            return elem.findtext('summary') or ''
+    return None
+
+
+def iter_texts(response, tag):
+    """
+    Yields the texts of all elements named 'tag', e.g. the 'phoneNumber'
+    elements of GroupDnGetAvailableListResponse.
+    """
+    ends, drop = _iterparse(response)
+    for elem, parent in ends:
+        if elem.tag == tag:
+            yield elem.text
+            if drop:
+                _drop(elem, parent)
+
+
+def iter_table(response, table=None):
+    """
+    Yields the column headings of an OCI table, then the column values of
+    each row as lists. Nothing is yielded when the table is not found.
+
+    :param response: OCI response xml
+    :param table: Table element name, e.g. 'userTable'. Defaults to the
+                  first table of the response.
+    """
+    headings = []
+    current = None
+    ends, drop = _iterparse(response)
+    for elem, parent in ends:
+        if elem.tag == 'colHeading' and parent is not None and \
+                (parent is current or current is None and
+                 (table is None or parent.tag == table)):
+            current = parent
+            headings.append(elem.text)
+        elif elem.tag == 'row' and parent is current is not None:
+            if headings is not None:
+                yield headings
+                headings = None
+            yield [col.text for col in elem]
+            if drop:
+                _drop(elem, parent)
+        elif elem is current:
+            if headings is not None:
+                # A table without rows
+                yield headings
+            return
+
+
+def iter_rows(response, table=None):
+    """Yields the column values of each row of an OCI table as lists."""
+    rows = iter_table(response, table)
+    next(rows, None)
+    for values in rows:
+        yield values
+
+
+def iter_dicts(response, table=None):
+    """Yields the rows of an OCI table as dicts keyed by column heading."""
+    rows = iter_table(response, table)
+    headings = next(rows, [])
+    for values in rows:
+        yield dict(zip(headings, values))
+
+
+def decode_table(response, table=None, columns=None):
+    """
+    Reads an OCI table into an OciTable.
+
+    :param response: OCI response xml
+    :param table: Table element name, see iter_table()
+    :param columns: Optional headings of the columns to keep, the values of
+                    the other columns are not stored
+    :return: OciTable, without columns when the table is not found
+    """
+    rows = iter_table(response, table)
+    headings = next(rows, [])
+    keep = [i for i, h in enumerate(headings)
+            if columns is None or h in columns]
+    ret = OciTable([headings[i] for i in keep])
+    # Values such as 'true' or device types repeat on most rows
+    values = {}
+    for row in rows:
+        for column, i in izip(ret.columns, keep):
+            value = row[i] if i < len(row) else None
+            column.append(values.setdefault(value, value))
+    return ret
+
+
+class OciTable(object):
+    """
+    Columnar OCI table. Rows are built on demand, as tuples in heading
+    order or as dicts keyed by heading.
+    """
+
+    def __init__(self, headings, columns=None):
+        """
+        :param headings: Column headings
+        :param columns: Optional value lists, one per heading
+        """
+        self.headings = tuple(headings)
+        self.columns = columns if columns is not None else \
+            [[] for _ in self.headings]
+        self._index = dict((h, i) for i, h in enumerate(self.headings))
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        return self.rows()
+
+    def __getitem__(self, i):
+        return tuple(column[i] for column in self.columns)
+
+    def __repr__(self):
+        return "<OciTable %s, %d rows>" % (list(self.headings), len(self))
+
+    def column(self, heading):
+        """
+        Returns the values of a column, in row order. A table which was not
+        found in the response has no values in any column.
+        """
+        if not self.headings:
+            return []
+        return self.columns[self._index[heading]]
+
+    def rows(self, *headings):
+        """Yields the rows as tuples of the given columns, by default all."""
+        if not headings:
+            return izip(*self.columns) if self.columns else iter([])
+        return izip(*[self.column(h) for h in headings])
+
+    def dicts(self):
+        """Yields the rows as dicts keyed by heading."""
+        for row in self.rows():
+            yield dict(izip(self.headings, row))
+
+    def mapping(self, key, value):
+        """Returns {value of column 'key': value of column 'value'}."""
+        return dict(izip(self.column(key), self.column(value)))
+
+    def where(self, heading, match):
+        """
+        Returns the rows whose value in column 'heading' equals 'match', or
+        for which 'match' returns True when it is callable, as an OciTable.
+        Only the matching positions of the other columns are copied.
+        """
+        test = match if callable(match) else lambda v: v == match
+        selected = [i for i, v in enumerate(self.column(heading)) if test(v)]
+        return OciTable(self.headings, [[column[i] for i in selected]
+                                        for column in self.columns])
@@ -5,18 +5,44 @@ import xml.etree.ElementTree as Etree
 import hashlib
 import random
 import string
+import re
+import threading
+from urlparse import urlparse
+from contextlib import contextmanager
 from utils import value_to_str
-from suds.client import Client
+from oci_transport import SudsTransport, StreamedDocument
+from oci_numbers import number_pools
+from oci_workflow import Workflow
+from oci_templates import render_command
+from oci_tables import iter_texts, decode_table
+from oci_response import make_response
+from oci_paging import iter_pages
+from oci_coalesce import ListCommand, Coalesced, list_command
+from outbound import default_scheduler, is_throttle_message, THROTTLED
+from oci_search import USER_FIELDS, DEVICE_FIELDS, search_elements, \
+    criteria_elements, matching
 import logging
 
 log = logging.getLogger(__name__)
 
+# Error summaries BroadWorks returns when the session behind our sessionId
+# has been dropped (timeout, AS restart, explicit logout).
+_SESSION_EXPIRED = re.compile(r'not (logged in|authenticated)|'
+                              r'session (has )?(expired|timed out)|'
+                              r'invalid session', re.IGNORECASE)
+# Stands for the file content in the command of
+# group_device_upload_config_file()
+_UPLOAD_MARKER = 'OCI-UPLOAD-CONTENT'
+
+
 class OciClient:
     """
     Simple OCI-P SOAP Client.
     """
 
-    def __init__(self, username, password, xsp, override_location=False):
+    def __init__(self, username, password, xsp, override_location=False,
+                 wsdl_cache=None, transport=None, cache=None,
+                 coalescer=None, scheduler=None):
         """
         :param username: OCI-P username. Typically a group admin username.
         :param password: OCI-P password
@@ -24,11 +50,34 @@ class OciClient:
         :param override_location: When 'True' generates service location
                                   using parameter 'xsp', instead of using
                                   the default service location from WSDL.
+        :param wsdl_cache: Optional oci_wsdl.WsdlCache. When given, the WSDL
+                           and its parsed definition are loaded from the
+                           cache instead of being downloaded and parsed.
+        :param transport: Optional transport carrying the OCI documents, see
+                          oci_transport (SOAP or native OCI-P over TCP).
+                          Defaults to processOCIMessage through suds.
+        :param cache: Optional oci_cache.OciCache answering repeated Get
+                      commands. It can be shared by several clients.
+        :param coalescer: Optional oci_coalesce.OciCoalescer merging the
+                          single item list commands of the clients sharing
+                          it, see oci_coalesce.
+        :param scheduler: outbound.OutboundScheduler limiting the commands
+                          in flight to the server. Defaults to the one
+                          shared with XsiTool.
 
         """
         self.username = username
         self.password = password
         self.oci_command = ''
+        self.command_count = 0
+        self._logging_in = False
+        self._batch = None
+        self.cache = cache
+        self.coalescer = coalescer
+        self.scheduler = scheduler or default_scheduler
+        # Serializes the use of the transport, see iter_group_users()
+        self._lock = threading.RLock()
+        self._document_head = (None, None)
         self.session_id = hashlib.sha1("UC-ONE UI Test OCI-P SOAP:%s:%s" %
                                        (random.randint(1, 1000000000),
                                         time.time())).hexdigest()
@@ -36,9 +85,14 @@ class OciClient:
                         xsp
         location = ("%s/webservice/services/ProvisioningService" % xsp) \
             if override_location else None
-        self.oci_soap = Client(self.wsdl_url, location=location)
-        auth_reponse = Etree.fromstring(self.authentication_request())
-        self.nonce = auth_reponse.find('.//nonce').text
+        if transport is None:
+            transport = SudsTransport(self.wsdl_url, location, wsdl_cache)
+        self.transport = transport
+        # Native OCI-P goes to the AS, SOAP to the XSP
+        self.host = getattr(transport, 'host', None) or \
+            urlparse(self.wsdl_url).netloc
+        self.oci_soap = getattr(transport, 'client', None)
+        self.authentication_request()
         self.login_request()
 
     def _oci_xml(self, cmd, *cmd_elements):
@@ -64,31 +118,45 @@ class OciClient:
                              represents its value.
         :return: OCI-P requests xml document
         """
-        root = Element('BroadsoftDocument',
-                       attrib={'protocol': 'OCI', 'xmlns': 'C',
-                               'xmlns:xsi': 'http://www.w3.org/2001/'
-                                            'XMLSchema-instance'})
-        session = SubElement(root, 'sessionId', attrib={'xmlns': ''})
-        session.text = self.session_id
-        command = SubElement(root, 'command',
-                             attrib={'xsi:type': cmd, 'xmlns': ''})
-        for elem in cmd_elements:
-            parent = None
-            if 'parent' in elem:
-                parent = elem.pop('parent')
-            cmd_element = Element(elem.items()[0][0])
-            if elem.items()[0][1] is not None:
-                if len(elem.items()[0][1]) == 0:
-                    cmd_element.set("xsi:nil", "true")
-                else:
-                    cmd_element.text = elem.items()[0][1]
-            if parent is not None:
-                command.find(parent).append(cmd_element)
-            else:
-                command.append(cmd_element)
-        ret = '<?xml version="1.0" encoding="ISO-8859-1"?>%s' % \
-              (Etree.tostring(root))
-        return ret
+        merge = list_command(cmd, cmd_elements) \
+            if self._batch is not None or self.coalescer is not None else None
+        if self._batch is not None:
+            return _PendingCommand(cmd, self._oci_command(cmd, *cmd_elements),
+                                   merge)
+        if merge is not None:
+            # Sent by the coalescer, see _send()
+            return merge
+        return self._oci_document(self._oci_command(cmd, *cmd_elements))
+
+    def _oci_command(self, cmd, *cmd_elements):
+        """
+        Generates the "command" node of an OCI-P request, see
+        oci_templates.
+
+        :param cmd: See documentation of def _oci_xml()
+        :param cmd_elements: See documentation of def _oci_xml()
+        :return: "command" node as xml string
+        """
+        return render_command(cmd, cmd_elements)
+
+    def _oci_document(self, *commands):
+        """
+        Wraps "command" nodes generated by _oci_command() into an OCI-P
+        request document.
+        """
+        if self._document_head[0] != self.session_id:
+            root = Element('BroadsoftDocument',
+                           attrib={'protocol': 'OCI', 'xmlns': 'C',
+                                   'xmlns:xsi': 'http://www.w3.org/2001/'
+                                                'XMLSchema-instance'})
+            session = SubElement(root, 'sessionId', attrib={'xmlns': ''})
+            session.text = self.session_id
+            head, tail = Etree.tostring(root).split('</BroadsoftDocument>')
+            self._document_head = (self.session_id,
+                                   '<?xml version="1.0" '
+                                   'encoding="ISO-8859-1"?>%s' % head)
+        return '%s%s</BroadsoftDocument>' % (
+            self._document_head[1], ''.join(commands))
 
     def _group_requests(self, cmd, *cmd_elements, **kwargs):
         """
@@ -111,26 +179,109 @@ class OciClient:
         return self._send(self._oci_xml(cmd, service_provider, group,
                                         *cmd_elements))
 
+    def _process(self, oci_command, relogin=True):
+        """
+        Process one OCI-P SOAP transaction without checking the response
+        for errors.
+
+        :param oci_command: OCI requests xml
+        :param relogin: When 'True' and BroadWorks reports that the session
+                        has expired, logs in again and resends the command
+                        once.
+        :return: oci_response.OciResponse
+        """
+        log.info(oci_command)
+        with self._lock:
+            self.oci_command = oci_command
+            self.command_count += oci_command.count('<command ')
+            with self.scheduler.request(self.host) as slot:
+                response = make_response(self.transport.process(oci_command))
+                if response and response.error is not None and \
+                        is_throttle_message(response.error.summary):
+                    slot.outcome = THROTTLED
+        if not response:
+            return response
+        log.info(response)
+        if relogin and not self._logging_in:
+            error = response.error
+            if error is not None and \
+                    _SESSION_EXPIRED.search(error.summary or ''):
+                log.info("OCI session expired, logging in again")
+                self.relogin()
+                return self._process(oci_command, relogin=False)
+        return response
+
     def _send(self, oci_command):
         """
         Process one OCI-P SOAP transaction.
 
+        Inside a batch() the command is only queued, and an OciCommandResult
+        which is filled in when the batch is sent is returned instead.
+
+        The response is a string which also carries its parsed tree
+        (response.tree), see oci_response.OciResponse.
+        With a cache, repeated Get commands are answered from it, see
+        oci_cache. With a coalescer, list commands are merged with the
+        ones other callers send to the same target, see oci_coalesce.
+
         :param oci_command: OCI requests xml
-        :return: OCI response xml
+        :return: oci_response.OciResponse
+        :raise oci_response.OciError: On an Error response
         """
-        log.info(oci_command)
-        self.oci_command = oci_command
-        response = self.oci_soap.service.processOCIMessage(oci_command)
+        if isinstance(oci_command, _PendingCommand):
+            return self._batch.add(oci_command)
+        if isinstance(oci_command, ListCommand):
+            return self.coalescer.send((self.wsdl_url, self.username),
+                                       oci_command, self._send_command)
+        if self.cache is not None:
+            self.oci_command = oci_command
+            return self.cache.send((self.wsdl_url, self.username),
+                                   oci_command, self._send_checked)
+        return self._send_checked(oci_command)
+
+    def _send_command(self, command):
+        """Sends one "command" node, see _oci_command(), like _send()."""
+        return self._send(self._oci_document(command))
+
+    def _send_checked(self, oci_command):
+        response = self._process(oci_command)
         if response:
-            log.info(response)
-            response_cmd = Etree.fromstring(response).find('.//command')
-            if response_cmd is not None and response_cmd.get('type'):
-                assert response_cmd.get('type') != 'Error', \
-                    "Error response received\n" \
-                    "OCI Command: \n%s\n" \
-                    "OCI Response:\n%s\n" % (oci_command, response)
+            error = response.error
+            if error is not None:
+                error.command = oci_command
+                raise error
             return response
 
+    def batch(self, check=False, max_commands=15, coalesce=True):
+        """
+        Queue commands and send them in one OCI-P document:
+
+            with oci.batch() as batch:
+                oci.group_access_device_delete('dev1')
+                r = oci.group_access_device_delete('dev2')
+            if r.error: ...
+
+        Inside the 'with' block command methods return an OciCommandResult
+        instead of the response. Only methods which do not need the response
+        themselves can be batched. BroadWorks executes the commands of a
+        document in order, but a failing command does not stop the others:
+        a command which must not run when another one fails (e.g. attaching
+        a user to a device being added) belongs in a later batch.
+        Nested batches are merged into the outermost one. Single item list
+        commands of the same target are merged into one command, see
+        OciBatch.add().
+
+        :param check: When 'True' raises AssertionError after sending if any
+                      of the commands failed
+        :param max_commands: Maximum number of commands per OCI-P document.
+                             Larger batches are sent as several documents.
+        :param coalesce: When 'False' list commands are not merged
+        :return: OciBatch context manager
+        """
+        if self._batch is not None:
+            return _NestedBatch(self._batch)
+        return OciBatch(self, check, max_commands, coalesce)
+
     def authentication_request(self):
         """
         Authenticates (AuthenticationRequest) user. First step in OCI-P
@@ -140,8 +291,7 @@ class OciClient:
         """
         response = self._send(self._oci_xml('AuthenticationRequest',
                                             {'userId': self.username}))
-        parsed_response = Etree.fromstring(response)
-        self.nonce = parsed_response.find('.//nonce').text
+        self.nonce = response.tree.find('.//nonce').text
         return response
 
     def login_request(self):
@@ -156,12 +306,23 @@ class OciClient:
                                                          self.nonce)}
         response = self._send(self._oci_xml('LoginRequest14sp4',
                                             admin_username, signed_password))
-        parsed_response = Etree.fromstring(response)
         self.service_provider = \
-            parsed_response.findtext('.//serviceProviderId')
-        self.group = parsed_response.findtext('.//groupId')
+            response.tree.findtext('.//serviceProviderId')
+        self.group = response.tree.findtext('.//groupId')
         return response
 
+    def relogin(self):
+        """
+        Runs the two phase authentication again for the current session id.
+        Used when BroadWorks reports that the session is no longer valid.
+        """
+        self._logging_in = True
+        try:
+            self.authentication_request()
+            self.login_request()
+        finally:
+            self._logging_in = False
+
     def logout_request(self):
         admin_username = {'userId': self.username}
         return self._send(self._oci_xml('LogoutRequest',
@@ -174,17 +335,8 @@ class OciClient:
 
     def user_get_assigned_services(self, user_id):
         user = {'userId': user_id}
-        services = {}
-        parsed_response = Etree.fromstring(
-                self._send(
-                        self._oci_xml('UserServiceGetAssignmentListRequest',
-                                      user)))
-        services_table = parsed_response.find(
-                './/userServicesAssignmentTable')
-        rows = services_table.findall('row')
-        for row in rows:
-            services[row[0].text] = row[1].text.lower() == 'true'
-        return services
+        return _assigned_services(self._send(
+                self._oci_xml('UserServiceGetAssignmentListRequest', user)))
 
     def user_assign_service(self, user_id, *services):
         user = {'userId': user_id}
@@ -206,13 +358,7 @@ class OciClient:
         user = {'userId': user_id}
         response = self._send(self._oci_xml(
                 'UserSecurityClassificationGetRequest', user))
-        parsed_response = Etree.fromstring(response)
-        sec_clas_elem = parsed_response.find('.//securityClassification')
-        if sec_clas_elem is not None:
-            ret = sec_clas_elem.text
-        else:
-            ret = "Unclassified"
-        return ret
+        return _security_classification(response.tree)
 
     def user_set_security_classification(self, user_id, security_level):
         user = {'userId': user_id}
@@ -252,15 +398,11 @@ class OciClient:
         )
 
     def group_device_get_custom_tags(self, device_name, **kwargs):
-        ret = {}
         device = {'deviceName': device_name}
-        etree = Etree.fromstring(self._group_requests(
+        response = self._group_requests(
                 'GroupAccessDeviceCustomTagGetListRequest',
-                device, **kwargs))
-        for row in etree.findall('.//row'):
-            cols = [e.text for e in row.findall('col')]
-            ret[cols[0]] = cols[1]
-        return ret
+                device, **kwargs)
+        return decode_table(response).mapping('Tag Name', 'Tag Value')
 
     def group_device_add_custom_tag(self, device_name, tag, value, **kwargs):
         device = {'deviceName': device_name}
@@ -270,6 +412,15 @@ class OciClient:
                 'GroupAccessDeviceCustomTagAddRequest', device, tag, value,
                 **kwargs)
 
+    def group_device_modify_custom_tag(self, device_name, tag, value,
+                                       **kwargs):
+        device = {'deviceName': device_name}
+        tag = {'tagName': tag}
+        value = {'tagValue': value_to_str(value)}
+        return self._group_requests(
+                'GroupAccessDeviceCustomTagModifyRequest', device, tag, value,
+                **kwargs)
+
     def group_device_delete_custom_tag(self, device_name, tag, **kwargs):
         device = {'deviceName': device_name}
         tag = {'tagName': tag}
@@ -293,12 +444,60 @@ class OciClient:
             'GroupAccessDeviceFileModifyRequest14sp8', *args,
             **kwargs)
 
+    def group_device_upload_config_file(
+            self, device_name, source, file_format="config.xml",
+            extended_capture=False, chunk_size=3 * 65536, **kwargs):
+        """
+        Uploads a custom config file of any size. Unlike
+        group_device_modify_config_file() the file is base64 encoded chunk
+        by chunk while the request is sent, so memory use does not grow
+        with the file size (except over suds, which needs the whole
+        request as one string). It can not be batched or cached.
+
+        :param source: Path or seekable file object of the file content
+        :param chunk_size: Bytes encoded at a time, a multiple of 3
+        :param kwargs: See _group_requests() for documentation
+        """
+        assert self._batch is None, "Uploads can not be batched"
+        command = self._oci_command(
+            'GroupAccessDeviceFileModifyRequest14sp8',
+            {'serviceProviderId': kwargs.get('service_provider_id',
+                                             self.service_provider)},
+            {'groupId': kwargs.get('group_id', self.group)},
+            {'deviceName': device_name},
+            {'fileFormat': file_format},
+            {'fileSource': 'Custom'},
+            {'uploadFile': None},
+            {'fileContent': _UPLOAD_MARKER, 'parent': 'uploadFile'},
+            {'extendedCaptureEnabled': value_to_str(extended_capture)})
+        head, tail = self._oci_document(command).split(_UPLOAD_MARKER)
+        document = StreamedDocument(head, source, tail, chunk_size)
+        try:
+            return self._send_checked(document)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate_document(head + tail)
+
     def group_device_rebuild_config_file(self, device_name, **kwargs):
         device = {'deviceName': device_name}
         return self._group_requests(
                 'GroupCPEConfigRebuildDeviceConfigFileRequest', device,
                 **kwargs)
 
+    def group_rebuild_config_files(self, device_type=None, force=False,
+                                   **kwargs):
+        """
+        Rebuilds the config files of all devices of the group, or of the
+        devices of one type, in one command
+        (GroupCPEConfigRebuildConfigFileRequest).
+        """
+        args = []
+        if device_type:
+            args.append({'deviceType': device_type})
+        args.append({'force': value_to_str(force)})
+        return self._group_requests(
+                'GroupCPEConfigRebuildConfigFileRequest', *args, **kwargs)
+
     def user_add(self, user_id, last_name, first_name, password,
                  clid_last_name=None, clid_first_name=None,
                  phone_number=None, **kwargs):
@@ -306,38 +505,41 @@ class OciClient:
             clid_last_name = last_name
         if not clid_first_name:
             clid_first_name = first_name
-        if not phone_number:
-            phone_number = self.group_get_available_numbers(**kwargs)[0]
-        extension = phone_number[-4:]
-        self._group_requests('UserAddRequest17sp4',
-                             {'userId': user_id},
-                             {'lastName': last_name},
-                             {'firstName': first_name},
-                             {'callingLineIdLastName': clid_last_name},
-                             {'callingLineIdFirstName': clid_first_name},
-                             {'phoneNumber': phone_number},
-                             {'extension': extension},
-                             {'password': password},
-                             **kwargs)
+        with self.reserve_number(phone_number, **kwargs) as phone_number:
+            self._user_add_request(user_id, last_name, first_name, password,
+                                   clid_last_name, clid_first_name,
+                                   phone_number, **kwargs)
         added_user = self.user_get_data(user_id)
         log.info("Added a new user:\n%s" % added_user)
         return added_user
 
+    def _user_add_request(self, user_id, last_name, first_name, password,
+                          clid_last_name, clid_first_name, phone_number,
+                          **kwargs):
+        extension = phone_number[-4:]
+        return self._group_requests('UserAddRequest17sp4',
+                                    {'userId': user_id},
+                                    {'lastName': last_name},
+                                    {'firstName': first_name},
+                                    {'callingLineIdLastName': clid_last_name},
+                                    {'callingLineIdFirstName':
+                                     clid_first_name},
+                                    {'phoneNumber': phone_number},
+                                    {'extension': extension},
+                                    {'password': password},
+                                    **kwargs)
+
     def user_get(self, user_id):
         user = {'userId': user_id}
         return self._send(self._oci_xml('UserGetRequest21', user))
 
     def user_get_data(self, user_id):
-        user_data = Etree.fromstring(self.user_get(user_id))
-        ret = {'userId': user_id}
-        for field in _user_data_field_names():
-            value = user_data.findtext('.//%s' % field)
-            if value is not None:
-                ret[field] = value
-        return ret
+        return _user_data(user_id, self.user_get(user_id).tree)
 
     def user_get_primary_device(self, user_id):
-        user_data = Etree.fromstring(self.user_get(user_id))
+        return self._primary_device(self.user_get(user_id).tree)
+
+    def _primary_device(self, user_data):
         end_point = user_data.find('.//accessDeviceEndpoint')
         if end_point is not None:
             lp = end_point.findtext('linePort')
@@ -349,6 +551,50 @@ class OciClient:
         else:
             return None
 
+    def user_snapshot(self, user_id):
+        """
+        Reads everything about a user: data, primary device, SCA devices,
+        assigned services, security classification and network
+        conferencing. The user commands go in one OCI-P document, which
+        BroadWorks runs one command after the other but answers in a single
+        round trip, so this takes two round trips (the second reads the
+        primary device) instead of seven.
+
+        :return: UserSnapshot. Facets which could not be read are None
+                 and their errors are listed in UserSnapshot.errors.
+        """
+        start = time.time()
+        user = {'userId': user_id}
+        with self.batch():
+            results = [(facet, self._send(self._oci_xml(cmd, user)))
+                       for facet, cmd in _SNAPSHOT_COMMANDS]
+        snapshot = UserSnapshot(user_id)
+        for facet, result in results:
+            if not result.ok:
+                snapshot.errors[facet] = result.error
+                continue
+            if facet == 'data':
+                snapshot.data = _user_data(user_id, result.response)
+                try:
+                    snapshot.primary_device = self._primary_device(
+                        result.response)
+                except AssertionError as e:
+                    snapshot.errors['primary_device'] = \
+                        getattr(e, 'summary', None) or str(e)
+            elif facet == 'sca_devices':
+                snapshot.sca_devices = list(
+                    decode_table(result, 'endpointTable').dicts())
+            elif facet == 'services':
+                snapshot.services = _assigned_services(result)
+            elif facet == 'security_classification':
+                snapshot.security_classification = \
+                    _security_classification(result.response)
+            else:
+                snapshot.network_conferencing = dict(
+                    (e.tag, e.text) for e in result.response)
+        snapshot.elapsed = time.time() - start
+        return snapshot
+
     def user_delete(self, user_id):
         self._send(self._oci_xml('UserDeleteRequest', {'userId': user_id}))
         log.info("User '%s' deleted." % user_id)
@@ -359,16 +605,54 @@ class OciClient:
                               {'userId': user_id},
                               {'isActive': is_activate}))
 
-    def group_get_available_numbers(self, **kwargs):
+    def group_get_available_numbers(self, limit=None, search=None,
+                                    **kwargs):
+        """
+        Returns the available phone numbers of the group.
+
+        :param limit: Optional maximum number of numbers
+        :param search: Optional list of oci_search.SearchCriteria the
+                       numbers must match. GroupDnGetAvailableListRequest
+                       takes neither, they are applied while the response
+                       is read.
+        :param kwargs: See _group_requests() for documentation
+        """
         response = self._group_requests(
                 'GroupDnGetAvailableListRequest', **kwargs)
-        parsed_response = Etree.fromstring(response)
-        dn_list = []
-        for item in parsed_response.findall('.//phoneNumber'):
-            dn_list.append(item.text)
+        dn_list = list(matching(iter_texts(response, 'phoneNumber'), search,
+                                limit))
         log.info("Available numbers: %s" % dn_list)
         return dn_list
 
+    def number_pool(self, **kwargs):
+        """
+        Returns the shared oci_numbers.NumberPool of the group.
+
+        :param kwargs: See _group_requests() for documentation
+        """
+        return number_pools.get(
+            (self.wsdl_url,
+             kwargs.get('service_provider_id', self.service_provider),
+             kwargs.get('group_id', self.group)))
+
+    @contextmanager
+    def reserve_number(self, phone_number=None, **kwargs):
+        """
+        Context manager handing out an available number of the group,
+        which no other reservation gets. The number is given back to the
+        pool when the block fails. See oci_numbers.NumberPool.
+
+        :param phone_number: When given, this number is used as is
+        :param kwargs: See _group_requests() for documentation
+        """
+        if phone_number:
+            yield phone_number
+            return
+        pool = self.number_pool(**kwargs)
+        with pool.reservation(
+                lambda: self.group_get_available_numbers(**kwargs)) as dn:
+            yield dn
+
     def activate_number(self, phone_number, **kwargs):
         log.info("Activate number %s" % phone_number)
         return self._group_requests(
@@ -391,10 +675,9 @@ class OciClient:
                                     **kwargs)
 
     def group_access_device_get(self, device_name, **kwargs):
-        response = Etree.fromstring(
-                 self._group_requests('GroupAccessDeviceGetRequest18sp1',
-                                      {'deviceName': device_name},
-                                      **kwargs))
+        response = self._group_requests('GroupAccessDeviceGetRequest18sp1',
+                                        {'deviceName': device_name},
+                                        **kwargs).tree
         return {'device_type': response.findtext('.//deviceType'),
                 'user_name': response.findtext('.//userName')}
 
@@ -489,20 +772,19 @@ class OciClient:
         Returns list of devices provisioned for given user as Shared
         Call Appearance devices.
         """
-        ret = []
-        response = Etree.fromstring(self._send(self._oci_xml(
+        return list(self.user_get_sca_table(user_id).dicts())
+
+    def user_get_sca_table(self, user_id):
+        """
+        Returns the Shared Call Appearance devices of given user as an
+        oci_tables.OciTable with columns 'Device Name', 'Device Type',
+        'Line/Port', ...
+        """
+        response = self._send(self._oci_xml(
                 'UserSharedCallAppearanceGetRequest16sp2',
-                {'userId': user_id})))
-        keys = [h.text for h in response.findall('.//colHeading')]
-        rows = response.findall('.//row')
-        for row in rows:
-            device = {}
-            values = [t.text for t in row.findall('col')]
-            for i in range(len(values)):
-                device[keys[i]] = values[i]
-            ret.append(device)
-        log.info("User '%s' SCA Devices:" % user_id)
-        log.info(ret)
+                {'userId': user_id}))
+        ret = decode_table(response, 'endpointTable')
+        log.info("User '%s' SCA Devices: %s" % (user_id, ret))
         return ret
 
     def user_delete_all_sca_devices(self, user_id, **kwargs):
@@ -510,13 +792,14 @@ class OciClient:
         Removes all devices provisioned for given user as Shared
         Call Appearance devices. Also delete access devices.
         """
-        sca_devices = self.user_get_sca_list(user_id)
-        for sca_device in sca_devices:
-            self.user_sca_endpoint_delete(user_id,
-                                          sca_device['Device Name'],
-                                          sca_device['Line/Port'])
-            self.group_access_device_delete(sca_device['Device Name'],
-                                            **kwargs)
+        sca_devices = self.user_get_sca_table(user_id)
+        with self.batch(check=True):
+            self._delete_sca_devices(user_id, sca_devices, **kwargs)
+
+    def _delete_sca_devices(self, user_id, sca_devices, **kwargs):
+        for name, line_port in sca_devices.rows('Device Name', 'Line/Port'):
+            self.user_sca_endpoint_delete(user_id, name, line_port)
+            self.group_access_device_delete(name, **kwargs)
 
     def user_primary_endpoint_add(self, user_id, access_device, line_port):
         log.info("Add Primary Endpoint. User: %s, Access Device: %s, "
@@ -550,17 +833,49 @@ class OciClient:
     def user_delete_all_devices(self, user_id, **kwargs):
         log.info("Deleting all devices of '%s'" % user_id)
         primary_device = self.user_get_primary_device(user_id)
+        sca_devices = self.user_get_sca_table(user_id)
+        with self.batch(check=True):
+            if primary_device is not None:
+                self.user_primary_endpoint_delete(user_id)
+                self.group_access_device_delete(
+                        primary_device['device_name'], **kwargs)
+            self._delete_sca_devices(user_id, sca_devices, **kwargs)
+
+    def user_delete_all_devices_workflow(self, user_id, **kwargs):
+        """
+        user_delete_all_devices() as an oci_workflow.Workflow. The current
+        devices are looked up when the workflow is built. Each device is
+        detached from the user and then deleted, independently of the other
+        devices.
+
+        :return: oci_workflow.Workflow
+        """
+        flow = Workflow()
+        primary_device = self.user_get_primary_device(user_id)
         if primary_device is not None:
-            self.user_primary_endpoint_delete(user_id)
-            self.group_access_device_delete(
-                    primary_device['device_name'], **kwargs)
-        self.user_delete_all_sca_devices(user_id, **kwargs)
+            name = primary_device['device_name']
+            flow.add('delete device %s' % name, 'group_access_device_delete',
+                     (name,), kwargs,
+                     after=[flow.add('delete primary endpoint %s' % user_id,
+                                     'user_primary_endpoint_delete',
+                                     (user_id,))])
+        sca_devices = self.user_get_sca_table(user_id)
+        for name, line_port in sca_devices.rows('Device Name', 'Line/Port'):
+            flow.add('delete device %s' % name, 'group_access_device_delete',
+                     (name,), kwargs,
+                     after=[flow.add('delete sca endpoint %s' % name,
+                                     'user_sca_endpoint_delete',
+                                     (user_id, name, line_port))])
+        return flow
 
     def provision_user_with_devices(self, user_id, primary_device_type=None,
-                                    sca_device_types=[], **kwargs):
+                                    sca_device_types=[], delete_existing=True,
+                                    **kwargs):
         """
         Provision given user with given Identity/Device Profile types
         Before provisioning new devices, removes user's all current devices.
+        All devices are added with one OCI-P document, and attached to the
+        user with a second one once they were all added.
 
         :param user_id: User to be provisioned
         :param primary_device_type: Identity/Device Profile Type name of
@@ -568,33 +883,69 @@ class OciClient:
         :param sca_device_types: List of Identity/Device Profile Type names
                                  of devices to be provisioned as Shared Call
                                  Appearance Devices.
+        :param delete_existing: When 'False' current devices are not
+                                looked up nor removed, e.g. for new users.
         :param kwargs: See _group_requests() for documentation
         """
-
-        def generate_device_prefix(dev_type):
-            initials = ''.join([w[0] for w in dev_type.lower().split(' ')])
-            rnd = random.randint(0, 100)
-            return '%s%s_' % (initials, rnd)
-
-        self.user_delete_all_devices(user_id, **kwargs)
-        domain = user_id.split('@')[-1]
-        userpart = user_id.split('@')[0]
-        if primary_device_type is not None:
-            prefix = generate_device_prefix(primary_device_type)
-            access_device = "%s%s" % (prefix, userpart)
-            line_port = "lp_%s%s@%s" % (prefix, userpart, domain)
-            self.group_access_device_add(access_device, primary_device_type,
+        if delete_existing:
+            self.user_delete_all_devices(user_id, **kwargs)
+        plan = _device_plan(user_id, primary_device_type, sca_device_types)
+        # BroadWorks runs every command of a document even when an earlier
+        # one failed. An endpoint added along with a device which already
+        # existed would attach the user to that other device.
+        with self.batch(check=True):
+            self._add_devices(plan, **kwargs)
+        with self.batch(check=True):
+            self._add_endpoints(user_id, plan)
+
+    def _add_devices(self, plan, **kwargs):
+        for _, device_type, access_device, _ in plan:
+            self.group_access_device_add(access_device, device_type,
                                          access_device,
                                          _bw_qualified_password(), **kwargs)
-            self.user_primary_endpoint_add(user_id, access_device, line_port)
-        for sca_device_type in sca_device_types:
-            prefix = generate_device_prefix(sca_device_type)
-            access_device = "%s%s" % (prefix, userpart)
-            line_port = "lp_%s%s@%s" % (prefix, userpart, domain)
-            self.group_access_device_add(access_device, sca_device_type,
-                                         access_device,
-                                         _bw_qualified_password(), **kwargs)
-            self.user_sca_endpoint_add(user_id, access_device, line_port)
+
+    def _add_endpoints(self, user_id, plan):
+        for primary, _, access_device, line_port in plan:
+            if primary:
+                self.user_primary_endpoint_add(user_id, access_device,
+                                               line_port)
+            else:
+                self.user_sca_endpoint_add(user_id, access_device, line_port)
+
+    def provision_user_with_devices_workflow(self, user_id,
+                                             primary_device_type=None,
+                                             sca_device_types=[],
+                                             delete_existing=True, **kwargs):
+        """
+        provision_user_with_devices() as an oci_workflow.Workflow. Each
+        device is added and then attached to the user independently of the
+        other devices, after the current devices have been removed.
+
+        Example:
+
+        flow = oci.provision_user_with_devices_workflow(user_id, ...)
+        flow.run(tools.create_async_oci_tool(...))
+
+        :return: oci_workflow.Workflow
+        """
+        flow = self.user_delete_all_devices_workflow(user_id, **kwargs) \
+            if delete_existing else Workflow()
+        deletions = [step.name for step in flow.steps]
+        for primary, device_type, access_device, line_port in \
+                _device_plan(user_id, primary_device_type, sca_device_types):
+            add = flow.add('add %s' % access_device, 'group_access_device_add',
+                           (access_device, device_type, access_device,
+                            _bw_qualified_password()), kwargs,
+                           after=deletions)
+            if primary:
+                flow.add('primary endpoint %s' % access_device,
+                         'user_primary_endpoint_add',
+                         (user_id, access_device, line_port), after=[add])
+            else:
+                flow.add('sca endpoint %s' % access_device,
+                         'user_sca_endpoint_add',
+                         (user_id, access_device, line_port), after=[add])
+        return flow
 
     def delete_user_and_devices(self, user_id, **kwargs):
         """
@@ -604,19 +955,128 @@ class OciClient:
         self.user_delete_all_devices(user_id, **kwargs)
         self.user_delete(user_id)
 
-    def group_get_assigned_domains(self, **kwargs):
+    def group_get_user_list(self, limit=None, search=None, **kwargs):
+        """
+        Returns the users of the group as a list of dicts with keys
+        'User Id', 'Last Name', 'First Name', 'Phone Number', ...
+
+        :param limit: Optional maximum number of users (responseSizeLimit)
+        :param search: Optional list of oci_search.SearchCriteria on the
+                       oci_search.USER_FIELDS, e.g.
+                       [starts_with('userId', 'test')]
+        :param kwargs: See _group_requests() for documentation
+        """
+        return list(self.group_get_user_table(limit=limit, search=search,
+                                              **kwargs).dicts())
+
+    def group_get_user_table(self, columns=None, limit=None, search=None,
+                             **kwargs):
+        """
+        Returns the users of the group as an oci_tables.OciTable.
+
+        :param columns: Optional headings of the columns to keep, e.g.
+                        ['User Id']
+        :param limit: See group_get_user_list()
+        :param search: See group_get_user_list()
+        :param kwargs: See _group_requests() for documentation
+        """
+        response = self._group_requests(
+            'UserGetListInGroupRequest',
+            *search_elements(USER_FIELDS, search, limit), **kwargs)
+        return decode_table(response, 'userTable', columns)
+
+    def iter_group_users(self, page_size=500, prefetch=True, limit=None,
+                         search=None, **kwargs):
+        """
+        Yields the users of the group as dicts with keys 'User Id',
+        'Last Name', 'First Name', 'Phone Number', ..., sorted by user id.
+        The list is read page by page in bounded memory, with
+        UserGetListInGroupPagedSortedListRequest, see
+        oci_paging.iter_pages().
+
+        The next page is fetched while the caller processes the current
+        one, on this client's session: other commands sent meanwhile wait
+        for the page request to complete.
+
+        :param limit: Optional maximum number of users
+        :param search: See group_get_user_list()
+        :param kwargs: See _group_requests() for documentation
+        """
+        return self._iter_group_list(
+            'UserGetListInGroupPagedSortedListRequest', 'userTable',
+            'sortByUserId', page_size, prefetch, limit,
+            criteria_elements(USER_FIELDS, search), kwargs)
+
+    def iter_group_devices(self, page_size=500, prefetch=True, limit=None,
+                           search=None, **kwargs):
+        """
+        Yields the access devices of the group as dicts with keys
+        'Device Name', 'Device Type', 'Net Address', 'MAC Address', ...,
+        sorted by device name, like iter_group_users()
+        (GroupAccessDeviceGetPagedSortedListRequest).
+
+        :param limit: Optional maximum number of devices
+        :param search: Optional list of oci_search.SearchCriteria on the
+                       oci_search.DEVICE_FIELDS
+        :param kwargs: See _group_requests() for documentation
+        """
+        return self._iter_group_list(
+            'GroupAccessDeviceGetPagedSortedListRequest', 'accessDeviceTable',
+            'sortByDeviceName', page_size, prefetch, limit,
+            criteria_elements(DEVICE_FIELDS, search), kwargs)
+
+    def _iter_group_list(self, cmd, table, sort_by, page_size, prefetch,
+                         limit, criteria, kwargs):
+        def _fetch(start, size):
+            # Built without _oci_xml(): pages are read outside of batches,
+            # and not kept in the cache
+            command = self._oci_command(
+                cmd,
+                {'serviceProviderId': kwargs.get('service_provider_id',
+                                                 self.service_provider)},
+                {'groupId': kwargs.get('group_id', self.group)},
+                {'responsePagingControl': None},
+                {'responseStartIndex': str(start),
+                 'parent': 'responsePagingControl'},
+                {'responsePageSize': str(size),
+                 'parent': 'responsePagingControl'},
+                {sort_by: None},
+                {'isAscending': 'true', 'parent': sort_by},
+                {'isCaseSensitive': 'false', 'parent': sort_by},
+                *criteria)
+            return decode_table(
+                self._send_checked(self._oci_document(command)), table)
+
+        if limit is not None:
+            if limit <= 0:
+                return
+            page_size = min(page_size, limit)
+        count = 0
+        for page in iter_pages(_fetch, page_size, prefetch):
+            for row in page.dicts():
+                yield row
+                count += 1
+                if count == limit:
+                    return
+
+    def group_get_assigned_domains(self, limit=None, search=None, **kwargs):
         """
         Returns a list of domains assigned to the group. Group's
         default domain is the first item on the returned list.
 
+        :param limit: Optional maximum number of domains, 1 gives the
+                      default domain only
+        :param search: Optional list of oci_search.SearchCriteria the
+                       domains must match. GroupDomainGetAssignedListRequest
+                       takes neither, they are applied to the response.
         :return: List of domains assigned to the group.
         """
-        response = Etree.fromstring(
-                self._group_requests('GroupDomainGetAssignedListRequest',
-                                     **kwargs))
+        response = self._group_requests('GroupDomainGetAssignedListRequest',
+                                        **kwargs).tree
         default_domain = response.findtext('.//groupDefaultDomain')
-        domains = [d.text for d in response.findall('.//domain')]
-        domains.insert(0, default_domain)
+        domains = [default_domain] + [d.text for d in
+                                      response.findall('.//domain')]
+        domains = list(matching(domains, search, limit))
         log.info("Available domains: '%s'" % domains)
         return domains
 
@@ -627,7 +1087,8 @@ class OciClient:
                                             'Business Communicator - Tablet',
                                             'Connect - Mobile',
                                             'Iris Messenger - Mobile'],
-                               clid_suffix='', **kwargs):
+                               clid_suffix='', domain=None, phone_number=None,
+                               **kwargs):
         """
         Create a new test user to default group in default enterprise. User
         is assigned a phone number which is also activated.
@@ -645,6 +1106,10 @@ class OciClient:
                                 devices are not provisioned.
         :param clid_suffix:     Optional string that is concatenated to
                                 user's CLID first and last names.
+        :param domain:          User's domain. Defaults to the group's
+                                default domain.
+        :param phone_number:    User's phone number. Defaults to a number
+                                reserved from the group's number pool.
 
         Example: Create user Alice Anderson with "Business Communicator - PC"
                  as primary device. No SCA devices assigned.
@@ -663,24 +1128,339 @@ class OciClient:
 
 
         """
-        domain = self.group_get_assigned_domains(**kwargs)[0]
-        user_part = ''.join([last_name, first_name]).lower().replace(' ', '')
-        user_id = '%s@%s' % (user_part, domain)
+        if domain is None:
+            domain = self.group_get_assigned_domains(limit=1, **kwargs)[0]
+        user_id = '%s@%s' % (ucone_user_part(first_name, last_name), domain)
         clid_last_name = "%s%s" % (last_name, clid_suffix)
         clid_first_name = "%s%s" % (first_name, clid_suffix)
-        dn = self.group_get_available_numbers(**kwargs)[0]
-        u = self.user_add(user_id, last_name, first_name, password,
-                          clid_last_name, clid_first_name, phone_number=dn,
-                          **kwargs)
-        self.activate_number(dn, **kwargs)
-        self.user_assign_service(user_id, "Integrated IMP")
-        self.activate_imp(user_id)
-        self.provision_user_with_devices(user_id, primary_device,
-                                         sca_devices, **kwargs)
-        self.user_sca_modify(user_id, allow_call_retrieve=True)
+        plan = _device_plan(user_id, primary_device, sca_devices)
+        # Only a failed UserAdd gives the number back to the pool, once
+        # added the user holds it whatever fails next
+        with self.reserve_number(phone_number, **kwargs) as dn:
+            # Sent on its own, as BroadWorks would run the commands batched
+            # with it even when the user already exists
+            self._user_add_request(user_id, last_name, first_name, password,
+                                   clid_last_name, clid_first_name, dn,
+                                   **kwargs)
+        # A shared coalescer merges the activation with the ones of other
+        # users created meanwhile, which a batch would send on its own
+        coalesce = self.coalescer is not None
+        if coalesce:
+            self.activate_number(dn, **kwargs)
+        # The new user has no devices, so the rest goes out in two
+        # documents: the devices, then their endpoints (see
+        # provision_user_with_devices())
+        with self.batch(check=True):
+            if not coalesce:
+                self.activate_number(dn, **kwargs)
+            self.user_assign_service(user_id, "Integrated IMP")
+            self.activate_imp(user_id)
+            self._add_devices(plan, **kwargs)
+        with self.batch(check=True):
+            self._add_endpoints(user_id, plan)
+            self.user_sca_modify(user_id, allow_call_retrieve=True)
+        u = self.user_get_data(user_id)
+        log.info("Added a new user:\n%s" % u)
         return u
 
 
+class _PendingCommand(object):
+    """A command generated inside OciClient.batch(), waiting to be sent."""
+
+    def __init__(self, cmd, xml, merge=None):
+        self.cmd = cmd
+        self.xml = xml
+        # oci_coalesce.ListCommand of list commands which can be merged
+        self.merge = merge
+
+
+class OciCommandResult(object):
+    """
+    Outcome of one batched command, available once the batch is sent.
+
+    :ivar cmd: OCI-P command type
+    :ivar response: Response "command" element
+    :ivar error: Error summary if the command failed, otherwise None
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.response = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.response is not None and self.error is None
+
+    @property
+    def parsed(self):
+        """The response element, like oci_response.OciResponse.parsed."""
+        return self.response
+
+    def __str__(self):
+        if self.response is None:
+            return "%s: %s" % (self.cmd, self.error or "not sent")
+        return Etree.tostring(self.response)
+
+
+class OciBatch(object):
+    """
+    Commands queued by OciClient.batch(). Sent when the 'with' block exits
+    or when send() is called.
+    """
+
+    def __init__(self, client, check=False, max_commands=15, coalesce=True):
+        self.client = client
+        self.check = check
+        self.max_commands = max_commands
+        self.coalesce = coalesce
+        self.results = []
+        self._pending = []
+
+    def __enter__(self):
+        self.client._batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.client._batch = None
+        if exc_type is not None:
+            self._pending = []
+            return False
+        self.send()
+        if self.check:
+            self.assert_ok()
+        return False
+
+    def add(self, command):
+        """
+        Queues a command. A list command (see oci_coalesce) is merged into
+        the queued command of the same type and target, unless a command
+        queued after that one names the same user, group or device.
+        """
+        result = OciCommandResult(command.cmd)
+        self.results.append(result)
+        if self.coalesce and command.merge is not None:
+            merged = self._merge_target(command.merge)
+            if merged is not None:
+                merged.add(command.merge, result)
+                return result
+            command = Coalesced(command.merge, result)
+        self._pending.append((command, result))
+        return result
+
+    def _merge_target(self, list_command):
+        for command, _ in reversed(self._pending):
+            if isinstance(command, Coalesced) and \
+                    command.key == list_command.key:
+                return command
+            if list_command.names(command.xml):
+                return None
+        return None
+
+    def send(self):
+        """Sends the queued commands. Returns the results of all commands."""
+        batch, self.client._batch = self.client._batch, None
+        try:
+            while self._pending:
+                chunk = self._pending[:self.max_commands]
+                self._pending = self._pending[self.max_commands:]
+                self._send_chunk(chunk)
+        finally:
+            self.client._batch = batch
+        return self.results
+
+    def _send_chunk(self, chunk):
+        document = self.client._oci_document(*[c.xml for c, _ in chunk])
+        try:
+            response = self.client._process(document)
+        finally:
+            if self.client.cache is not None:
+                self.client.cache.invalidate_document(document)
+        commands = response.tree.findall('command') if response else []
+        for i, (command, result) in enumerate(chunk):
+            response = commands[i] if i < len(commands) else None
+            if isinstance(command, Coalesced):
+                self._split(command, response)
+            else:
+                _set_result(result, response)
+
+    def _split(self, merged, response):
+        """Gives the callers of a merged list command their outcome."""
+        if len(merged.parts) == 1 or response is None or \
+                response.get('type') != 'Error':
+            for _, result in merged.parts:
+                _set_result(result, response)
+            return
+        # Find out whose items failed
+        for command, result in merged.parts:
+            document = self.client._oci_document(command.xml)
+            try:
+                response = self.client._process(document)
+            finally:
+                if self.client.cache is not None:
+                    self.client.cache.invalidate_document(document)
+            _set_result(result, response.tree.find('command')
+                        if response else None)
+
+    @property
+    def errors(self):
+        return [r for r in self.results if r.error is not None]
+
+    def assert_ok(self):
+        errors = self.errors
+        assert not errors, "%d of %d batched OCI commands failed:\n%s" % \
+            (len(errors), len(self.results),
+             "\n".join("%s: %s" % (r.cmd, r.error) for r in errors))
+
+
+def _set_result(result, response):
+    """Fills in an OciCommandResult from its response "command" element."""
+    if response is None:
+        result.error = "No response received"
+        return
+    result.response = response
+    if response.get('type') == 'Error':
+        result.error = response.findtext('summary') or 'Error'
+
+
+class _NestedBatch(object):
+    """batch() called inside a batch: commands join the outer batch."""
+
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __enter__(self):
+        return self.batch
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+def ucone_user_part(first_name, last_name):
+    """User part of the user id create_ucone_test_user() gives a user."""
+    return ''.join([last_name, first_name]).lower().replace(' ', '')
+
+
+def _device_plan(user_id, primary_device_type, sca_device_types):
+    """
+    Names the devices provision_user_with_devices() creates.
+
+    :return: List of (is primary, device type, access device name,
+             line port)
+    """
+
+    def generate_device_prefix(dev_type):
+        initials = ''.join([w[0] for w in dev_type.lower().split(' ')])
+        rnd = random.randint(0, 100)
+        return '%s%s_' % (initials, rnd)
+
+    domain = user_id.split('@')[-1]
+    userpart = user_id.split('@')[0]
+    devices = [(True, primary_device_type)] \
+        if primary_device_type is not None else []
+    devices.extend((False, t) for t in sca_device_types)
+    plan = []
+    for primary, device_type in devices:
+        prefix = generate_device_prefix(device_type)
+        plan.append((primary, device_type, "%s%s" % (prefix, userpart),
+                     "lp_%s%s@%s" % (prefix, userpart, domain)))
+    return plan
+
+
+class UserSnapshot(object):
+    """
+    Everything about a user, see OciClient.user_snapshot().
+
+    :ivar data: user_get_data() dict
+    :ivar primary_device: user_get_primary_device() dict or None
+    :ivar sca_devices: user_get_sca_list() list
+    :ivar services: user_get_assigned_services() dict
+    :ivar security_classification: user_get_security_classification()
+    :ivar network_conferencing: Fields of UserNetworkConferencingGetResponse
+    :ivar errors: {facet: error summary} of the facets not read
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.data = None
+        self.primary_device = None
+        self.sca_devices = None
+        self.services = None
+        self.security_classification = None
+        self.network_conferencing = None
+        self.errors = {}
+        self.elapsed = None
+
+    def to_dict(self):
+        return {'userId': self.user_id, 'data': self.data,
+                'primaryDevice': self.primary_device,
+                'scaDevices': self.sca_devices, 'services': self.services,
+                'securityClassification': self.security_classification,
+                'networkConferencing': self.network_conferencing,
+                'errors': self.errors}
+
+    def __str__(self):
+        lines = ["User %s" % self.user_id]
+        for name, value in sorted((self.data or {}).iteritems()):
+            lines.append("  %-24s %s" % (name, value))
+        lines.append("Primary device")
+        for name, value in sorted((self.primary_device or {}).iteritems()):
+            lines.append("  %-24s %s" % (name, value))
+        lines.append("SCA devices")
+        for device in self.sca_devices or []:
+            lines.append("  %s (%s) %s" % (device.get('Device Name'),
+                                           device.get('Device Type'),
+                                           device.get('Line/Port')))
+        lines.append("Assigned services")
+        lines.extend("  %s" % name for name, assigned in
+                     sorted((self.services or {}).iteritems()) if assigned)
+        lines.append("Security classification")
+        lines.append("  %s" % self.security_classification)
+        lines.append("Network conferencing")
+        for name, value in sorted(
+                (self.network_conferencing or {}).iteritems()):
+            lines.append("  %-24s %s" % (name, value))
+        if self.errors:
+            lines.append("Errors")
+            lines.extend("  %s: %s" % kv for kv in sorted(
+                self.errors.iteritems()))
+        if self.elapsed is not None:
+            lines.append("Read in %.3fs" % self.elapsed)
+        return "\n".join(lines)
+
+
+# (UserSnapshot facet, OCI-P command) read by OciClient.user_snapshot()
+_SNAPSHOT_COMMANDS = [
+    ('data', 'UserGetRequest21'),
+    ('sca_devices', 'UserSharedCallAppearanceGetRequest16sp2'),
+    ('services', 'UserServiceGetAssignmentListRequest'),
+    ('security_classification', 'UserSecurityClassificationGetRequest'),
+    ('network_conferencing', 'UserNetworkConferencingGetRequest')]
+
+
+def _user_data(user_id, user_data):
+    """user_get_data() dict from a UserGetResponse21 element."""
+    ret = {'userId': user_id}
+    for field in _user_data_field_names():
+        value = user_data.findtext('.//%s' % field)
+        if value is not None:
+            ret[field] = value
+    return ret
+
+
+def _assigned_services(response):
+    table = decode_table(response, 'userServicesAssignmentTable')
+    return dict((name, assigned.lower() == 'true')
+                for name, assigned in table.rows('Service Name', 'Assigned'))
+
+
+def _security_classification(response):
+    sec_clas_elem = response.find('.//securityClassification')
+    if sec_clas_elem is not None:
+        return sec_clas_elem.text
+    return "Unclassified"
+
+
 def _user_data_field_names():
     return ['serviceProviderId', 'groupId', 'userId', 'lastName',
             'firstName', 'callingLineIdLastName',
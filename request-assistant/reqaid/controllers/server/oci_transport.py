@@ -0,0 +1,424 @@
+"""
+Transports carrying OCI-P documents to BroadWorks.
+
+A transport has a single method, process(oci_command), which takes an OCI
+request document and returns the OCI response document.
+
+- SudsTransport calls processOCIMessage through a suds Client built from
+  the ProvisioningService WSDL.
+- RawSoapTransport posts a precomputed SOAP envelope over a keep-alive
+  HTTP connection pool and slices the OCI response out of the reply
+  without a SOAP library. It needs no WSDL and falls back to suds when no
+  connection to the XSP can be opened.
+- TcpTransport speaks native OCI-P: the XML documents are written to one
+  persistent TCP (optionally TLS) connection to the BroadWorks OCI-P port,
+  without HTTP or SOAP at all.
+
+A document may also be a StreamedDocument, whose base64 payload is
+encoded from a file while it is sent. RawSoapTransport and TcpTransport
+send it chunk by chunk, in bounded memory; suds needs it as one string.
+"""
+import os
+import re
+import ssl
+import base64
+import select
+import socket
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+from xml.sax.saxutils import escape
+from suds.client import Client
+
+log = logging.getLogger(__name__)
+
+_ENVELOPE_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<SOAP-ENV:Envelope'
+    ' xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"'
+    ' xmlns:ns0="urn:com:broadsoft:webservice"'
+    ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' SOAP-ENV:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    '<SOAP-ENV:Body><ns0:processOCIMessage>'
+    '<in0 xsi:type="xsd:string">')
+_ENVELOPE_TAIL = (
+    '</in0></ns0:processOCIMessage></SOAP-ENV:Body></SOAP-ENV:Envelope>')
+_HEADERS = {"Content-Type": "text/xml; charset=utf-8",
+            "SOAPAction": '""'}
+
+_RETURN = re.compile(r'<(?:\w+:)?processOCIMessageReturn\b[^>]*>(.*?)'
+                     r'</(?:\w+:)?processOCIMessageReturn>', re.DOTALL)
+_FAULT = re.compile(r'<faultstring>(.*?)</faultstring>', re.DOTALL)
+_ENTITY = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|lt|gt|amp|quot|apos);')
+_ENTITIES = {'lt': u'<', 'gt': u'>', 'amp': u'&', 'quot': u'"', 'apos': u"'"}
+
+
+def _unescape_entity(match):
+    name = match.group(1)
+    if name.startswith('#x'):
+        return unichr(int(name[2:], 16))
+    if name.startswith('#'):
+        return unichr(int(name[1:]))
+    return _ENTITIES[name]
+
+
+def soap_envelope(oci_command):
+    """Returns the processOCIMessage SOAP request for an OCI document."""
+    return _ENVELOPE_HEAD + escape(oci_command) + _ENVELOPE_TAIL
+
+
+def oci_response(envelope):
+    """
+    Returns the OCI document carried by a processOCIMessage SOAP response.
+
+    :param envelope: SOAP response body (utf-8 bytes)
+    :return: OCI response document as unicode, like suds returns it
+    """
+    text = envelope.decode('utf-8') if isinstance(envelope, str) \
+        else envelope
+    m = _RETURN.search(text)
+    if m is None:
+        fault = _FAULT.search(text)
+        raise ValueError("No processOCIMessageReturn in SOAP response%s" %
+                         (": %s" % fault.group(1) if fault else ""))
+    return _ENTITY.sub(_unescape_entity, m.group(1))
+
+
+class StreamedDocument(object):
+    """
+    OCI request document carrying the content of a file as base64 text:
+    'head', the base64 encoded file, 'tail'. Iterating it reads and encodes
+    the file chunk by chunk, from its start on every iteration, so that
+    the document can be sent again.
+    """
+
+    def __init__(self, head, source, tail, chunk_size=3 * 65536):
+        """
+        :param head: Document text before the base64 content
+        :param source: Path or seekable file object of the content
+        :param tail: Document text after the base64 content
+        :param chunk_size: Bytes of the file encoded at a time, a multiple
+                           of 3 so that chunks need no padding
+        """
+        assert chunk_size % 3 == 0, "chunk_size must be a multiple of 3"
+        self.head = head
+        self.tail = tail
+        self.chunk_size = chunk_size
+        self._path = source if isinstance(source, basestring) else None
+        self._file = source if self._path is None else None
+        self._buffer = ''
+        self._iter = None
+
+    def wrap(self, head, tail):
+        """Returns a document of the same file, with another head and tail."""
+        return StreamedDocument(head, self._path or self._file, tail,
+                                self.chunk_size)
+
+    def encoded(self, encoding, errors='strict'):
+        """Returns a document whose head and tail are encoded bytes."""
+        return self.wrap(*[s.encode(encoding, errors)
+                           if isinstance(s, unicode) else s
+                           for s in (self.head, self.tail)])
+
+    def size(self):
+        """Size of the file in bytes."""
+        if self._path is not None:
+            return os.path.getsize(self._path)
+        position = self._file.tell()
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        self._file.seek(position)
+        return size
+
+    def __len__(self):
+        return len(self.head) + (self.size() + 2) // 3 * 4 + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        source = open(self._path, 'rb') if self._path is not None \
+            else self._file
+        try:
+            source.seek(0)
+            while True:
+                chunk = source.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+        finally:
+            if self._path is not None:
+                source.close()
+        yield self.tail
+
+    def read(self, size=-1):
+        """File like reading, e.g. for an HTTP request body."""
+        if self._iter is None:
+            self._iter = iter(self)
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._iter)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        if not data:
+            self._iter = None
+        return data
+
+    def getvalue(self):
+        """The whole document as one string. Not bounded in memory."""
+        return ''.join(self)
+
+    def count(self, sub):
+        """str.count() of the head and the tail, the content is base64."""
+        return self.head.count(sub) + self.tail.count(sub)
+
+    def __str__(self):
+        return '%s[%d bytes base64 encoded]%s' % (self.head, self.size(),
+                                                  self.tail)
+
+
+class SudsTransport(object):
+    """processOCIMessage through suds."""
+
+    def __init__(self, wsdl_url, location=None, wsdl_cache=None):
+        if wsdl_cache is not None:
+            self.client = wsdl_cache.client(wsdl_url, location)
+        else:
+            self.client = Client(wsdl_url, location=location)
+
+    def process(self, oci_command):
+        if isinstance(oci_command, StreamedDocument):
+            oci_command = oci_command.getvalue()
+        return self.client.service.processOCIMessage(oci_command)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _http_session(location, pool_size):
+    """
+    One requests.Session per service location, so that every client of
+    the same XSP shares the kept alive connections.
+    """
+    with _sessions_lock:
+        session = _sessions.get(location)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[location] = session
+        return session
+
+
+class RawSoapTransport(object):
+    """
+    processOCIMessage without suds: the request envelope is built by string
+    concatenation and the response is sliced out of the reply with a
+    regular expression.
+    """
+
+    def __init__(self, location, fallback=None, pool_size=10, timeout=60):
+        """
+        :param location: ProvisioningService url
+        :param fallback: Optional callable returning a transport (e.g. a
+                         SudsTransport) used when no connection can be
+                         opened. Called at most once, when first needed.
+        :param pool_size: Maximum number of kept alive connections
+        :param timeout: HTTP timeout in seconds
+        """
+        self.location = location
+        self.timeout = timeout
+        self.session = _http_session(location, pool_size)
+        self._fallback_factory = fallback
+        self._fallback = None
+
+    def process(self, oci_command):
+        if isinstance(oci_command, StreamedDocument):
+            # base64 text needs no escaping
+            envelope = oci_command.wrap(
+                _ENVELOPE_HEAD + escape(oci_command.head),
+                escape(oci_command.tail) + _ENVELOPE_TAIL).encoded('utf-8')
+        else:
+            envelope = soap_envelope(oci_command)
+        if isinstance(envelope, unicode):
+            envelope = envelope.encode('utf-8')
+        try:
+            r = self.session.post(self.location, data=envelope,
+                                  headers=_HEADERS, timeout=self.timeout)
+        except requests.ConnectionError as e:
+            # Only when nothing reached the XSP, once sent BroadWorks may
+            # have executed the command and it must not be sent twice
+            if self._fallback_factory is None or \
+                    isinstance(e, requests.Timeout) or not _not_connected(e):
+                raise
+            log.info("[RawSoapTransport] falling back to suds: %s" % e)
+            if self._fallback is None:
+                self._fallback = self._fallback_factory()
+            return self._fallback.process(oci_command)
+        return oci_response(r.content)
+
+
+def _not_connected(e):
+    """True when a requests error happened opening the connection."""
+    reason = getattr(e.args[0], 'reason', None) if e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+_DOCUMENT_END = '</BroadsoftDocument>'
+
+
+def recv_document(sock, pending=''):
+    """
+    Reads one OCI-P document from a native OCI-P connection. Documents are
+    not length prefixed, each one ends with its closing root tag.
+
+    :param sock: Connected socket
+    :param pending: Bytes already read from the socket after the previous
+                    document
+    :return: (document, bytes read after the document)
+    """
+    data = pending
+    start = 0
+    while True:
+        end = data.find(_DOCUMENT_END, start)
+        if end >= 0:
+            end += len(_DOCUMENT_END)
+            return data[:end], data[end:].lstrip()
+        start = max(0, len(data) - len(_DOCUMENT_END))
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise socket.error("OCI-P connection closed by peer")
+        data += chunk
+
+
+class TcpTransport(object):
+    """
+    Native OCI-P over one persistent TCP or TLS connection.
+
+    BroadWorks ties OCI-P sessions to the connection they were logged in
+    on. The connection is opened when the first document is sent and
+    reopened after a failure; the server then reports the session as not
+    logged in and OciClient logs in again (see OciClient.relogin()). A
+    document is sent again only when sending it failed on a connection the
+    server had dropped, never once it may have reached BroadWorks.
+    """
+
+    def __init__(self, host, port=2208, use_tls=False, ca_certs=None,
+                 timeout=60):
+        """
+        :param host: BroadWorks OCI-P host
+        :param port: OCI-P port. BroadWorks listens on 2208 for TCP and on
+                     2209 for TLS.
+        :param use_tls: When 'True' the connection is wrapped in TLS
+        :param ca_certs: CA bundle used to verify the server certificate.
+                         When not given the system CAs are used.
+        :param timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.ca_certs = ca_certs
+        self.timeout = timeout
+        self._sock = None
+        self._pending = ''
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.use_tls:
+            context = ssl.create_default_context(cafile=self.ca_certs)
+            sock = context.wrap_socket(sock, server_hostname=self.host)
+        log.debug("[TcpTransport] connected to %s:%s" % (self.host,
+                                                         self.port))
+        return sock
+
+    def process(self, oci_command):
+        if isinstance(oci_command, StreamedDocument):
+            oci_command = oci_command.encoded('ISO-8859-1',
+                                              'xmlcharrefreplace')
+        elif isinstance(oci_command, unicode):
+            oci_command = oci_command.encode('ISO-8859-1',
+                                             'xmlcharrefreplace')
+        with self._lock:
+            reconnected = self._sock is None
+            while True:
+                if self._sock is not None and self._stale():
+                    self._close()
+                if self._sock is None:
+                    self._sock = self._connect()
+                    self._pending = ''
+                try:
+                    self._send(oci_command)
+                    break
+                except socket.timeout:
+                    # The server may still execute the command, do not
+                    # send it twice
+                    self._close()
+                    raise
+                except (socket.error, ssl.SSLError) as e:
+                    # Sending on a connection the server dropped while it
+                    # was idle, the command did not reach BroadWorks
+                    self._close()
+                    if reconnected:
+                        raise
+                    log.info("[TcpTransport] reconnecting to %s:%s: %s" %
+                             (self.host, self.port, e))
+                    reconnected = True
+            try:
+                response, self._pending = recv_document(self._sock,
+                                                        self._pending)
+            except (socket.error, ssl.SSLError):
+                # The command was sent and may have been executed
+                self._close()
+                raise
+            return response
+
+    def _send(self, oci_command):
+        if isinstance(oci_command, StreamedDocument):
+            for chunk in oci_command:
+                self._sock.sendall(chunk)
+            self._sock.sendall('\n')
+        else:
+            self._sock.sendall(oci_command + '\n')
+
+    def _stale(self):
+        """
+        True when the idle connection was closed by the server. Nothing is
+        expected on it between documents, so readable means end of stream,
+        or with TLS possibly a record carrying no data (session tickets).
+        """
+        try:
+            if not select.select([self._sock], [], [], 0)[0]:
+                return False
+            if not self.use_tls:
+                return True
+            self._sock.settimeout(0)
+            try:
+                self._sock.recv(1)
+            except ssl.SSLWantReadError:
+                return False
+            finally:
+                self._sock.settimeout(self.timeout)
+        except (select.error, socket.error, ValueError):
+            pass
+        return True
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except socket.error:
+                pass
+        self._sock = None
+
+    def close(self):
+        """Closes the connection. The next document opens a new one."""
+        with self._lock:
+            self._close()
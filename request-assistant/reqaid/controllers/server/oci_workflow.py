@@ -0,0 +1,218 @@
+"""
+Workflows of OCI-P commands with explicit dependencies.
+
+A Workflow is a DAG of steps, each one an OciClient method call. Steps
+run as soon as the steps they depend on are done, independent steps
+concurrently when the workflow is run on an oci_async.AsyncOciClient:
+
+    flow = Workflow()
+    flow.add('dev', 'group_access_device_add', ('pc1_alice', ...))
+    flow.add('ep', 'user_sca_endpoint_add', ('alice@..', ...),
+             after=['dev'])
+    result = flow.run(async_oci)
+    print result.report()
+
+run(oci, dry_run=True) returns the plan without sending anything.
+"""
+import time
+import Queue
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class WorkflowStep(object):
+
+    def __init__(self, name, method, args, kwargs, after):
+        self.name = name
+        self.method = method
+        self.args = tuple(args)
+        self.kwargs = kwargs
+        self.after = list(after)
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.started = None
+        self.duration = None
+
+    def call(self, oci):
+        return getattr(oci, self.method)(*self.args, **self.kwargs)
+
+    def __str__(self):
+        args = [repr(a) for a in self.args] + \
+               ["%s=%r" % kv for kv in sorted(self.kwargs.iteritems())]
+        return "%s: %s(%s)" % (self.name, self.method, ", ".join(args))
+
+
+class WorkflowResult(object):
+
+    def __init__(self, steps, elapsed, dry_run=False):
+        self.steps = steps
+        self.elapsed = elapsed
+        self.dry_run = dry_run
+
+    @property
+    def ok(self):
+        return all(s.status in ('done', 'planned') for s in self.steps)
+
+    @property
+    def failed(self):
+        return [s for s in self.steps if s.status == 'failed']
+
+    def report(self):
+        """Returns per step status and timing as text."""
+        lines = []
+        for s in self.steps:
+            if s.duration is None:
+                lines.append("%-8s %s" % (s.status, s))
+            else:
+                lines.append("%-8s %s  [+%.3fs, %.3fs]" %
+                             (s.status, s, s.started, s.duration))
+            if s.error is not None:
+                lines.append("         %s" % s.error)
+        lines.append("%d steps in %.3fs" % (len(self.steps), self.elapsed))
+        return "\n".join(lines)
+
+
+class Workflow(object):
+    """DAG of OciClient method calls."""
+
+    def __init__(self):
+        self.steps = []
+        self._by_name = {}
+
+    def add(self, name, method, args=(), kwargs=None, after=()):
+        """
+        Adds a step.
+
+        :param name: Unique step name
+        :param method: OciClient method name
+        :param args: Positional arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :param after: Names of the steps which must be done before this one
+        :return: Step name
+        """
+        assert name not in self._by_name, "Duplicate step '%s'" % name
+        for dep in after:
+            assert dep in self._by_name, \
+                "Step '%s' depends on unknown step '%s'" % (name, dep)
+        step = WorkflowStep(name, method, args, kwargs or {}, after)
+        self.steps.append(step)
+        self._by_name[name] = step
+        return name
+
+    def include(self, flow, prefix=''):
+        """
+        Adds the steps of another workflow, with 'prefix' prepended to
+        their names.
+
+        :return: Names of the added steps
+        """
+        return [self.add(prefix + step.name, step.method, step.args,
+                         step.kwargs, [prefix + d for d in step.after])
+                for step in flow.steps]
+
+    def stages(self):
+        """
+        Returns the steps grouped in stages: each stage only depends on the
+        stages before it, and its steps can run concurrently.
+        """
+        level = {}
+        for step in self.steps:
+            level[step.name] = 1 + max([level[d] for d in step.after] or
+                                       [-1])
+        stages = [[] for _ in range(max(level.values() or [-1]) + 1)]
+        for step in self.steps:
+            stages[level[step.name]].append(step)
+        return stages
+
+    def describe(self):
+        """Returns the plan as text."""
+        lines = []
+        for i, stage in enumerate(self.stages()):
+            lines.append("Stage %d:" % (i + 1))
+            for step in stage:
+                lines.append("  %s%s" % (step, "  (after %s)" %
+                                         ", ".join(step.after)
+                                         if step.after else ""))
+        return "\n".join(lines)
+
+    def run(self, oci, dry_run=False):
+        """
+        Runs the workflow. Steps depending on a failed step are skipped,
+        the others still run.
+
+        :param oci: oci_async.AsyncOciClient, running ready steps
+                    concurrently, or OciClient, running them one by one
+        :param dry_run: When 'True' nothing is sent, the steps are only
+                        marked 'planned'
+        :return: WorkflowResult
+        """
+        start = time.time()
+        if dry_run:
+            log.info("[Workflow] plan:\n%s" % self.describe())
+            for step in self.steps:
+                step.status = 'planned'
+            return WorkflowResult(self.steps, 0, dry_run=True)
+        if hasattr(oci, 'submit'):
+            self._run_concurrently(oci, start)
+        else:
+            for stage in self.stages():
+                for step in stage:
+                    if self._runnable(step):
+                        _run_step(oci, step, start)
+        result = WorkflowResult(self.steps, time.time() - start)
+        log.info("[Workflow] %d steps in %.3fs, %d failed" %
+                 (len(self.steps), result.elapsed, len(result.failed)))
+        return result
+
+    def _runnable(self, step):
+        """Marks the step skipped when a dependency did not succeed."""
+        if all(self._by_name[d].status == 'done' for d in step.after):
+            return True
+        step.status = 'skipped'
+        return False
+
+    def _run_concurrently(self, oci, start):
+        done = Queue.Queue()
+        waiting = list(self.steps)
+        running = {}
+        while waiting or running:
+            for step in list(waiting):
+                if any(self._by_name[d].status in ('pending', 'running')
+                       for d in step.after):
+                    continue
+                waiting.remove(step)
+                if self._runnable(step):
+                    step.status = 'running'
+                    running[step.name] = oci.submit(_run_step, step, start,
+                                                    done)
+            if running:
+                try:
+                    running.pop(done.get(timeout=1).name)
+                except Queue.Empty:
+                    # The step did not even start, e.g. no session
+                    for name, r in running.items():
+                        if r.ready() and not r.successful():
+                            step = self._by_name[name]
+                            step.status = 'failed'
+                            try:
+                                r.get()
+                            except Exception as e:
+                                step.error = e
+                            del running[name]
+
+
+def _run_step(oci, step, start, done=None):
+    step.started = time.time() - start
+    try:
+        step.result = step.call(oci)
+        step.status = 'done'
+    except Exception as e:
+        log.error("[Workflow] %s failed: %s" % (step.name, e))
+        step.error = e
+        step.status = 'failed'
+    finally:
+        step.duration = time.time() - start - step.started
+        if done is not None:
+            done.put(step)
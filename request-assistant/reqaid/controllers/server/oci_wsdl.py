@@ -0,0 +1,175 @@
+"""
+On-disk cache of the OCI-P ProvisioningService WSDL and of the service
+definition suds parses from it.
+
+Layout of the cache directory:
+
+    <directory>/<version>/objects/              pickled suds definitions
+    <directory>/<version>/<sha1(wsdl url)>/meta.json
+    <directory>/<version>/<sha1(wsdl url)>/<sha1(wsdl)>.wsdl
+
+The WSDL is stored under its content hash, so a changed WSDL gets a new
+local URL and therefore a new parsed definition. Cached WSDLs younger than
+'max_age' are used without contacting the XSP at all; older ones are
+revalidated by downloading the WSDL and comparing hashes.
+"""
+import os
+import json
+import time
+import errno
+import hashlib
+import tempfile
+import threading
+import logging
+import requests
+import suds
+from suds.client import Client
+from suds.cache import ObjectCache
+
+log = logging.getLogger(__name__)
+
+# Bump when the cache layout changes. The suds version is part of the
+# cache version too, as parsed definitions are pickled suds objects.
+CACHE_VERSION = 1
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _sha1(s):
+    return hashlib.sha1(s).hexdigest()
+
+
+class WsdlCache(object):
+    """
+    Creates suds clients for OCI-P WSDL urls, loading the WSDL and its
+    parsed service definition from local disk when possible.
+    """
+
+    def __init__(self, directory=None, max_age=24 * 3600):
+        """
+        :param directory: Cache root directory. Defaults to a directory
+                          under the system temp directory.
+        :param max_age: Seconds a cached WSDL is trusted before it is
+                        revalidated against the XSP.
+        """
+        self.max_age = max_age
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.set_directory(directory or os.path.join(tempfile.gettempdir(),
+                                                     "reqaid-oci-wsdl"))
+
+    def set_directory(self, directory):
+        self.directory = os.path.join(directory, "v%s-suds%s" %
+                                      (CACHE_VERSION, suds.__version__))
+        with self._lock:
+            self._clients = {}
+
+    def client(self, wsdl_url, location=None):
+        """
+        Returns a suds Client for the given WSDL url.
+
+        Clients of the same WSDL share one parsed definition in process
+        (Client.clone()), and new processes unpickle it from disk. Once
+        the definition is older than 'max_age' the WSDL is revalidated,
+        and parsed again when it changed.
+        """
+        key = (wsdl_url, location)
+        with self._lock:
+            cached = self._clients.get(key)
+        if cached is not None and time.time() - cached[1] < self.max_age:
+            return cached[0].clone()
+        path = self._local_wsdl(wsdl_url)
+        if cached is not None and cached[2] == path:
+            prototype = cached[0]
+        else:
+            prototype = Client("file://%s" % path, location=location,
+                               cache=ObjectCache(
+                                   os.path.join(self.directory, "objects"),
+                                   days=365))
+        with self._lock:
+            self._clients[key] = (prototype, time.time(), path)
+        return prototype.clone()
+
+    def prewarm(self, *xsp_urls):
+        """
+        Fetches and parses the ProvisioningService WSDL of given XSPs so
+        that following OciClient instances start from the cache.
+        """
+        for xsp in xsp_urls:
+            try:
+                self.client(
+                    "%s/webservice/services/ProvisioningService?wsdl" % xsp)
+                log.info("[WsdlCache] prewarmed %s" % xsp)
+            except Exception as e:
+                log.error("[WsdlCache] failed to prewarm %s: %s" % (xsp, e))
+
+    def invalidate(self, wsdl_url=None):
+        """Forget in-process clients, forcing revalidation of the WSDL."""
+        with self._lock:
+            for key in self._clients.keys():
+                if wsdl_url in (None, key[0]):
+                    del self._clients[key]
+        if wsdl_url and os.path.exists(self._meta_path(wsdl_url)):
+            os.remove(self._meta_path(wsdl_url))
+
+    def _entry_dir(self, wsdl_url):
+        return os.path.join(self.directory, _sha1(wsdl_url))
+
+    def _meta_path(self, wsdl_url):
+        return os.path.join(self._entry_dir(wsdl_url), "meta.json")
+
+    def _read_meta(self, wsdl_url):
+        try:
+            with open(self._meta_path(wsdl_url)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_meta(self, wsdl_url, meta):
+        # Write and rename, other worker processes may be reading it
+        path = self._meta_path(wsdl_url)
+        tmp = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp, path)
+
+    def _local_wsdl(self, wsdl_url):
+        """
+        Returns the path of an up to date local copy of the WSDL,
+        downloading it if needed.
+        """
+        entry_dir = self._entry_dir(wsdl_url)
+        meta = self._read_meta(wsdl_url)
+        if meta is not None:
+            path = os.path.join(entry_dir, "%s.wsdl" % meta["sha1"])
+            if not os.path.exists(path):
+                meta = None
+            elif time.time() - meta["checked"] < self.max_age:
+                return path
+        try:
+            r = requests.get(wsdl_url)
+            assert str(r.status_code)[0] == '2', \
+                "WSDL request %s failed (%s)" % (wsdl_url, r.status_code)
+        except Exception as e:
+            if meta is None:
+                raise
+            log.info("[WsdlCache] using stale WSDL of %s: %s" % (wsdl_url, e))
+            return path
+        digest = _sha1(r.content)
+        _makedirs(entry_dir)
+        path = os.path.join(entry_dir, "%s.wsdl" % digest)
+        if meta is None or meta["sha1"] != digest:
+            log.info("[WsdlCache] new WSDL for %s (%s)" % (wsdl_url, digest))
+            tmp = "%s.%s.tmp" % (path, os.getpid())
+            with open(tmp, "wb") as f:
+                f.write(r.content)
+            os.rename(tmp, path)
+        self._write_meta(wsdl_url, {"url": wsdl_url, "sha1": digest,
+                                    "checked": time.time()})
+        return path
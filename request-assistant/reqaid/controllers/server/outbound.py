@@ -0,0 +1,221 @@
+"""
+Adaptive concurrency of the requests sent to BroadWorks servers.
+
+OCI-P commands (OciClient), XSI actions and DM config fetches (XsiTool)
+all take a slot of the shared OutboundScheduler before they are sent:
+
+    with default_scheduler.request(host) as slot:
+        response = send()
+        if response.status_code == 503:
+            slot.outcome = THROTTLED
+
+Each host has a concurrency budget, adjusted AIMD style: every timely
+response grows it by 1/budget (about one slot per round of requests),
+while a throttled, failed or slow (above target_latency) response halves
+it, at most once per round. Requests beyond the budget wait in a queue,
+interactive requests ahead of bulk ones:
+
+    with priority(BULK):
+        ...     # requests of this thread queue behind interactive ones
+
+stats() reports the budget, requests in flight and queue depth per host.
+"""
+import re
+import time
+import heapq
+import itertools
+import threading
+import logging
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Request priorities, lower first
+INTERACTIVE = 0
+BULK = 10
+
+# Request outcomes
+OK = 'ok'
+THROTTLED = 'throttled'
+ERROR = 'error'
+
+_THROTTLE_MESSAGE = re.compile(r'too many|overload|server busy|throttl|'
+                               r'rate limit', re.IGNORECASE)
+
+_local = threading.local()
+
+
+def is_throttle_message(text):
+    """Tells whether an error text reports that the server sheds load."""
+    return bool(text) and _THROTTLE_MESSAGE.search(text) is not None
+
+
+@contextmanager
+def priority(level):
+    """Sets the priority of the requests of the current thread."""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+class Slot(object):
+    """
+    A granted request. Set 'outcome' to THROTTLED or ERROR when the
+    response says so; exceptions count as ERROR.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.outcome = None
+        self.start = time.time()
+
+
+class _Budget(object):
+    """Concurrency budget and queue of one host."""
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.queue = []           # heap of (priority, seq, Event)
+        self.last_decrease = 0
+        self.latency = None       # moving average, seconds
+        self.counts = {OK: 0, THROTTLED: 0, ERROR: 0, 'slow': 0}
+
+
+class OutboundScheduler(object):
+    """Per host AIMD concurrency budgets with a priority queue."""
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64,
+                 target_latency=5.0, backoff=0.5, queue_timeout=120,
+                 enabled=True):
+        """
+        :param initial_limit: Budget of a host before anything is known
+        :param min_limit: Smallest budget, requests never stop entirely
+        :param max_limit: Largest budget
+        :param target_latency: Seconds above which a response counts as a
+                               sign of overload
+        :param backoff: Factor applied to the budget on overload
+        :param queue_timeout: Seconds a request waits for a slot before
+                              failing with AssertionError
+        :param enabled: When 'False' requests are not limited
+        """
+        self._seq = itertools.count()
+        self._budgets = {}
+        self._lock = threading.Lock()
+        self.configure(initial_limit=initial_limit, min_limit=min_limit,
+                       max_limit=max_limit, target_latency=target_latency,
+                       backoff=backoff, queue_timeout=queue_timeout,
+                       enabled=enabled)
+
+    def configure(self, **kwargs):
+        """Changes the settings given as keyword arguments, see __init__()."""
+        with self._lock:
+            for k, v in kwargs.iteritems():
+                assert k in ('initial_limit', 'min_limit', 'max_limit',
+                             'target_latency', 'backoff', 'queue_timeout',
+                             'enabled'), "Unknown setting %s" % k
+                setattr(self, k, v)
+            for budget in self._budgets.values():
+                budget.limit = min(max(budget.limit, self.min_limit),
+                                   self.max_limit)
+                self._grant(budget)
+
+    @contextmanager
+    def request(self, host, level=None):
+        """
+        Waits for a slot of the host's budget, then runs the 'with' block
+        and adjusts the budget from its outcome and latency.
+
+        :param host: Server the request goes to, e.g. 'xsp1.example.com'
+        :param level: Priority, defaults to the thread's, see priority()
+        :return: Slot
+        """
+        if not self.enabled:
+            yield Slot(host)
+            return
+        budget = self._acquire(host, current_priority() if level is None
+                               else level)
+        slot = Slot(host)
+        try:
+            yield slot
+        except Exception:
+            self._release(budget, slot, slot.outcome or ERROR)
+            raise
+        self._release(budget, slot, slot.outcome or OK)
+
+    def stats(self):
+        """Returns {host: {'limit', 'in_flight', 'queued', 'latency', and
+        the number of ok, throttled, error and slow responses}}."""
+        with self._lock:
+            return dict((host, dict(b.counts, limit=round(b.limit, 2),
+                                    in_flight=b.in_flight,
+                                    queued=len(b.queue),
+                                    latency=b.latency and
+                                    round(b.latency, 3)))
+                        for host, b in self._budgets.iteritems())
+
+    def _capacity(self, budget):
+        return max(self.min_limit, int(budget.limit))
+
+    def _acquire(self, host, level):
+        with self._lock:
+            budget = self._budgets.get(host)
+            if budget is None:
+                budget = self._budgets[host] = _Budget(self.initial_limit)
+            if budget.in_flight < self._capacity(budget) and \
+                    not budget.queue:
+                budget.in_flight += 1
+                return budget
+            granted = threading.Event()
+            entry = (level, next(self._seq), granted)
+            heapq.heappush(budget.queue, entry)
+        if granted.wait(self.queue_timeout):
+            return budget
+        with self._lock:
+            if granted.is_set():
+                return budget
+            budget.queue.remove(entry)
+            heapq.heapify(budget.queue)
+        raise AssertionError("No slot for a request to %s within %ss "
+                             "(%d queued)" % (host, self.queue_timeout,
+                                              len(budget.queue)))
+
+    def _release(self, budget, slot, outcome):
+        now = time.time()
+        latency = now - slot.start
+        with self._lock:
+            budget.in_flight -= 1
+            budget.latency = latency if budget.latency is None else \
+                0.8 * budget.latency + 0.2 * latency
+            if outcome == OK and latency > self.target_latency:
+                outcome = 'slow'
+            budget.counts[outcome] += 1
+            if outcome == OK:
+                budget.limit = min(self.max_limit,
+                                   budget.limit + 1.0 / budget.limit)
+            elif slot.start >= budget.last_decrease:
+                # Requests sent before the last decrease report on the old
+                # budget: decrease once per round
+                budget.limit = max(self.min_limit,
+                                   budget.limit * self.backoff)
+                budget.last_decrease = now
+                log.info("[OutboundScheduler] %s %s, budget %.1f" %
+                         (slot.host, outcome, budget.limit))
+            self._grant(budget)
+
+    def _grant(self, budget):
+        while budget.queue and budget.in_flight < self._capacity(budget):
+            _, _, granted = heapq.heappop(budget.queue)
+            budget.in_flight += 1
+            granted.set()
+
+
+# Shared by every OciClient and XsiTool
+default_scheduler = OutboundScheduler()
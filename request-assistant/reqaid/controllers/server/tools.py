@@ -5,17 +5,29 @@ import io
 import copy
 import json
 import base64
+import functools
+from urlparse import urlparse
 from ConfigParser import ConfigParser
 import xsi_tool
 import xmpp_tool
 import oci_tool
+import oci_pool
+import oci_async
+import oci_bulk
+import oci_cache
+import oci_coalesce
+import oci_transport
+import oci_wsdl
+import outbound
+import traffic
 import utils
 #from ..data import SERVER, ACCOUNTS
 
 def create_xsi_tool_for_account(server, account):
     return xsi_tool.XsiTool(server,
                             account["xsp_username"],
-                            account["xsp_password"])
+                            account["xsp_password"],
+                            traffic=_traffic)
 
 
 def create_xmpp_tool_for_account(account):
@@ -23,14 +35,264 @@ def create_xmpp_tool_for_account(account):
                               account["xmpp_password"])
 
 
+_wsdl_cache = oci_wsdl.WsdlCache()
+_oci_transport_defaults = {}
+_oci_cache = None
+_oci_coalescer = None
+_traffic = None
+
+
+def configure_oci_transport(**kwargs):
+    """
+    Change the default transport settings of create_oci_transport(), e.g.
+    configure_oci_transport(transport="tcp", oci_tls=True). Settings given
+    to create_oci_tool() take precedence.
+    """
+    _oci_transport_defaults.update(
+        (k, v) for k, v in kwargs.iteritems() if v is not None)
+
+
+def create_oci_transport(**kwargs):
+    """
+    Creates the transport for create_oci_tool(). kwargs 'transport' selects
+    it:
+        "suds"  processOCIMessage through suds (default)
+        "raw"   oci_transport.RawSoapTransport, falling back to suds
+        "tcp"   native OCI-P, oci_transport.TcpTransport. kwargs 'oci_host'
+                (default: host of the server url), 'oci_port' and 'oci_tls'
+                select where to connect.
+    """
+    kwargs = dict(_oci_transport_defaults, **kwargs)
+    xsp = kwargs.get("url", kwargs.get("server"))
+    location = "%s/webservice/services/ProvisioningService" % xsp
+    wsdl_url = "%s?wsdl" % location
+    wsdl_cache = kwargs.get("wsdl_cache", _wsdl_cache)
+
+    def _suds():
+        return oci_transport.SudsTransport(
+            wsdl_url,
+            location if kwargs.get("override_location", True) else None,
+            wsdl_cache)
+
+    transport = kwargs.get("transport", "suds")
+    if transport == "raw":
+        return oci_transport.RawSoapTransport(location, fallback=_suds)
+    if transport == "tcp":
+        use_tls = kwargs.get("oci_tls", False)
+        return oci_transport.TcpTransport(
+            kwargs.get("oci_host") or urlparse(xsp).hostname,
+            kwargs.get("oci_port") or (2209 if use_tls else 2208),
+            use_tls, kwargs.get("oci_ca_certs"))
+    assert transport == "suds", "Unknown OCI transport '%s'" % transport
+    return _suds()
+
+
 def create_oci_tool(**kwargs):
     assert all([x in kwargs for x in ("username", "password", "server")]), \
         "Missing OCI setting"
+    transport = functools.partial(create_oci_transport, **kwargs)
     return oci_tool.OciClient(
         kwargs.get("username"),
         kwargs.get("password"),
         kwargs.get("url", kwargs.get("server")),
-        kwargs.get("override_location", True))
+        kwargs.get("override_location", True),
+        transport=_traffic.transport(transport) if _traffic is not None
+        else transport(),
+        cache=kwargs.get("cache", _oci_cache),
+        coalescer=kwargs.get("coalescer", _oci_coalescer))
+
+
+def configure_oci_cache(max_entries=None, ttl=None):
+    """
+    Enable the Get response cache shared by the clients of
+    create_oci_tool(), see oci_cache.OciCache. max_entries 0 disables it.
+    """
+    global _oci_cache
+    if not max_entries:
+        _oci_cache = None
+    else:
+        _oci_cache = oci_cache.OciCache(max_entries,
+                                        ttl if ttl is not None else 30)
+
+
+def oci_cache_stats():
+    """Returns the counters of the shared Get response cache, or None."""
+    return _oci_cache.stats() if _oci_cache is not None else None
+
+
+def configure_oci_coalescing(window=None):
+    """
+    Merge the single item list commands the clients of create_oci_tool()
+    send within 'window' seconds, see oci_coalesce.OciCoalescer. A window
+    of 0 disables it.
+    """
+    global _oci_coalescer
+    if not window:
+        _oci_coalescer = None
+    else:
+        _oci_coalescer = oci_coalesce.OciCoalescer(window)
+
+
+def configure_outbound(**kwargs):
+    """
+    Change the settings of the scheduler shared by the OCI-P and XSI
+    requests, see outbound.OutboundScheduler. Settings given as None are
+    left unchanged.
+    """
+    outbound.default_scheduler.configure(
+        **dict((k, v) for k, v in kwargs.iteritems() if v is not None))
+
+
+def outbound_stats():
+    """Returns the concurrency budget and queue depth per server."""
+    return outbound.default_scheduler.stats()
+
+
+def configure_traffic(record=None, replay=None, latency=None,
+                      passthrough=False):
+    """
+    Record the OCI-P, XSI and DM traffic of the tools created here to the
+    file 'record', or serve it from the recorded file 'replay' instead of
+    the servers. See traffic.TrafficRecorder and traffic.TrafficReplay.
+    Without a file, the tools talk to the servers again.
+    """
+    global _traffic
+    assert not (record and replay), "Traffic is either recorded or replayed"
+    if isinstance(_traffic, traffic.TrafficRecorder):
+        _traffic.close()
+    if record:
+        _traffic = traffic.TrafficRecorder(record)
+    elif replay:
+        _traffic = traffic.TrafficReplay(replay, latency or 0, passthrough)
+    else:
+        _traffic = None
+
+
+def traffic_stats():
+    """Returns the counters of the traffic replay, or None."""
+    return _traffic.stats() if isinstance(_traffic, traffic.TrafficReplay) \
+        else None
+
+
+def configure_wsdl_cache(directory=None, max_age=None):
+    """
+    Change where and for how long OCI-P WSDLs are cached. See
+    oci_wsdl.WsdlCache.
+    """
+    if directory:
+        _wsdl_cache.set_directory(directory)
+    if max_age is not None:
+        _wsdl_cache.max_age = max_age
+
+
+def prewarm_wsdl_cache(*servers):
+    """
+    Load the OCI-P WSDL of given XSP urls into the cache, so that the
+    first OCI request of a worker does not download and parse it.
+    """
+    _wsdl_cache.prewarm(*servers)
+
+
+_oci_pool = oci_pool.OciSessionPool(create_oci_tool)
+
+
+def oci_session(**kwargs):
+    """
+    Borrow a logged in OciClient from the shared session pool:
+
+        with oci_session(username=.., password=.., server=..) as oci:
+            oci.user_get_data(user_id)
+
+    Takes the same arguments as create_oci_tool().
+    """
+    assert all([x in kwargs for x in ("username", "password", "server")]), \
+        "Missing OCI setting"
+    return _oci_pool.session(**kwargs)
+
+
+def create_async_oci_tool(concurrency=4, **kwargs):
+    """
+    Creates an oci_async.AsyncOciClient running OCI commands on
+    'concurrency' sessions at once. Takes the arguments of
+    create_oci_tool().
+    """
+    assert all([x in kwargs for x in ("username", "password", "server")]), \
+        "Missing OCI setting"
+    return oci_async.AsyncOciClient(create_oci_tool, concurrency, **kwargs)
+
+
+def provision_test_users(manifest, state_file=None, concurrency=4,
+                         progress=None, **kwargs):
+    """
+    Creates the UC-One test users of a CSV or JSON manifest concurrently.
+    See oci_bulk for the manifest format and the state file.
+
+    :param kwargs: Arguments of create_oci_tool()
+    :return: List of per user records, see oci_bulk.BulkProvisioner.run()
+    """
+    users = oci_bulk.load_manifest(manifest)
+    with create_async_oci_tool(concurrency, **kwargs) as oci:
+        return oci_bulk.BulkProvisioner(oci, state_file, progress).run(users)
+
+
+def teardown_users(users, concurrency=8, dry_run=False, **kwargs):
+    """
+    Deletes users and their devices concurrently. See
+    oci_bulk.BulkTeardown.
+
+    :param users: User ids and fnmatch patterns, e.g. 'test*@example.com'
+    :param kwargs: Arguments of create_oci_tool()
+    :return: oci_bulk.TeardownReport
+    """
+    with create_async_oci_tool(concurrency, **kwargs) as oci:
+        return oci_bulk.BulkTeardown(oci).run(users, dry_run)
+
+
+def sync_custom_tags(tags, exact=False, concurrency=8, dry_run=False,
+                     **kwargs):
+    """
+    Brings the custom tags of many access devices to the desired values,
+    sending only the changes. See oci_bulk.BulkTagSync.
+
+    :param tags: {device name or pattern: {tag: value}}, None deletes
+    :param kwargs: Arguments of create_oci_tool()
+    :return: oci_bulk.TagSyncReport
+    """
+    with create_async_oci_tool(concurrency, **kwargs) as oci:
+        return oci_bulk.BulkTagSync(oci).run(tags, exact, dry_run)
+
+
+def rollout_config_files(configs, state_file=None, concurrency=8,
+                         force=False, device_type=None,
+                         group_rebuild_threshold=10, group_rebuild_share=0.5,
+                         **kwargs):
+    """
+    Uploads device config files concurrently, skipping the files uploaded
+    unchanged before, and rebuilds them. See oci_bulk.ConfigRollout.
+
+    :param configs: {device name: file content}
+    :param state_file: Optional path keeping the hashes of the uploaded
+                       files between runs
+    :param device_type: Type of all the devices. Without it the files are
+                        never rebuilt for the whole group at once.
+    :param group_rebuild_threshold: See oci_bulk.ConfigRollout
+    :param group_rebuild_share: See oci_bulk.ConfigRollout
+    :param kwargs: Arguments of create_oci_tool()
+    :return: oci_bulk.RolloutReport
+    """
+    with create_async_oci_tool(concurrency, **kwargs) as oci:
+        rollout = oci_bulk.ConfigRollout(
+            oci, state_file, group_rebuild_threshold=group_rebuild_threshold,
+            group_rebuild_share=group_rebuild_share)
+        return rollout.run(configs, force, device_type=device_type)
+
+
+def configure_oci_pool(**kwargs):
+    """
+    Change the shared session pool limits. See OciSessionPool for the
+    accepted keyword arguments.
+    """
+    _oci_pool.configure(**kwargs)
 
 
 def fetch_server_data_for_account(server, account, ucaas=False):
@@ -0,0 +1,281 @@
+"""
+Recording and replay of the traffic to BroadWorks.
+
+TrafficRecorder appends every OCI-P exchange (OciClient documents, as
+carried by its transport), XSI request and DM config fetch (XsiTool) to a
+file, one JSON line per exchange with its time and duration:
+
+    {"kind":"oci","at":1460000000.123,"ms":41.5,"request":"<?xml ...",
+     "response":"<?xml ..."}
+    {"kind":"xsi","at":1460000000.2,"ms":12.0,"method":"get","url":"...",
+     "data":null,"status":200,"body":"<?xml ..."}
+
+The file is only appended to, several runs can be recorded into one. A
+path ending with .gz is gzip compressed. Session ids are left out of the
+OCI-P documents so that the exchanges of one session match another one's.
+Requests are stored as sent, including the passwords of the commands
+that carry one; XSI credentials are not stored. Bodies which are not
+UTF-8 text are stored base64 encoded, as "body64".
+
+TrafficReplay serves the recorded responses back without a server:
+
+    replay = TrafficReplay('traffic.jsonl', latency=1.0)
+    oci = OciClient(user, password, xsp, transport=replay.transport())
+    xsi = XsiTool(xsp, user, password, traffic=replay)
+
+Responses to the same request are served in the recorded order, the last
+one again once they run out. OCI-P requests are matched without the
+values a run makes up (passwords, device names and line ports) or takes
+from the number pool, so that replaying e.g. create_ucone_test_user()
+finds the recorded exchanges. 'latency' scales the recorded response
+times, 0 (default) answers at once.
+"""
+import re
+import json
+import base64
+import gzip
+import time
+import threading
+import logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+OCI = 'oci'
+XSI = 'xsi'
+DM = 'dm'
+
+_SESSION_ID = re.compile(r'(<sessionId\b[^>]*>)[^<]*(</sessionId>)')
+# Elements whose values differ from one run to the next
+_VOLATILE = re.compile(r'(<(password|signedPassword|userName|deviceName|'
+                       r'linePort|phoneNumber)>)[^<]*(</\2>)')
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else \
+        open(path, mode)
+
+
+def _document(oci_command):
+    """The text of an OCI-P document without its session id."""
+    # StreamedDocument, see oci_transport, stands for its file
+    text = oci_command if isinstance(oci_command, basestring) else \
+        str(oci_command)
+    return _SESSION_ID.sub(r'\1\2', text)
+
+
+def _match_key(document):
+    """The key replayed OCI-P documents are matched on."""
+    return OCI, _VOLATILE.sub(r'\1\3', document)
+
+
+def _body(content):
+    """The fields recording an HTTP response body."""
+    try:
+        return {'body': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'body64': base64.b64encode(content)}
+
+
+def _session_id(oci_command):
+    m = _SESSION_ID.search(oci_command if isinstance(oci_command,
+                                                     basestring)
+                           else oci_command.head)
+    return m and m.group(0)
+
+
+class TrafficRecorder(object):
+    """Appends the exchanges with BroadWorks servers to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = _open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def record(self, kind, start, **fields):
+        """
+        Appends one exchange.
+
+        :param kind: OCI, XSI or DM
+        :param start: time.time() when the request was sent
+        :param fields: Request and response, e.g. 'request' and 'response'
+        """
+        fields.update(kind=kind, at=round(start, 3),
+                      ms=round((time.time() - start) * 1000, 1))
+        line = json.dumps(fields, separators=(',', ':'), sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def transport(self, factory):
+        """
+        Returns a transport recording the documents carried by the one
+        'factory' returns, see oci_transport.
+        """
+        return RecordingTransport(factory(), self)
+
+    def http(self, kind, fn):
+        """
+        Returns a recording version of a requests function (requests.get,
+        put or delete), called like it as fn(url, data=.., ...).
+        """
+        def _recorded(url, **kwargs):
+            start = time.time()
+            r = fn(url, **kwargs)
+            redirect = r.history[0].headers.get('Location') \
+                if r.history and r.history[0].is_redirect else None
+            self.record(kind, start, method=fn.__name__, url=url,
+                        data=kwargs.get('data'), status=r.status_code,
+                        redirect=redirect, **_body(r.content))
+            return r
+        return _recorded
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingTransport(object):
+    """An OCI-P transport whose documents are recorded."""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        # 'host', 'client', close() ... of the recorded transport
+        return getattr(self.transport, name)
+
+    def process(self, oci_command):
+        start = time.time()
+        response = self.transport.process(oci_command)
+        self.recorder.record(OCI, start, request=_document(oci_command),
+                             response=_document(response))
+        return response
+
+
+class _Redirect(object):
+    """What XsiTool reads of a redirect response."""
+
+    is_redirect = True
+
+    def __init__(self, location):
+        self.headers = {'Location': location}
+
+
+class ReplayedResponse(object):
+    """What XsiTool reads of a requests.Response."""
+
+    def __init__(self, entry):
+        self.status_code = entry['status']
+        self.content = base64.b64decode(entry['body64']) \
+            if 'body64' in entry else entry['body'].encode('utf-8')
+        self.history = [_Redirect(entry['redirect'])] \
+            if entry.get('redirect') else []
+
+
+class TrafficReplay(object):
+    """Serves recorded exchanges, see TrafficRecorder."""
+
+    def __init__(self, path, latency=0, passthrough=False):
+        """
+        :param path: File written by TrafficRecorder
+        :param latency: Factor applied to the recorded response times
+        :param passthrough: When 'True' requests which were not recorded go
+                            to the server, otherwise they fail with
+                            AssertionError
+        """
+        self.path = path
+        self.latency = latency
+        self.passthrough = passthrough
+        self.recorded = 0
+        self.served = 0
+        self.missed = 0
+        self._responses = {}    # {request key: deque of entries}
+        self._lock = threading.Lock()
+        with _open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    self._add(json.loads(line))
+        log.info("[TrafficReplay] %d exchanges loaded from %s" %
+                 (self.recorded, path))
+
+    def _add(self, entry):
+        if entry['kind'] == OCI:
+            key = _match_key(entry['request'])
+        else:
+            key = (entry['kind'], entry['method'], entry['url'],
+                   entry['data'])
+        self._responses.setdefault(key, deque()).append(entry)
+        self.recorded += 1
+
+    def stats(self):
+        """
+        Returns the number of exchanges recorded, and of requests served
+        and not recorded.
+        """
+        return {'recorded': self.recorded, 'served': self.served,
+                'missed': self.missed}
+
+    def _serve(self, key, description):
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                self.missed += 1
+                assert self.passthrough, "No recorded response to %s" % \
+                    description
+                return None
+            self.served += 1
+            entry = responses[0] if len(responses) == 1 else \
+                responses.popleft()
+        if self.latency:
+            time.sleep(entry['ms'] / 1000.0 * self.latency)
+        return entry
+
+    def transport(self, factory=None):
+        """
+        Returns a transport serving the recorded OCI-P responses.
+
+        :param factory: Callable returning the transport of the requests
+                        which were not recorded, when passthrough is set.
+                        Called at most once, when first needed.
+        """
+        return ReplayTransport(self, factory)
+
+    def http(self, kind, fn):
+        """A requests function serving the recorded XSI or DM responses."""
+        def _replayed(url, **kwargs):
+            data = kwargs.get('data')
+            entry = self._serve((kind, fn.__name__, url, data),
+                                "%s %s" % (fn.__name__.upper(), url))
+            if entry is None:
+                return fn(url, **kwargs)
+            return ReplayedResponse(entry)
+        return _replayed
+
+
+class ReplayTransport(object):
+    """An OCI-P transport answering from a TrafficReplay."""
+
+    def __init__(self, replay, factory=None):
+        self.replay = replay
+        self._factory = factory
+        self._transport = None
+
+    def process(self, oci_command):
+        request = _document(oci_command)
+        entry = self.replay._serve(_match_key(request), request)
+        if entry is None:
+            assert self._factory is not None, \
+                "No transport for the requests which were not recorded"
+            if self._transport is None:
+                self._transport = self._factory()
+            return self._transport.process(oci_command)
+        response = entry['response']
+        session_id = _session_id(oci_command)
+        if session_id:
+            response = _SESSION_ID.sub(session_id.replace('\\', r'\\'),
+                                       response)
+        return response
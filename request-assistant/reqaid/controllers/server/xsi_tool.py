@@ -2,8 +2,10 @@
 """
 import requests
 from requests.auth import HTTPDigestAuth
+from urlparse import urlparse
 import copy
 import utils
+from outbound import default_scheduler, THROTTLED, ERROR
 
 
 def _pc_dm_url(elem, **kwargs):
@@ -71,22 +73,35 @@ def _update_forward_number(tree_, number_field_name, state):
 
 
 class XsiTool:
-    def __init__(self, xsp_url, username, password):
+    def __init__(self, xsp_url, username, password, traffic=None):
+        """
+        :param traffic: Optional traffic.TrafficRecorder recording the XSI
+                        and DM requests, or traffic.TrafficReplay serving
+                        recorded responses instead of the server
+        """
         self.xsp_url = xsp_url
         self.username = username
         self.password = password
+        self.traffic = traffic
 
     def _xsi_http(self, fn, **kwargs):
         api_endpoint = kwargs.get("api_endpoint", None)
         location = kwargs.get("location", None)
         parse = kwargs.get("parse", True)
         data = kwargs.get("data", None)
+        kind = kwargs.get("kind", "xsi")
         auth = kwargs.get("auth", None) or (self.username, self.password)
         url = location if location else (
             "%s/com.broadsoft.xsi-actions/v2.0"
             "/user/%s/%s" %
             (self.xsp_url, self.username, api_endpoint))
-        r = fn(url, verify=True, data=data, auth=auth)
+        send = self.traffic.http(kind, fn) if self.traffic else fn
+        with default_scheduler.request(urlparse(url).netloc) as slot:
+            r = send(url, verify=True, data=data, auth=auth)
+            if r.status_code in (429, 503):
+                slot.outcome = THROTTLED
+            elif r.status_code >= 500:
+                slot.outcome = ERROR
         if len(r.history) > 0 and r.history[0].is_redirect:
             # requests bug (loses authorization header when redirected)
             return self._xsi_http(
@@ -121,6 +136,7 @@ class XsiTool:
         return self._xsi_http(requests.get,
                               api_endpoint=None,
                               location=url + file_name + file_extension,
+                              kind="dm",
                               auth=HTTPDigestAuth(username, password))
 
     def get_dm_config(self, **kwargs):
@@ -33,6 +33,7 @@ def add_ocip_requests(requests, request_names):
 
     # used to specify the requests order
     request_names.extend(["group_device_modify_config_file",
+                          "group_device_upload_config_file",
                           "group_device_rebuild_config_file",
                           "group_device_get_custom_tags",
                           "group_device_add_custom_tag",
@@ -41,10 +42,12 @@ def add_ocip_requests(requests, request_names):
                           "group_access_device_add",
                           "group_access_device_delete",
                           "group_get_assigned_domains",
+                          "group_get_user_list",
                           "user_add",
                           "user_get",
                           "user_delete",
                           "user_get_data",
+                          "user_snapshot",
                           "user_get_primary_device",
                           "user_get_network_conferencing_request",
                           "user_get_assigned_services",
@@ -54,6 +57,8 @@ def add_ocip_requests(requests, request_names):
                           #"user_unassign_service",
                           "user_get_security_classification",
                           #"user_set_security_classification",
+                          "teardown_users",
+                          "sync_custom_tags",
                           ])
 
     # group_device_get_custom_tags
@@ -91,6 +96,15 @@ def add_ocip_requests(requests, request_names):
         Argument("fileFormat", value='config.xml', pos=3),
         Argument("extendedCaptureEnabled", pos=4, value="false", descr="true | false")
     )
+    # group_device_upload_config_file, base64 encoded while it is sent
+    requests['group_device_upload_config_file'] = OCIPRequest(
+        'group_device_upload_config_file',
+        'GroupAccessDeviceFileModifyRequest14sp8',
+        'Config / Upload config file',
+        Argument("deviceName", pos=0),
+        Argument("file", type="file", pos=1, descr="file of any size"),
+        Argument("fileFormat", value='config.xml', pos=2),
+    )
     # group_device_rebuild_config_file
     requests['group_device_rebuild_config_file'] = OCIPRequest(
         'group_device_rebuild_config_file',
@@ -130,6 +144,11 @@ def add_ocip_requests(requests, request_names):
         'GroupDnGetAvailableListRequest',
         'Group / Get available numbers'
     )
+    requests['group_get_user_list'] = OCIPRequest(
+        'group_get_user_list',
+        'UserGetListInGroupRequest',
+        'Group / Get users'
+    )
     requests['user_add'] = OCIPRequest(
         'user_add',
         'UserAddRequest17sp4',
@@ -143,12 +162,34 @@ def add_ocip_requests(requests, request_names):
         Argument("phoneNumber", pos=6, optional=True, descr="optional", value=None)
     )
 
+    # bulk requests, see OCIPController.BULK_REQUESTS
+    requests['teardown_users'] = OCIPRequest(
+        'teardown_users',
+        '',
+        'Bulk / Delete users and devices',
+        Argument("userIds", type="text", pos=0,
+                 descr="user ids or patterns like test*@example.com"),
+        Argument("dryRun", type="bool", pos=1, value={"checked": "on"}),
+    )
+    requests['sync_custom_tags'] = OCIPRequest(
+        'sync_custom_tags',
+        '',
+        'Bulk / Sync custom tags',
+        Argument("tags", type="text", pos=0,
+                 descr="one per line: device or pattern like dev*, then "
+                       "%TAG%=value, or -%TAG% to delete"),
+        Argument("exact", type="bool", pos=1, value={"checked": "off"},
+                 descr="delete tags not listed"),
+        Argument("dryRun", type="bool", pos=2, value={"checked": "on"}),
+    )
+
     # functions with single user_id argument
     for name in ["user_get_network_conferencing_request",
                  "user_get_assigned_services",
                  "user_get_security_classification",
                  "user_get",
                  "user_get_data",
+                 "user_snapshot",
                  "user_get_primary_device",
                  "user_delete",
                  "user_get_sca_list"
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Unit test suite for the server tools (OCI-P, XSI) of the application."""
+import logging
+
+
+def setup():
+    """suds 0.4 fails to format some of its own debug messages"""
+    logging.getLogger('suds').setLevel(logging.INFO)
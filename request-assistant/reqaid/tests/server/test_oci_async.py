@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the concurrent OCI-P client"""
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_async import AsyncOciClient
+from reqaid.controllers.server.oci_stub import OciStub, Rendezvous, \
+    error_command
+
+
+def _async_client(stub, concurrency=4):
+    def factory(**kwargs):
+        return OciClient(kwargs["username"], kwargs["password"], "",
+                         transport=stub)
+    return AsyncOciClient(factory, concurrency, username="admin",
+                          password="secret", server="http://xsp")
+
+
+class TestAsyncOciClient(object):
+
+    def test_concurrency(self):
+        """Commands run on several sessions at once"""
+        rendezvous = Rendezvous(4)
+        stub = OciStub(responses={
+            'GroupAccessDeviceDeleteRequest': rendezvous})
+        with _async_client(stub) as oci:
+            results = oci.map('group_access_device_delete',
+                              [("dev%d" % i,) for i in range(16)])
+            eq_(len(oci.gather(results)), 16)
+        eq_(rendezvous.peak, 4)
+        eq_(stub.commands.count('GroupAccessDeviceDeleteRequest'), 16)
+        eq_(stub.commands.count('LoginRequest14sp4'), 4)
+
+    def test_command_methods(self):
+        """OciClient command methods are available"""
+        with _async_client(OciStub()) as oci:
+            result = oci.activate_imp("alice@example.com")
+            ok_("SuccessResponse" in result.get())
+            assert_raises(AttributeError, getattr, oci, "_send")
+            assert_raises(AttributeError, getattr, oci, "nonexistent")
+
+    def test_gather_exceptions(self):
+        """gather() raises or returns the exceptions of failed calls"""
+        stub = OciStub(responses={
+            'UserIntegratedIMPModifyRequest': error_command("failed")})
+        with _async_client(stub) as oci:
+            results = [oci.group_access_device_delete("dev1"),
+                       oci.activate_imp("alice@example.com")]
+            assert_raises(AssertionError, oci.gather, results)
+            values = oci.gather(results, return_exceptions=True)
+            ok_(isinstance(values[1], AssertionError))
+
+    def test_submit(self):
+        """submit() runs a function with a borrowed session"""
+        with _async_client(OciStub()) as oci:
+            result = oci.submit(lambda client, x: (client.group, x), 1)
+            eq_(result.get(), ("Group", 1))
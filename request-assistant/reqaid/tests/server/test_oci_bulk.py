@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""Test suite for bulk provisioning of test users"""
+import os
+import json
+import shutil
+import tempfile
+from nose.tools import eq_, ok_
+
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_async import AsyncOciClient
+from reqaid.controllers.server.oci_bulk import BulkProvisioner, \
+    BulkTeardown, BulkTagSync, ConfigRollout, load_manifest, read_state
+from reqaid.controllers.server.oci_numbers import number_pools
+from reqaid.controllers.server.oci_stub import OciStub, response_command, \
+    response_table, error_command
+from reqaid.controllers.server.oci_standin import OciStandIn
+
+MANIFEST = u"""first_name,last_name,password,primary_device,sca_devices
+Alice,Anderson,Welcom3,Polycom-550,Connect - Mobile; Business Communicator - PC
+Bob,Brown,Welcom3,-,-
+Cecil,Carter,Welcom3,,
+"""
+
+
+def _stub(numbers):
+    return OciStub(responses={
+        'GroupDomainGetAssignedListRequest': response_command(
+            'GroupDomainGetAssignedListResponse',
+            '<groupDefaultDomain>example.com</groupDefaultDomain>'),
+        'GroupDnGetAvailableListRequest': response_command(
+            'GroupDnGetAvailableListResponse',
+            ''.join('<phoneNumber>%s</phoneNumber>' % n for n in numbers)),
+        'UserGetRequest21': response_command('UserGetResponse21')})
+
+
+def _async_client(stub):
+    def factory(**kwargs):
+        return OciClient("admin", "secret", "", transport=stub)
+    return AsyncOciClient(factory, 3, username="admin", password="secret",
+                          server="http://xsp")
+
+
+class TestBulkProvisioner(object):
+
+    def setup(self):
+        number_pools.clear()
+        self.dir = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.dir, "users.csv")
+        with open(self.manifest, "w") as f:
+            f.write(MANIFEST.encode('utf-8'))
+        self.state = os.path.join(self.dir, "state.jsonl")
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def test_load_manifest(self):
+        """CSV manifests give create_ucone_test_user() arguments"""
+        users = load_manifest(self.manifest)
+        eq_(users[0]['sca_devices'], ['Connect - Mobile',
+                                      'Business Communicator - PC'])
+        eq_(users[1]['primary_device'], None)
+        eq_(users[1]['sca_devices'], [])
+        ok_('primary_device' not in users[2])
+        json_manifest = os.path.join(self.dir, "users.json")
+        with open(json_manifest, "w") as f:
+            json.dump(users, f)
+        eq_(load_manifest(json_manifest), users)
+
+    def test_run(self):
+        """Group context is fetched once and numbers are not reused"""
+        stub = _stub(["+1-5550001", "+1-5550002", "+1-5550003"])
+        progress = []
+        with _async_client(stub) as oci:
+            records = BulkProvisioner(oci, progress=progress.append).run(
+                load_manifest(self.manifest))
+        eq_([r['status'] for r in records], ['done'] * 3)
+        eq_(sorted(r['phone_number'] for r in records),
+            ["+1-5550001", "+1-5550002", "+1-5550003"])
+        eq_(records[0]['user_id'], 'andersonalice@example.com')
+        eq_(len(progress), 3)
+        eq_(stub.commands.count('GroupDnGetAvailableListRequest'), 1)
+        eq_(stub.commands.count('GroupDomainGetAssignedListRequest'), 1)
+        eq_(stub.commands.count('UserAddRequest17sp4'), 3)
+
+    def test_failed_number(self):
+        """A failed user's number is reused only once it is unassigned"""
+        numbers = ["+1-5550001", "+1-5550002", "+1-5550003"]
+        standin = OciStandIn(passwords={'admin': 'secret'}, numbers=numbers)
+        pool = OciClient("admin", "secret", "",
+                         transport=standin).number_pool()
+        users = [dict(first_name=name, last_name='Test', password='Welcom3',
+                      primary_device=None, sca_devices=[])
+                 for name in ('Alice', 'Bob')]
+        # Added, then failed: the number stays assigned
+        standin.inject_error('UserIntegratedIMPModifyRequest')
+        with _async_client(standin) as oci:
+            record, = BulkProvisioner(oci, cleanup=False).run(users[:1])
+        eq_(record['status'], 'failed')
+        eq_(standin.users['testalice@example.com']['phoneNumber'],
+            numbers[0])
+        ok_(numbers[0] in pool.used)
+        # Deleted again: the number is free
+        standin.inject_error('UserIntegratedIMPModifyRequest')
+        with _async_client(standin) as oci:
+            record, = BulkProvisioner(oci).run(users[1:])
+        eq_(record['status'], 'failed')
+        ok_('testbob@example.com' not in standin.users)
+        eq_(pool.reserve(lambda: numbers), numbers[1])
+
+    def test_resume(self):
+        """A second run only creates the users which were not created"""
+        users = load_manifest(self.manifest)
+        with _async_client(_stub(["+1-5550001", "+1-5550002"])) as oci:
+            records = BulkProvisioner(oci, self.state).run(users)
+        # Whichever worker is last to reserve a number finds none left
+        statuses = [r['status'] for r in records]
+        eq_(sorted(statuses), ['done', 'done', 'failed'])
+        failed = statuses.index('failed')
+        eq_(records[failed]['error'], "No available phone numbers left")
+        number_pools.clear()
+        stub = _stub(["+1-5550003"])
+        with _async_client(stub) as oci:
+            records = BulkProvisioner(oci, self.state).run(users)
+        eq_([r['status'] for r in records],
+            ['done' if i == failed else 'skipped' for i in range(3)])
+        eq_(stub.commands.count('UserAddRequest17sp4'), 1)
+        eq_(read_state(self.state)[records[failed]['user']]['status'],
+            'done')
+
+
+def _teardown_stub(users):
+    return OciStub(latency=0.02, responses={
+        'UserGetListInGroupRequest': response_table(
+            'UserGetListInGroupResponse', 'userTable',
+            ['User Id', 'Last Name', 'First Name'],
+            [[u, 'Last', 'First'] for u in users]),
+        'UserGetRequest21': response_command(
+            'UserGetResponse21',
+            '<accessDeviceEndpoint><accessDevice><deviceLevel>Group'
+            '</deviceLevel><deviceName>pp_dev</deviceName></accessDevice>'
+            '<linePort>lp_dev@example.com</linePort>'
+            '</accessDeviceEndpoint>'),
+        'GroupAccessDeviceGetRequest18sp1': response_command(
+            'GroupAccessDeviceGetResponse18sp1',
+            '<deviceType>Polycom-550</deviceType>'),
+        'UserSharedCallAppearanceGetRequest16sp2': response_table(
+            'UserSharedCallAppearanceGetResponse16sp2', 'endpointTable',
+            ['Device Level', 'Device Name', 'Device Type', 'Line/Port'],
+            [['Group', 'sca%d' % i, 'Connect - Mobile',
+              'lp_sca%d@example.com' % i] for i in range(2)])})
+
+
+class TestBulkTeardown(object):
+
+    def test_teardown(self):
+        """Users matching a pattern are deleted with their devices"""
+        stub = _teardown_stub(['test1@example.com', 'test2@example.com',
+                               'admin@example.com'])
+        with _async_client(stub) as oci:
+            report = BulkTeardown(oci).run(['test*@example.com',
+                                            'other@example.com'])
+        eq_(report.users, ['other@example.com', 'test1@example.com',
+                           'test2@example.com'])
+        eq_(report.failed, {})
+        eq_(stub.commands.count('UserDeleteRequest'), 3)
+        eq_(stub.commands.count('GroupAccessDeviceDeleteRequest'), 9)
+        # 1 user list + per user 3 reads, 2 endpoint and 3 device
+        # deletions (primary, 2 sca) and the user deletion
+        eq_(report.commands, 1 + 3 * (3 + 3 + 3 + 1))
+        steps = [s.name for s in report.workflow.steps
+                 if s.name.startswith('test1')]
+        eq_(steps[-1], 'test1@example.com: delete user')
+
+    def test_dry_run(self):
+        """A dry run only looks up the devices"""
+        stub = _teardown_stub([])
+        with _async_client(stub) as oci:
+            report = BulkTeardown(oci).run(['alice@example.com'],
+                                           dry_run=True)
+        ok_('UserDeleteRequest' not in stub.commands)
+        eq_(report.commands, 3)
+        eq_(len(report.workflow.steps), 7)
+
+    def test_failure(self):
+        """Users which can not be looked up are reported"""
+        stub = _teardown_stub([])
+        stub.responses['UserGetRequest21'] = error_command(
+            "[Error 4008] User not found")
+        with _async_client(stub) as oci:
+            report = BulkTeardown(oci).run(['alice@example.com'])
+        ok_("User not found" in report.failed['alice@example.com'])
+        ok_('UserDeleteRequest' not in stub.commands)
+
+
+def _tag_stub(tags):
+    """Keeps the custom tags of the devices in 'tags'."""
+    def _get(session_id, command):
+        device = command.findtext('deviceName')
+        if device not in tags:
+            return error_command("[Error 4800] Device not found")
+        return response_table(
+            'GroupAccessDeviceCustomTagGetListResponse',
+            'deviceCustomTagsTable',
+            ['Tag Name', 'Tag Value'], sorted(tags[device].items()))
+
+    def _set(session_id, command):
+        device = command.findtext('deviceName')
+        tags[device][command.findtext('tagName')] = \
+            command.findtext('tagValue')
+        return response_command('SuccessResponse')
+
+    def _delete(session_id, command):
+        device = command.findtext('deviceName')
+        for tag in command.findall('tagName'):
+            del tags[device][tag.text]
+        return response_command('SuccessResponse')
+
+    def _devices(session_id, command):
+        prefix = command.findtext('searchCriteriaDeviceName/value') or ''
+        return response_table(
+            'GroupAccessDeviceGetPagedSortedListResponse',
+            'accessDeviceTable', ['Device Name', 'Device Type'],
+            [[d, 'Polycom-550'] for d in sorted(tags)
+             if d.startswith(prefix)])
+    return OciStub(responses={
+        'GroupAccessDeviceCustomTagGetListRequest': _get,
+        'GroupAccessDeviceCustomTagAddRequest': _set,
+        'GroupAccessDeviceCustomTagModifyRequest': _set,
+        'GroupAccessDeviceCustomTagDeleteListRequest': _delete,
+        'GroupAccessDeviceGetPagedSortedListRequest': _devices})
+
+
+class TestBulkTagSync(object):
+
+    def test_sync(self):
+        """Only the tags which differ are changed"""
+        tags = dict(('pp%02d' % i, {'%A%': '1', '%B%': '2', '%C%': '3'})
+                    for i in range(20))
+        tags['other'] = {}
+        stub = _tag_stub(tags)
+        with _async_client(stub) as oci:
+            report = BulkTagSync(oci).run({
+                'pp*': {'%A%': '1', '%B%': 'two', '%C%': None, '%D%': True},
+                'pp00': {'%A%': '0'}})
+        eq_(len(report.devices), 20)
+        eq_(report.failed, {})
+        eq_(tags['pp01'], {'%A%': '1', '%B%': 'two', '%D%': 'true'})
+        eq_(tags['pp00']['%A%'], '0')
+        eq_(tags['other'], {})
+        eq_(str(report.changes['pp01']), "+%D%=true, ~%B%=two, -%C%")
+        eq_(stub.commands.count('GroupAccessDeviceCustomTagAddRequest'), 20)
+        eq_(stub.commands.count(
+            'GroupAccessDeviceCustomTagDeleteListRequest'), 20)
+        # Nothing left to change
+        with _async_client(stub) as oci:
+            report = BulkTagSync(oci).run({'pp*': {'%C%': None}})
+        eq_(report.changes, {})
+        eq_(report.commands, 1 + 20)
+
+    def test_exact_dry_run(self):
+        """exact deletes unlisted tags, a dry run changes nothing"""
+        tags = {'dev1': {'%A%': '1', '%B%': '2'}}
+        stub = _tag_stub(tags)
+        with _async_client(stub) as oci:
+            report = BulkTagSync(oci).run({'dev1': {'%A%': '1'}}, exact=True,
+                                          dry_run=True)
+        eq_(report.changes['dev1'].deleted, {'%B%': '2'})
+        eq_(tags['dev1'], {'%A%': '1', '%B%': '2'})
+        with _async_client(stub) as oci:
+            BulkTagSync(oci).run({'dev1': {'%A%': '1'}}, exact=True)
+        eq_(tags['dev1'], {'%A%': '1'})
+
+    def test_failure(self):
+        """Devices which can not be read are reported"""
+        stub = _tag_stub({})
+        with _async_client(stub) as oci:
+            report = BulkTagSync(oci).run({'dev1': {'%A%': '1'}})
+        ok_("Device not found" in report.failed['dev1'])
+
+
+class TestConfigRollout(object):
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.state = os.path.join(self.tmp, 'hashes.jsonl')
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_skip_unchanged(self):
+        """Only changed files are uploaded, and rebuilt per device"""
+        stub = OciStub()
+        configs = dict(('dev%d' % i, u'<config n="%d"/>' % i)
+                       for i in range(3))
+        with _async_client(stub) as oci:
+            report = ConfigRollout(oci, self.state).run(configs)
+        eq_(report.count('done'), 3)
+        ok_(not report.group_rebuild)
+        eq_(stub.commands.count(
+            'GroupCPEConfigRebuildDeviceConfigFileRequest'), 3)
+        ok_(all(r['upload_time'] >= 0 for r in report.records))
+        configs['dev1'] = u'<config n="changed"/>'
+        with _async_client(stub) as oci:
+            report = ConfigRollout(oci, self.state).run(configs)
+        eq_([(r['device'], r['status']) for r in report.records],
+            [('dev0', 'skipped'), ('dev1', 'done'), ('dev2', 'skipped')])
+        eq_(stub.commands.count('GroupAccessDeviceFileModifyRequest14sp8'),
+            4)
+        eq_(report.commands, 2)
+
+    def test_group_rebuild(self):
+        """Most devices of a type are rebuilt with one group command"""
+        standin = OciStandIn(passwords={'admin': 'secret'})
+        for i in range(15):
+            standin.add_device('dev%d' % i, 'Polycom-550')
+        standin.add_device('other', 'Polycom-650')
+        configs = dict(('dev%d' % i, '<config/>') for i in range(12))
+        with _async_client(standin) as oci:
+            report = ConfigRollout(oci).run(configs)
+            ok_(not report.group_rebuild)
+            eq_(report.commands, 24)
+            report = ConfigRollout(oci).run(configs,
+                                            device_type='Polycom-550')
+        ok_(report.group_rebuild)
+        # 12 uploads, one device list page, the group rebuild
+        eq_(report.commands, 14)
+        eq_([standin.devices['dev%d' % i]['rebuilds'] for i in (0, 14)],
+            [2, 1])
+        eq_(standin.devices['other']['rebuilds'], 0)
+
+    def test_large_group(self):
+        """A few devices of a large group are rebuilt one by one"""
+        standin = OciStandIn(passwords={'admin': 'secret'})
+        for i in range(40):
+            standin.add_device('dev%d' % i, 'Polycom-550')
+        configs = dict(('dev%d' % i, '<config/>') for i in range(12))
+        with _async_client(standin) as oci:
+            report = ConfigRollout(oci).run(configs,
+                                            device_type='Polycom-550')
+        ok_(not report.group_rebuild)
+        eq_(sum(d['rebuilds'] for d in standin.devices.values()), 12)
+
+    def test_state_per_group(self):
+        """Devices of the same name in another group are not skipped"""
+        stub = OciStub()
+        with _async_client(stub) as oci:
+            rollout = ConfigRollout(oci, self.state)
+            eq_(rollout.run({'dev1': 'x'}).count('done'), 1)
+            eq_(rollout.run({'dev1': 'x'}, group_id='Lab').count('done'), 1)
+            eq_(rollout.run({'dev1': 'x'}, group_id='Lab').count('skipped'),
+                1)
+            eq_(rollout.run({'dev1': 'x'}).count('skipped'), 1)
+        eq_(sorted(read_state(self.state, ConfigRollout.STATE_KEY)),
+            [('', 'Enterprise', 'Group', 'dev1'),
+             ('', 'Enterprise', 'Lab', 'dev1')])
+
+    def test_failed_not_recorded(self):
+        """Files whose upload failed are uploaded again"""
+        stub = OciStub(responses={
+            'GroupAccessDeviceFileModifyRequest14sp8': error_command(
+                "[Error 4800] Device not found")})
+        with _async_client(stub) as oci:
+            report = ConfigRollout(oci, self.state).run({'dev1': 'x'})
+        ok_("Device not found" in report.records[0]['error'])
+        eq_(read_state(self.state, 'device'), {})
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P Get response cache"""
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_cache import OciCache
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, response_command, \
+    response_table, error_command
+
+
+def _client(cache=None, **responses):
+    responses.setdefault('UserGetRequest21', response_command(
+        'UserGetResponse21', '<lastName>Anderson</lastName>'
+                             '<firstName>Alice</firstName>'))
+    responses.setdefault(
+        'GroupDomainGetAssignedListRequest', response_command(
+            'GroupDomainGetAssignedListResponse',
+            '<groupDefaultDomain>example.com</groupDefaultDomain>'))
+    responses.setdefault('UserGetListInGroupRequest', response_table(
+        'UserGetListInGroupResponse', 'userTable', ['User Id'],
+        [['alice@example.com']]))
+    stub = OciStub(responses=responses)
+    if cache is None:
+        cache = OciCache()
+    return OciClient("admin", "secret", "", transport=stub,
+                     cache=cache), stub, cache
+
+
+class TestCache(object):
+
+    def test_hit(self):
+        """Repeated Get commands are sent once"""
+        oci, stub, cache = _client()
+        eq_(oci.user_get_data('alice@example.com')['lastName'], 'Anderson')
+        eq_(oci.user_get_primary_device('alice@example.com'), None)
+        oci.user_get_data('alice@example.com')
+        eq_(stub.commands.count('UserGetRequest21'), 1)
+        eq_((cache.hits, cache.misses), (2, 1))
+        ok_('UserGetRequest21' in oci.oci_command)
+
+    def test_write_invalidates(self):
+        """Writes drop the entries of the same user and the lists"""
+        oci, stub, cache = _client()
+        oci.user_get_data('alice@example.com')
+        oci.user_get_data('bob@example.com')
+        oci.group_get_user_list()
+        oci.group_get_assigned_domains()
+        oci.activate_imp('alice@example.com')
+        oci.user_get_data('alice@example.com')
+        oci.user_get_data('bob@example.com')
+        oci.group_get_user_list()
+        oci.group_get_assigned_domains()
+        eq_(stub.commands.count('UserGetRequest21'), 3)
+        eq_(stub.commands.count('UserGetListInGroupRequest'), 2)
+        eq_(stub.commands.count('GroupDomainGetAssignedListRequest'), 1)
+        eq_(cache.invalidations, 2)
+
+    def test_device_write_invalidates_users(self):
+        """Deleting a device drops the users which may name it"""
+        oci, stub, cache = _client(UserGetRequest21=response_command(
+            'UserGetResponse21',
+            '<accessDeviceEndpoint><accessDevice><deviceLevel>Group'
+            '</deviceLevel><deviceName>pc1_alice</deviceName></accessDevice>'
+            '<linePort>lp_alice@example.com</linePort>'
+            '</accessDeviceEndpoint>'))
+        oci.user_get_primary_device('alice@example.com')
+        oci.group_get_assigned_domains()
+        oci.group_device_add_custom_tag('pc1_alice', '%A%', '1')
+        oci.user_get_primary_device('alice@example.com')
+        eq_(stub.commands.count('UserGetRequest21'), 1)
+        oci.group_access_device_delete('pc1_alice')
+        oci.user_get_primary_device('alice@example.com')
+        oci.group_get_assigned_domains()
+        eq_(stub.commands.count('UserGetRequest21'), 2)
+        eq_(stub.commands.count('GroupDomainGetAssignedListRequest'), 1)
+
+    def test_batch_invalidates(self):
+        """Batched writes invalidate too"""
+        oci, stub, cache = _client()
+        oci.group_device_get_custom_tags('dev1')
+        with oci.batch():
+            oci.group_device_add_custom_tag('dev1', '%A%', '1')
+        oci.group_device_get_custom_tags('dev1')
+        eq_(stub.commands.count('GroupAccessDeviceCustomTagGetListRequest'),
+            2)
+
+    def test_errors_not_cached(self):
+        """Error responses are not kept"""
+        oci, stub, cache = _client(UserGetRequest21=error_command("failed"))
+        assert_raises(AssertionError, oci.user_get, 'alice@example.com')
+        assert_raises(AssertionError, oci.user_get, 'alice@example.com')
+        eq_(stub.commands.count('UserGetRequest21'), 2)
+        eq_(len(cache), 0)
+
+    def test_bounds(self):
+        """Entries are evicted least recently used first, and expire"""
+        oci, stub, cache = _client(OciCache(max_entries=2))
+        for user in ['a', 'b', 'a', 'c', 'a', 'b']:
+            oci.user_get(user)
+        eq_(stub.commands.count('UserGetRequest21'), 4)
+        eq_(cache.stats(), {'hits': 2, 'misses': 4, 'invalidations': 0,
+                            'evictions': 2, 'entries': 2})
+        cache.ttl = -1
+        oci.user_get('c')
+        oci.user_get('c')
+        eq_(stub.commands.count('UserGetRequest21'), 6)
+
+    def test_shared(self):
+        """Clients of one admin share the entries"""
+        oci, stub, cache = _client()
+        other = OciClient("admin", "secret", "", transport=stub, cache=cache)
+        oci.user_get('alice@example.com')
+        other.user_get('alice@example.com')
+        eq_(stub.commands.count('UserGetRequest21'), 1)
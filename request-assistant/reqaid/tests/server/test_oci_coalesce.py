@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the coalescing of OCI-P list commands"""
+import threading
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_coalesce import OciCoalescer, \
+    list_command
+from reqaid.controllers.server.oci_response import OciError
+from reqaid.controllers.server.oci_numbers import number_pools
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, response_command, \
+    error_command
+from reqaid.controllers.server.oci_standin import OciStandIn
+
+
+def _activate(sent):
+    """Fails when a number starting with +1-999 is activated."""
+    def _response(session_id, command):
+        numbers = [e.text for e in command.findall('phoneNumber')]
+        sent.append(numbers)
+        if any(n.startswith('+1-999') for n in numbers):
+            return error_command("[Error 4405] Invalid phone number")
+        return response_command('SuccessResponse')
+    return _response
+
+
+def _client(sent, coalescer=None, stub=None):
+    stub = stub or OciStub(responses={
+        'GroupDnActivateListRequest': _activate(sent)})
+    return OciClient("admin", "secret", "http://xsp", transport=stub,
+                     coalescer=coalescer), stub
+
+
+class TestCoalesce(object):
+
+    def test_list_command(self):
+        """Only list commands with plain items are coalesced"""
+        command = list_command('UserServiceAssignListRequest',
+                               [{'userId': 'alice'},
+                                {'serviceName': 'Integrated IMP'}])
+        eq_(command.entity, 'alice')
+        eq_(command.items, [{'serviceName': 'Integrated IMP'}])
+        ok_(command.names('<userId>alice</userId>'))
+        eq_(list_command('UserDeleteRequest', [{'userId': 'alice'}]), None)
+
+    def test_batch(self):
+        """Batched list commands of one target are sent as one"""
+        sent = []
+        oci, stub = _client(sent)
+        with oci.batch() as batch:
+            for i in range(3):
+                oci.activate_number('+1-555000%d' % i)
+            oci.user_assign_service('alice@example.com', 'Integrated IMP')
+            oci.group_device_delete_custom_tag('dev1', '%A%')
+            oci.user_assign_service('alice@example.com', 'Shared Call '
+                                                         'Appearance')
+            oci.group_device_delete_custom_tag('dev1', '%B%')
+        eq_(sent, [['+1-5550000', '+1-5550001', '+1-5550002']])
+        eq_(stub.commands[-3:], [
+            'GroupDnActivateListRequest', 'UserServiceAssignListRequest',
+            'GroupAccessDeviceCustomTagDeleteListRequest'])
+        eq_(len(batch.results), 7)
+        ok_(all(r.ok for r in batch.results))
+
+    def test_batch_order(self):
+        """Commands are not merged across a command on the same target"""
+        oci, stub = _client([])
+        with oci.batch():
+            oci.user_assign_service('alice@example.com', 'Integrated IMP')
+            oci.activate_imp('alice@example.com')
+            oci.user_assign_service('alice@example.com', 'Shared Call '
+                                                         'Appearance')
+        eq_(stub.commands.count('UserServiceAssignListRequest'), 2)
+        with oci.batch(coalesce=False):
+            oci.activate_number('+1-5550000')
+            oci.activate_number('+1-5550001')
+        eq_(stub.commands.count('GroupDnActivateListRequest'), 2)
+
+    def test_batch_errors(self):
+        """Only the callers whose items failed get an error"""
+        sent = []
+        oci, stub = _client(sent)
+        with oci.batch() as batch:
+            r1 = oci.activate_number('+1-5550000')
+            r2 = oci.activate_number('+1-9990000')
+            r3 = oci.activate_number('+1-5550001')
+        eq_(sent, [['+1-5550000', '+1-9990000', '+1-5550001'],
+                   ['+1-5550000'], ['+1-9990000'], ['+1-5550001']])
+        ok_(r1.ok and r3.ok)
+        eq_(r2.error, "[Error 4405] Invalid phone number")
+        eq_(batch.errors, [r2])
+
+    def test_window(self):
+        """Callers sharing a coalescer are merged within the window"""
+        sent = []
+        coalescer = OciCoalescer(window=0.2)
+        oci, stub = _client(sent, coalescer)
+        clients = [oci] + [_client(sent, coalescer, stub)[0]
+                           for _ in range(3)]
+        errors = []
+
+        def _activate_number(client, number):
+            try:
+                client.activate_number(number)
+            except OciError as e:
+                errors.append((number, e.code))
+        threads = [threading.Thread(target=_activate_number,
+                                    args=(c, '+1-%s0000' % n))
+                   for c, n in zip(clients, ['555', '556', '999', '557'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(sorted(sent[0]), ['+1-5550000', '+1-5560000', '+1-5570000',
+                              '+1-9990000'])
+        eq_(len(sent), 5)
+        eq_(errors, [('+1-9990000', 4405)])
+        eq_(coalescer.stats(), {'commands': 4, 'requests': 1})
+
+    def test_window_single(self):
+        """A caller alone is sent as is, and gets its error"""
+        sent = []
+        oci, stub = _client(sent, OciCoalescer(window=0))
+        oci.activate_number('+1-5550000')
+        assert_raises(OciError, oci.activate_number, '+1-9990000')
+        eq_(sent, [['+1-5550000'], ['+1-9990000']])
+
+    def test_create_users(self):
+        """Numbers of users created at once are activated together"""
+        number_pools.clear()
+        standin = OciStandIn(passwords={'admin': 'secret'},
+                             numbers=['+1-555%07d' % i for i in range(10)],
+                             domains=['example.com'])
+        coalescer = OciCoalescer(window=0.2)
+        clients = [OciClient("admin", "secret", "http://xsp",
+                             transport=standin, coalescer=coalescer)
+                   for _ in range(4)]
+        threads = [threading.Thread(target=c.create_ucone_test_user,
+                                    args=("User%d" % i, "Load", "Welcom3"),
+                                    kwargs={'sca_devices': []})
+                   for i, c in enumerate(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(len(standin.users), 4)
+        eq_(sum(standin.numbers.values()), 4)
+        ok_(standin.commands.count('GroupDnActivateListRequest') < 4)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the phone number pools"""
+import threading
+from nose.tools import eq_, assert_raises
+
+from reqaid.controllers.server.oci_numbers import NumberPool, number_pools
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, response_command
+
+
+class _Fetch(object):
+
+    def __init__(self, numbers):
+        self.numbers = numbers
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.numbers)
+
+
+class TestNumberPool(object):
+
+    def test_reserve(self):
+        """Numbers are handed out lowest first, once"""
+        fetch = _Fetch(["+1-2145550010", "+1-2145550002", "0401", "sip"])
+        pool = NumberPool(low_water=0)
+        eq_([pool.reserve(fetch) for i in range(4)],
+            ["0401", "+1-2145550002", "+1-2145550010", "sip"])
+        eq_(fetch.calls, 1)
+        assert_raises(AssertionError, pool.reserve, fetch)
+
+    def test_large(self):
+        """Large ascending lists are split into sorted series"""
+        numbers = ["+1-214555%04d" % n for n in range(10000)] + \
+            ["+1-972555%04d" % n for n in range(5000)] + ["+1-2145550003"]
+        fetch = _Fetch(numbers)
+        pool = NumberPool(low_water=0)
+        pool.refresh(fetch)
+        eq_(len(pool), 15000)
+        eq_([pool.reserve(fetch) for i in range(2)],
+            ["+1-2145550000", "+1-2145550001"])
+        pool.release("+1-2145550000")
+        eq_(pool.reserve(fetch), "+1-2145550000")
+        eq_(pool.reserve(fetch), "+1-2145550002")
+
+    def test_release(self):
+        """Released numbers are handed out again, used ones are not"""
+        fetch = _Fetch(["1001", "1002"])
+        pool = NumberPool(low_water=0)
+        with pool.reservation(fetch) as used:
+            pass
+        try:
+            with pool.reservation(fetch) as failed:
+                raise ValueError()
+        except ValueError:
+            pass
+        eq_((used, failed), ("1001", "1002"))
+        eq_(pool.reserve(fetch), "1002")
+        eq_(pool.reserved, set(["1002"]))
+
+    def test_refresh(self):
+        """A low pool is fetched again, keeping the reservations"""
+        fetch = _Fetch(["1001", "1002", "1003"])
+        pool = NumberPool(low_water=2, refresh_interval=0)
+        eq_(pool.reserve(fetch), "1001")
+        eq_(pool.reserve(fetch), "1002")
+        eq_(fetch.calls, 1)
+        eq_(pool.reserve(fetch), "1003")
+        eq_(fetch.calls, 2)
+        eq_(len(pool), 0)
+
+    def test_concurrent(self):
+        """Parallel reservations get different numbers"""
+        fetch = _Fetch(["%d" % n for n in range(2000, 3000)])
+        pool = NumberPool()
+        reserved = []
+
+        def _reserve():
+            for i in range(100):
+                reserved.append(pool.reserve(fetch))
+        threads = [threading.Thread(target=_reserve) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(len(set(reserved)), 800)
+
+    def test_user_add(self):
+        """user_add() takes numbers from the group's pool"""
+        number_pools.clear()
+        stub = OciStub(responses={
+            'GroupDnGetAvailableListRequest': response_command(
+                'GroupDnGetAvailableListResponse',
+                '<phoneNumber>1001</phoneNumber>'
+                '<phoneNumber>1002</phoneNumber>')})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        oci.user_add("alice@example.com", "Anderson", "Alice", "pwd")
+        oci.user_add("bob@example.com", "Brown", "Bob", "pwd")
+        eq_(stub.commands.count('GroupDnGetAvailableListRequest'), 1)
+        eq_(oci.number_pool().used, set(["1001", "1002"]))
+        assert_raises(AssertionError, oci.user_add, "cecil@example.com",
+                      "Carter", "Cecil", "pwd")
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the paged OCI-P list reads"""
+import threading
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_paging import iter_pages
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, response_table
+
+
+def _fetcher(total, calls=None):
+    def _fetch(start, size):
+        if calls is not None:
+            calls.append(start)
+        return range(start, min(start + size, total + 1))
+    return _fetch
+
+
+def _paged_users(total):
+    def _response(session_id, command):
+        start = int(command.findtext('responsePagingControl/'
+                                     'responseStartIndex'))
+        size = int(command.findtext('responsePagingControl/'
+                                    'responsePageSize'))
+        ok_(command.find('sortByUserId') is not None)
+        return response_table(
+            'UserGetListInGroupPagedSortedListResponse', 'userTable',
+            ['User Id', 'Last Name'],
+            [['user%05d@example.com' % i, 'Last%d' % i]
+             for i in range(start, min(start + size, total + 1))])
+    return _response
+
+
+class TestPaging(object):
+
+    def test_pages(self):
+        """Pages are read until one is not full"""
+        for prefetch in [False, True]:
+            calls = []
+            pages = list(iter_pages(_fetcher(1200, calls), 500, prefetch))
+            eq_([len(p) for p in pages], [500, 500, 200])
+            eq_(calls, [1, 501, 1001])
+            eq_(sum(pages, []), range(1, 1201))
+        eq_([len(p) for p in iter_pages(_fetcher(1000), 500)],
+            [500, 500, 0])
+
+    def test_prefetch(self):
+        """The next page is fetched while the current one is processed"""
+        second = threading.Event()
+
+        def _fetch(start, size):
+            if start > 1:
+                second.set()
+            return range(start, start + (size if start == 1 else 1))
+        pages = iter_pages(_fetch, 10)
+        next(pages)
+        ok_(second.wait(2))
+        eq_(next(pages), [11])
+
+    def test_errors(self):
+        """Errors of the helper thread are raised in the caller"""
+        def _fetch(start, size):
+            if start > 1:
+                raise AssertionError("failed")
+            return range(size)
+        pages = iter_pages(_fetch, 10)
+        next(pages)
+        assert_raises(AssertionError, next, pages)
+
+    def test_early_stop(self):
+        """Stopping early ends the helper thread"""
+        calls = []
+        pages = iter_pages(_fetcher(10 ** 6, calls), 10)
+        next(pages)
+        pages.close()
+        eq_([t for t in threading.enumerate()
+             if t.name == 'OciPagePrefetch'], [])
+        ok_(len(calls) <= 3)
+
+    def test_group_users(self):
+        """Group users are read page by page"""
+        stub = OciStub(responses={
+            'UserGetListInGroupPagedSortedListRequest': _paged_users(1200)})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        documents = stub.documents
+        users = [u['User Id'] for u in oci.iter_group_users(page_size=500)]
+        eq_(len(users), 1200)
+        eq_(users[0], 'user00001@example.com')
+        eq_(users[-1], 'user01200@example.com')
+        eq_(stub.documents, documents + 3)
+
+    def test_limit(self):
+        """A limit stops paging and shrinks the pages"""
+        stub = OciStub(responses={
+            'UserGetListInGroupPagedSortedListRequest': _paged_users(1200)})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        documents = stub.documents
+        users = list(oci.iter_group_users(page_size=500, limit=30,
+                                          prefetch=False))
+        eq_(len(users), 30)
+        eq_(stub.documents, documents + 1)
+        ok_('<responsePageSize>30</responsePageSize>' in oci.oci_command)
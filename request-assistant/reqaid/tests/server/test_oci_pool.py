@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P session pool"""
+import time
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_pool import OciSessionPool
+
+
+class FakeClient(object):
+
+    def __init__(self, username, password, **kw):
+        self.username = username
+        self.password = password
+        self.logged_out = False
+
+    def logout_request(self):
+        self.logged_out = True
+
+
+def _pool(**kw):
+    created = []
+
+    def factory(**kwargs):
+        c = FakeClient(kwargs["username"], kwargs["password"])
+        created.append(c)
+        return c
+    kw.setdefault("reap_interval", None)
+    return OciSessionPool(factory, **kw), created
+
+
+ADMIN = dict(username="admin", password="secret", server="http://xsp")
+
+
+class TestOciSessionPool(object):
+
+    def test_reuse(self):
+        """A released session is handed out again"""
+        pool, created = _pool()
+        with pool.session(**ADMIN) as c1:
+            pass
+        with pool.session(**ADMIN) as c2:
+            pass
+        ok_(c1 is c2)
+        eq_(len(created), 1)
+
+    def test_keyed_by_server_and_user(self):
+        """Different admins get different sessions"""
+        pool, created = _pool()
+        with pool.session(**ADMIN):
+            pass
+        with pool.session(username="other", password="x",
+                          server="http://xsp"):
+            pass
+        eq_(len(created), 2)
+
+    def test_cap(self):
+        """No more than max_sessions are borrowed at once"""
+        pool, created = _pool(max_sessions=1, acquire_timeout=0.1)
+        c = pool.acquire(**ADMIN)
+        assert_raises(AssertionError, pool.acquire, **ADMIN)
+        pool.release(c)
+        ok_(pool.acquire(**ADMIN) is c)
+
+    def test_idle_eviction_logs_out(self):
+        """Idle sessions are logged out and dropped"""
+        pool, created = _pool(max_idle=0)
+        with pool.session(**ADMIN) as c:
+            pass
+        time.sleep(0.01)
+        eq_(pool.evict_idle(), 1)
+        ok_(c.logged_out)
+        eq_(pool.stats(), {})
+
+    def test_discard_on_failure(self):
+        """Sessions are dropped after non OCI failures"""
+        pool, created = _pool()
+        try:
+            with pool.session(**ADMIN) as c:
+                raise IOError("connection reset")
+        except IOError:
+            pass
+        ok_(c.logged_out)
+        with pool.session(**ADMIN) as c2:
+            ok_(c2 is not c)
+
+    def test_password_change(self):
+        """Sessions of an old admin password are not reused"""
+        pool, created = _pool()
+        with pool.session(**ADMIN) as c:
+            pass
+        with pool.session(username="admin", password="new",
+                          server="http://xsp") as c2:
+            ok_(c2 is not c)
+        ok_(c.logged_out)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the parsed OCI-P responses"""
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_response import OciError, \
+    make_response, PARSE_LIMIT
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, oci_document, \
+    response_command, response_table, error_command
+
+
+def _client(**responses):
+    stub = OciStub(responses=responses)
+    return OciClient("admin", "secret", "", transport=stub), stub
+
+
+class TestResponse(object):
+
+    def test_string(self):
+        """Responses are still the strings the transport returned"""
+        oci, stub = _client(UserGetRequest21=response_command(
+            'UserGetResponse21', '<lastName>Anderson</lastName>'))
+        response = oci.user_get('alice@example.com')
+        ok_(isinstance(response, str))
+        eq_(response, stub.process(oci.oci_command))
+        ok_('Anderson' in response)
+        eq_(response.tree.findtext('.//lastName'), 'Anderson')
+        eq_(make_response(u'%s' % response).tree.findtext('.//lastName'),
+            'Anderson')
+        ok_(isinstance(make_response(u'%s' % response), unicode))
+
+    def test_parsed_once(self):
+        """The tree of a small response is parsed when received"""
+        response = make_response(oci_document('s1', response_command('x')))
+        ok_(response.parsed is not None)
+        ok_(response.tree is response.parsed)
+        eq_(response.error, None)
+
+    def test_large(self):
+        """Large responses are parsed only when the tree is used"""
+        response = make_response(oci_document('s1', response_table(
+            'UserGetListInGroupResponse', 'userTable', ['User Id'],
+            [['user%d@example.com' % i] for i in range(PARSE_LIMIT / 20)])))
+        eq_(response.error, None)
+        eq_(response.parsed, None)
+        eq_(len(response.tree.findall('.//row')), PARSE_LIMIT / 20)
+
+    def test_error(self):
+        """Error responses raise OciError with the error details"""
+        oci, stub = _client(UserGetRequest21=error_command(
+            "[Error 4008] User not found: alice@example.com", "no such user"))
+        try:
+            oci.user_get('alice@example.com')
+        except OciError as e:
+            eq_(e.code, 4008)
+            eq_(e.summary, "[Error 4008] User not found: alice@example.com")
+            eq_(e.detail, "no such user")
+            ok_('UserGetRequest21' in e.command)
+            ok_(str(e).startswith("Error response received"))
+        else:
+            ok_(False, "no OciError raised")
+        assert_raises(AssertionError, oci.user_get, 'alice@example.com')
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P search criteria of the list helpers"""
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_search import USER_FIELDS, \
+    SearchCriteria, starts_with, contains, equals, criteria_elements, \
+    matching
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, response_command, \
+    response_table
+
+_USERS = ['alice@example.com', 'bob@example.com', 'anna@example.com']
+
+
+def _searched_users(session_id, command):
+    """Applies searchCriteriaUserId and responseSizeLimit like BroadWorks."""
+    users = _USERS
+    criteria = command.find('searchCriteriaUserId')
+    if criteria is not None:
+        search = SearchCriteria(
+            'userId', criteria.findtext('value'),
+            {'Starts With': 'starts with', 'Contains': 'contains',
+             'Equal To': 'equals'}[criteria.findtext('mode')],
+            criteria.findtext('isCaseInsensitive') == 'true')
+        users = [u for u in users if search.matches(u)]
+    limit = command.findtext('responseSizeLimit')
+    if limit is not None:
+        users = users[:int(limit)]
+    return response_table('UserGetListInGroupResponse', 'userTable',
+                          ['User Id'], [[u] for u in users])
+
+
+def _client():
+    stub = OciStub(responses={
+        'UserGetListInGroupRequest': _searched_users,
+        'GroupDnGetAvailableListRequest': response_command(
+            'GroupDnGetAvailableListResponse',
+            ''.join('<phoneNumber>+1-555%04d</phoneNumber>' % i
+                    for i in range(20))),
+        'GroupDomainGetAssignedListRequest': response_command(
+            'GroupDomainGetAssignedListResponse',
+            '<groupDefaultDomain>example.com</groupDefaultDomain>'
+            '<domain>lab.example.com</domain>'
+            '<domain>test.example.org</domain>')})
+    return OciClient("admin", "secret", "", transport=stub), stub
+
+
+class TestSearch(object):
+
+    def test_matches(self):
+        """Criteria match like the OCI-P search modes"""
+        ok_(starts_with('userId', 'AL').matches('alice@example.com'))
+        ok_(not starts_with('userId', 'AL', False).matches('alice'))
+        ok_(contains('userId', '@example').matches('alice@example.com'))
+        ok_(equals('userId', 'alice').matches('Alice'))
+        ok_(not equals('userId', 'alice').matches('alice2'))
+        assert_raises(AssertionError, SearchCriteria, 'userId', 'a', 'like')
+
+    def test_elements(self):
+        """Criteria are written in schema order, on known fields only"""
+        elements = criteria_elements(USER_FIELDS, [
+            starts_with('userId', 'a'), contains('lastName', 'And')])
+        eq_([e.keys()[0] for e in elements if 'parent' not in e],
+            ['searchCriteriaUserLastName', 'searchCriteriaUserId'])
+        eq_(elements[1], {'mode': 'Contains',
+                          'parent': 'searchCriteriaUserLastName'})
+        eq_(elements[3]['isCaseInsensitive'], 'true')
+        assert_raises(AssertionError, criteria_elements, USER_FIELDS,
+                      [equals('deviceName', 'dev1')])
+
+    def test_matching(self):
+        """Client side filtering stops at the limit"""
+        consumed = []
+
+        def _values():
+            for v in ['a1', 'b1', 'a2', 'a3', 'a4']:
+                consumed.append(v)
+                yield v
+        eq_(list(matching(_values(), [starts_with('x', 'a')], 2)),
+            ['a1', 'a2'])
+        eq_(consumed, ['a1', 'b1', 'a2'])
+        eq_(list(matching(['a'], limit=0)), [])
+
+    def test_user_list(self):
+        """Criteria and limit are sent in the request"""
+        oci, stub = _client()
+        users = oci.group_get_user_list(search=[starts_with('userId', 'a')])
+        eq_([u['User Id'] for u in users],
+            ['alice@example.com', 'anna@example.com'])
+        table = oci.group_get_user_table(['User Id'], limit=1)
+        eq_(table.column('User Id'), ['alice@example.com'])
+        ok_('<responseSizeLimit>1</responseSizeLimit>' in oci.oci_command)
+
+    def test_unsearchable_lists(self):
+        """Lists without criteria are filtered as they are read"""
+        oci, stub = _client()
+        eq_(oci.group_get_available_numbers(limit=3),
+            ['+1-5550000', '+1-5550001', '+1-5550002'])
+        eq_(oci.group_get_available_numbers(
+            search=[contains('phoneNumber', '555001')]),
+            ['+1-5550010', '+1-5550011', '+1-5550012', '+1-5550013',
+             '+1-5550014', '+1-5550015', '+1-5550016', '+1-5550017',
+             '+1-5550018', '+1-5550019'])
+        eq_(oci.group_get_assigned_domains(limit=1), ['example.com'])
+        eq_(oci.group_get_assigned_domains(
+            search=[starts_with('domain', 'test.')]), ['test.example.org'])
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the stateful OCI-P stand-in"""
+import random
+import threading
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server import tools
+from reqaid.controllers.server.oci_tool import OciClient, _device_plan
+from reqaid.controllers.server.oci_response import OciError
+from reqaid.controllers.server.oci_numbers import number_pools
+from reqaid.controllers.server.oci_search import starts_with
+from reqaid.controllers.server.oci_stub import OciStubServer
+from reqaid.controllers.server.oci_standin import OciStandIn
+
+NUMBERS = ['+1-555%07d' % i for i in range(200)]
+
+
+def _standin(**kwargs):
+    return OciStandIn(passwords={'admin': 'secret'}, numbers=NUMBERS,
+                      domains=['example.com', 'lab.example.com'], **kwargs)
+
+
+def _client(standin, password='secret'):
+    return OciClient("admin", password, "http://xsp", transport=standin)
+
+
+class TestStandIn(object):
+
+    def setup(self):
+        number_pools.clear()
+
+    def test_login(self):
+        """The signed password of the two phase login is verified"""
+        standin = _standin()
+        assert_raises(OciError, _client, standin, 'wrong')
+        eq_(_client(standin).group, 'Group')
+
+    def test_create_user(self):
+        """Test users are created with their number, services and devices"""
+        standin = _standin()
+        oci = _client(standin)
+        user = oci.create_ucone_test_user(
+            "Alice", "Anderson", "Welcom3",
+            sca_devices=['Business Communicator - PC'])
+        user_id = user['userId']
+        eq_((user_id, user['phoneNumber']),
+            ('andersonAlice'.lower() + '@example.com', NUMBERS[0]))
+        ok_(standin.numbers[NUMBERS[0]])
+        eq_(oci.user_get_assigned_services(user_id)['Integrated IMP'], True)
+        snapshot = oci.user_snapshot(user_id)
+        eq_(snapshot.errors, {})
+        eq_(snapshot.primary_device['device_type'], 'Polycom-550')
+        eq_([d['Device Type'] for d in snapshot.sca_devices],
+            ['Business Communicator - PC'])
+        eq_(len(standin.devices), 2)
+        oci.delete_user_and_devices(user_id)
+        eq_((standin.users, standin.devices), ({}, {}))
+        eq_(oci.group_get_available_numbers(limit=1), NUMBERS[:1])
+
+    def test_errors(self):
+        """Commands fail like on BroadWorks"""
+        standin = _standin()
+        oci = _client(standin)
+        standin.add_user('bob@example.com', 'Brown', 'Bob',
+                         phone_number=NUMBERS[1])
+        assert_raises(OciError, oci.user_add, 'bob@example.com', 'Brown',
+                      'Bob', 'Welcom3', phone_number=NUMBERS[2])
+        with assert_raises(OciError) as e:
+            oci.user_add('carol@example.com', 'Carter', 'Carol', 'Welcom3',
+                         phone_number=NUMBERS[1])
+        eq_(e.exception.code, 4208)
+        with assert_raises(OciError) as e:
+            oci.activate_imp('bob@example.com')
+        eq_(e.exception.code, 4410)
+        oci.group_access_device_add('dev1', 'Polycom-550', 'dev1', 'pwd')
+        oci.user_primary_endpoint_add('bob@example.com', 'dev1', 'lp1')
+        with assert_raises(OciError) as e:
+            oci.group_access_device_delete('dev1')
+        eq_(e.exception.code, 4453)
+        oci.user_primary_endpoint_delete('bob@example.com')
+        oci.group_access_device_delete('dev1')
+        with assert_raises(OciError) as e:
+            oci.user_get('nobody@example.com')
+        eq_(e.exception.code, 4008)
+
+    def test_existing_user(self):
+        """Creating a user which exists changes nothing"""
+        standin = _standin()
+        oci = _client(standin)
+        args = ("Alice", "Anderson", "Welcom3")
+        user = oci.create_ucone_test_user(
+            *args, sca_devices=['Business Communicator - PC'])
+        devices = sorted(standin.devices)
+        numbers = dict(standin.numbers)
+        with assert_raises(OciError) as e:
+            oci.create_ucone_test_user(
+                *args, sca_devices=['Business Communicator - PC'])
+        eq_(e.exception.code, 4200)
+        eq_(sorted(standin.devices), devices)
+        eq_(standin.numbers, numbers)
+        eq_(len(standin.users[user['userId']]['sca']), 1)
+
+    def test_existing_device(self):
+        """A user is not attached to a device which already existed"""
+        standin = _standin()
+        oci = _client(standin)
+        standin.add_user('bob@example.com', 'Brown', 'Bob',
+                         phone_number=NUMBERS[1])
+        random.seed(1)
+        name = _device_plan('bob@example.com', 'Polycom-550', [])[0][2]
+        standin.add_device(name, 'Polycom-550')
+        random.seed(1)
+        assert_raises(AssertionError, oci.provision_user_with_devices,
+                      'bob@example.com', 'Polycom-550', [],
+                      delete_existing=False)
+        eq_(standin.users['bob@example.com']['endpoint'], None)
+        eq_(standin.devices[name]['line_ports'], set())
+
+    def test_lists(self):
+        """Lists are searched, sorted, limited and paged"""
+        standin = _standin()
+        standin.populate(5)
+        standin.add_user('alice@lab.example.com', 'Anderson', 'Alice')
+        oci = _client(standin)
+        eq_([u['User Id'] for u in oci.group_get_user_list(
+            limit=2, search=[starts_with('userId', 'LOAD')])],
+            ['loadtest00000@example.com', 'loadtest00001@example.com'])
+        users = list(oci.iter_group_users(page_size=2))
+        eq_(users[0]['User Id'], 'alice@lab.example.com')
+        eq_(len(users), 6)
+        eq_(oci.group_get_assigned_domains(),
+            ['example.com', 'lab.example.com'])
+        eq_(oci.group_get_available_numbers(limit=1), NUMBERS[5:6])
+
+    def test_custom_tags(self):
+        """Custom tags of a device are kept"""
+        standin = _standin()
+        oci = _client(standin)
+        oci.group_access_device_add('dev1', 'Polycom-550', 'dev1', 'pwd')
+        oci.group_device_add_custom_tag('dev1', '%A%', '1')
+        oci.group_device_add_custom_tag('dev1', '%B%', '2')
+        oci.group_device_modify_custom_tag('dev1', '%A%', '3')
+        assert_raises(OciError, oci.group_device_add_custom_tag, 'dev1',
+                      '%B%', '4')
+        oci.group_device_delete_custom_tag('dev1', '%B%')
+        eq_(oci.group_device_get_custom_tags('dev1'), {'%A%': '3'})
+
+    def test_injected_errors(self):
+        """Errors can be injected, expired sessions log in again"""
+        standin = _standin()
+        oci = _client(standin)
+        standin.inject_error('UserGetListInGroupRequest')
+        with assert_raises(OciError) as e:
+            oci.group_get_user_list()
+        eq_(e.exception.code, 5000)
+        eq_(oci.group_get_user_list(), [])
+        standin.expire_sessions()
+        eq_(oci.group_get_user_list(), [])
+        eq_(standin.commands.count('LoginRequest14sp4'), 2)
+        eq_(standin.errors_injected, 1)
+
+    def test_concurrent_sessions(self):
+        """Sessions of many clients share the state over HTTP"""
+        standin = _standin()
+        server = OciStubServer(standin).start()
+        errors = []
+
+        def _create(i):
+            try:
+                oci = tools.create_oci_tool(
+                    username="admin", password="secret", server=server.xsp,
+                    transport="raw", wsdl_cache=None)
+                oci.create_ucone_test_user("User%d" % i, "Load", "Welcom3",
+                                           primary_device=None,
+                                           sca_devices=[])
+            except Exception as e:
+                errors.append(e)
+        try:
+            threads = [threading.Thread(target=_create, args=(i,))
+                       for i in range(100)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            server.stop()
+        eq_(errors, [])
+        eq_(len(standin.users), 100)
+        eq_(len(set(u['phoneNumber'] for u in standin.users.values())), 100)
+        eq_(len(standin.sessions), 100)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the streaming OCI-P response readers"""
+from nose.tools import eq_, ok_, assert_raises
+from xml.etree.cElementTree import ParseError
+
+from reqaid.controllers.server.oci_tables import iter_table, iter_rows, \
+    iter_dicts, iter_texts, response_error, decode_table
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, oci_document, \
+    response_command, response_table, error_command
+
+
+def _devices(count):
+    return response_table(
+        'GroupAccessDeviceGetListResponse', 'accessDeviceTable',
+        ['Device Name', 'Device Type'],
+        [['dev%d' % i, 'Polycom-550'] for i in range(count)])
+
+
+class TestTables(object):
+
+    def test_rows(self):
+        """Rows of the named table are yielded in order"""
+        response = oci_document('s1', response_command(
+            'UserServiceGetAssignmentListResponse',
+            '<servicePacksAssignmentTable>'
+            '<colHeading>Service Pack Name</colHeading>'
+            '<colHeading>Assigned</colHeading>'
+            '<row><col>Basic</col><col>true</col></row>'
+            '</servicePacksAssignmentTable>'
+            '<userServicesAssignmentTable>'
+            '<colHeading>Service Name</colHeading>'
+            '<colHeading>Assigned</colHeading>'
+            '<row><col>Voice Messaging User</col><col>true</col></row>'
+            '<row><col>Intercept User</col><col>false</col></row>'
+            '</userServicesAssignmentTable>'))
+        eq_(list(iter_rows(response, 'userServicesAssignmentTable')),
+            [['Voice Messaging User', 'true'], ['Intercept User', 'false']])
+        eq_(list(iter_dicts(response)),
+            [{'Service Pack Name': 'Basic', 'Assigned': 'true'}])
+        eq_(list(iter_table(response, 'noSuchTable')), [])
+
+    def test_empty_table(self):
+        """A table without rows still gives its headings"""
+        response = oci_document('s1', response_table(
+            'UserGetListInGroupResponse', 'userTable',
+            ['User Id', 'Last Name'], []))
+        eq_(list(iter_table(response)), [['User Id', 'Last Name']])
+        eq_(list(iter_dicts(response)), [])
+
+    def test_lazy(self):
+        """Rows are yielded before the rest of the response is parsed"""
+        response = oci_document('s1', _devices(5000))[:-1000] + '<broken'
+        rows = iter_rows(response)
+        eq_(next(rows), ['dev0', 'Polycom-550'])
+        assert_raises(ParseError, list, rows)
+
+    def test_unicode(self):
+        """Unicode responses are read whatever encoding they declare"""
+        response = oci_document('s1', response_table(
+            'GroupAccessDeviceCustomTagGetListResponse',
+            'deviceCustomTagsTable',
+            ['Tag Name', 'Tag Value'], [['%NAME%', u'J\xfcrgen €']]))
+        ok_(isinstance(response, unicode))
+        eq_(list(iter_rows(response)),
+            [['%NAME%', u'J\xfcrgen €']])
+
+    def test_texts(self):
+        """Repeated elements are read one by one"""
+        response = oci_document('s1', response_command(
+            'GroupDnGetAvailableListResponse',
+            '<phoneNumber>+1-2145550100</phoneNumber>'
+            '<phoneNumber>+1-2145550101</phoneNumber>'))
+        eq_(list(iter_texts(response, 'phoneNumber')),
+            ['+1-2145550100', '+1-2145550101'])
+
+    def test_response_error(self):
+        """Only Error responses give a summary"""
+        eq_(response_error(oci_document('s1', error_command("failed"))),
+            "failed")
+        eq_(response_error(oci_document('s1', _devices(3))), None)
+
+    def test_client(self):
+        """OciClient reads tables with the streaming readers"""
+        stub = OciStub(responses={
+            'GroupAccessDeviceCustomTagGetListRequest': response_table(
+                'GroupAccessDeviceCustomTagGetListResponse',
+                'deviceCustomTagsTable', ['Tag Name', 'Tag Value'],
+                [['%A%', '1'], ['%B%', '2']]),
+            'UserServiceGetAssignmentListRequest': response_table(
+                'UserServiceGetAssignmentListResponse',
+                'userServicesAssignmentTable', ['Service Name', 'Assigned'],
+                [['Voice Messaging User', 'true'], ['Intercept User',
+                                                    'false']])})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        eq_(oci.group_device_get_custom_tags('dev1'), {'%A%': '1',
+                                                       '%B%': '2'})
+        eq_(oci.user_get_assigned_services('alice@example.com'),
+            {'Voice Messaging User': True, 'Intercept User': False})
+        ok_(oci.command_count > 2)
+
+
+class TestOciTable(object):
+
+    def test_columns(self):
+        """Values are stored per column, rows are built on demand"""
+        table = decode_table(oci_document('s1', _devices(3)))
+        eq_(table.headings, ('Device Name', 'Device Type'))
+        eq_(len(table), 3)
+        eq_(table.column('Device Name'), ['dev0', 'dev1', 'dev2'])
+        eq_(table[1], ('dev1', 'Polycom-550'))
+        eq_(list(table.rows('Device Type', 'Device Name'))[0],
+            ('Polycom-550', 'dev0'))
+        eq_(list(table.dicts()),
+            list(iter_dicts(oci_document('s1', _devices(3)))))
+        eq_(table.mapping('Device Name', 'Device Type')['dev2'],
+            'Polycom-550')
+
+    def test_shared_values(self):
+        """Equal values are stored once"""
+        types = decode_table(oci_document('s1', _devices(100))).column(
+            'Device Type')
+        eq_(len(set(id(t) for t in types)), 1)
+
+    def test_where(self):
+        """Rows are filtered by column without building the others"""
+        table = decode_table(oci_document('s1', _devices(20)))
+        eq_(table.where('Device Name', 'dev7').column('Device Name'),
+            ['dev7'])
+        eq_(len(table.where('Device Name', lambda n: n.endswith('1'))), 2)
+        eq_(len(table.where('Device Type', 'Other')), 0)
+
+    def test_selected_columns(self):
+        """Only the requested columns are kept"""
+        table = decode_table(oci_document('s1', _devices(3)),
+                             columns=['Device Type'])
+        eq_(table.headings, ('Device Type',))
+        assert_raises(KeyError, table.column, 'Device Name')
+
+    def test_not_found(self):
+        """A missing table has no rows"""
+        table = decode_table(oci_document('s1', _devices(3)), 'userTable')
+        eq_(len(table), 0)
+        eq_(table.column('User Id'), [])
+        eq_(list(table.dicts()), [])
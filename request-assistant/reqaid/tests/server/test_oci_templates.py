@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the compiled OCI-P command templates"""
+import time
+import logging
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_templates import build_command, \
+    render_command
+
+log = logging.getLogger(__name__)
+
+
+def _endpoint(user_id, value):
+    return [{'userId': user_id},
+            {'endpoint': None},
+            {'accessDeviceEndpoint': None, 'parent': 'endpoint'},
+            {'accessDevice': None, 'parent': 'endpoint/accessDeviceEndpoint'},
+            {'deviceLevel': 'Group',
+             'parent': 'endpoint/accessDeviceEndpoint/accessDevice'},
+            {'deviceName': value,
+             'parent': 'endpoint/accessDeviceEndpoint/accessDevice'},
+            {'linePort': 'lp_%s' % value,
+             'parent': 'endpoint/accessDeviceEndpoint'}]
+
+
+def _reference(cmd, cmd_elements):
+    elements = []
+    for elem in cmd_elements:
+        elem = dict(elem)
+        parent = elem.pop('parent', None)
+        elements.append((elem, parent))
+    return build_command(cmd, elements)
+
+
+class TestTemplates(object):
+
+    def test_same_output(self):
+        """Templates give the same XML as ElementTree"""
+        for value in ['dev1', u'd\xe9v & <1> "\'', 'a&b', u'€',
+                      'd\xc3\xa9v']:
+            for cmd_elements in [
+                    _endpoint('alice@example.com', value),
+                    [{'userId': value}, {'endpoint': ''}],
+                    [{'serviceProviderId': 'Enterprise'},
+                     {'groupId': value}, {'deviceName': None}]]:
+                eq_(render_command('UserModifyRequest17sp4', cmd_elements),
+                    _reference('UserModifyRequest17sp4', cmd_elements))
+
+    def test_not_modified(self):
+        """Element dicts are left as they are"""
+        cmd_elements = _endpoint('alice@example.com', 'dev1')
+        render_command('UserModifyRequest17sp4', cmd_elements)
+        eq_(cmd_elements, _endpoint('alice@example.com', 'dev1'))
+
+    def test_errors(self):
+        """Values ElementTree refuses are still refused"""
+        assert_raises(TypeError, render_command, 'UserGetRequest21',
+                      [{'userId': 1}])
+        assert_raises(AttributeError, render_command, 'UserGetRequest21',
+                      [{'userId': 'alice'}, {'x': 'y', 'parent': 'nowhere'}])
+
+    def test_benchmark(self):
+        """Templates are cheaper than building element trees"""
+        commands = [_endpoint('user%d@example.com' % i, 'dev%d' % i)
+                    for i in range(500)]
+        timings = {}
+        for name, func in [("elementtree", _reference),
+                           ("template", render_command)]:
+            # Best of several runs, a single run may be slowed down by
+            # other processes
+            for i in range(5):
+                start = time.time()
+                for cmd_elements in commands:
+                    func('UserModifyRequest17sp4', cmd_elements)
+                elapsed = time.time() - start
+                timings[name] = min(timings.get(name, elapsed), elapsed)
+        log.info("500 commands: ElementTree %.3fs, template %.3fs" %
+                 (timings["elementtree"], timings["template"]))
+        ok_(timings["template"] < timings["elementtree"], timings)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P client"""
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, error_command, \
+    response_command, response_table
+
+
+def _client(**responses):
+    stub = OciStub(responses=responses)
+    return OciClient("admin", "secret", "http://xsp", transport=stub), stub
+
+
+class TestBatch(object):
+
+    def test_one_document(self):
+        """Batched commands are sent in one document"""
+        oci, stub = _client()
+        documents = stub.documents
+        with oci.batch() as batch:
+            r1 = oci.group_access_device_delete("dev1")
+            r2 = oci.activate_imp("alice@example.com")
+        eq_(stub.documents, documents + 1)
+        eq_(stub.commands[-2:], ["GroupAccessDeviceDeleteRequest",
+                                 "UserIntegratedIMPModifyRequest"])
+        ok_(r1.ok and r2.ok)
+        eq_(batch.results, [r1, r2])
+
+    def test_per_command_errors(self):
+        """A failing command does not fail the others"""
+        oci, stub = _client(UserIntegratedIMPModifyRequest=error_command(
+            "[Error 4008] User not found"))
+        with oci.batch() as batch:
+            r1 = oci.activate_imp("alice@example.com")
+            r2 = oci.group_access_device_delete("dev1")
+        eq_(r1.error, "[Error 4008] User not found")
+        ok_(r2.ok)
+        eq_(batch.errors, [r1])
+
+    def test_check(self):
+        """batch(check=True) raises when a command failed"""
+        oci, stub = _client(UserDeleteRequest=error_command("failed"))
+
+        def _run():
+            with oci.batch(check=True):
+                oci.user_delete("alice@example.com")
+        assert_raises(AssertionError, _run)
+
+    def test_max_commands(self):
+        """Large batches are split into several documents"""
+        oci, stub = _client()
+        documents = stub.documents
+        with oci.batch(max_commands=2) as batch:
+            for i in range(5):
+                oci.group_access_device_delete("dev%d" % i)
+        eq_(stub.documents, documents + 3)
+        eq_(len([r for r in batch.results if r.ok]), 5)
+
+    def test_nested(self):
+        """Nested batches join the outer batch"""
+        oci, stub = _client()
+        documents = stub.documents
+        with oci.batch() as outer:
+            oci.user_delete("alice@example.com")
+            with oci.batch() as inner:
+                oci.user_delete("bob@example.com")
+            ok_(inner is outer)
+        eq_(stub.documents, documents + 1)
+
+    def test_provision_user_with_devices(self):
+        """Devices are added with one document, then their endpoints"""
+        oci, stub = _client()
+        documents = stub.documents
+        oci.provision_user_with_devices(
+            "alice@example.com", "Polycom-550",
+            ["Business Communicator - PC"], delete_existing=False)
+        eq_(stub.documents, documents + 2)
+        eq_(stub.commands[-4:], ["GroupAccessDeviceAddRequest14",
+                                 "GroupAccessDeviceAddRequest14",
+                                 "UserModifyRequest17sp4",
+                                 "UserSharedCallAppearance"
+                                 "AddEndpointRequest14sp2"])
+
+
+class TestSnapshot(object):
+
+    def _client(self, **responses):
+        responses.setdefault('UserGetRequest21', response_command(
+            'UserGetResponse21',
+            '<lastName>Anderson</lastName><firstName>Alice</firstName>'
+            '<accessDeviceEndpoint><accessDevice><deviceLevel>Group'
+            '</deviceLevel><deviceName>pc1_alice</deviceName></accessDevice>'
+            '<linePort>lp_alice@example.com</linePort>'
+            '</accessDeviceEndpoint>'))
+        responses.setdefault('GroupAccessDeviceGetRequest18sp1',
+                             response_command(
+                                 'GroupAccessDeviceGetResponse18sp1',
+                                 '<deviceType>Polycom-550</deviceType>'
+                                 '<userName>alice</userName>'))
+        responses.setdefault(
+            'UserSharedCallAppearanceGetRequest16sp2', response_table(
+                'UserSharedCallAppearanceGetResponse16sp2', 'endpointTable',
+                ['Device Name', 'Device Type', 'Line/Port'],
+                [['bcm_alice', 'Business Communicator - Mobile',
+                  'lp_bcm_alice@example.com']]))
+        responses.setdefault(
+            'UserServiceGetAssignmentListRequest', response_table(
+                'UserServiceGetAssignmentListResponse',
+                'userServicesAssignmentTable', ['Service Name', 'Assigned'],
+                [['Shared Call Appearance', 'true'], ['Intercept User',
+                                                      'false']]))
+        return _client(**responses)
+
+    def test_snapshot(self):
+        """All facets are read with two documents"""
+        oci, stub = self._client()
+        documents = stub.documents
+        snapshot = oci.user_snapshot('alice@example.com')
+        eq_(stub.documents, documents + 2)
+        eq_(snapshot.data['lastName'], 'Anderson')
+        eq_(snapshot.primary_device, {'device_type': 'Polycom-550',
+                                      'user_name': 'alice',
+                                      'device_name': 'pc1_alice',
+                                      'line_port': 'lp_alice@example.com'})
+        eq_(snapshot.sca_devices,
+            oci.user_get_sca_list('alice@example.com'))
+        eq_(snapshot.services, {'Shared Call Appearance': True,
+                                'Intercept User': False})
+        eq_(snapshot.security_classification, 'Unclassified')
+        eq_(snapshot.network_conferencing, {})
+        eq_(snapshot.errors, {})
+        ok_('bcm_alice' in str(snapshot))
+
+    def test_errors(self):
+        """Facets which fail are reported, the others are still read"""
+        oci, stub = self._client(UserServiceGetAssignmentListRequest=(
+            error_command("[Error 4410] Service not assigned")),
+            GroupAccessDeviceGetRequest18sp1=error_command("no device"))
+        snapshot = oci.user_snapshot('alice@example.com')
+        eq_(snapshot.services, None)
+        eq_(snapshot.primary_device, None)
+        eq_(sorted(snapshot.errors), ['primary_device', 'services'])
+        eq_(snapshot.data['firstName'], 'Alice')
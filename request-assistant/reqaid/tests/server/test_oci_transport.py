@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P transports"""
+import io
+import os
+import time
+import base64
+import socket
+import logging
+import tempfile
+import requests
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server import tools
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_transport import RawSoapTransport, \
+    SudsTransport, TcpTransport, StreamedDocument, soap_envelope, \
+    oci_response
+from reqaid.controllers.server.oci_stub import OciStub, OciStubServer, \
+    OciStubTcpServer, response_command
+
+log = logging.getLogger(__name__)
+
+
+def setup():
+    global server
+    server = OciStubServer().start()
+
+
+def teardown():
+    server.stop()
+
+
+def _oci_tool(transport, **kwargs):
+    return tools.create_oci_tool(username="admin", password="secret",
+                                 server=server.xsp, transport=transport,
+                                 wsdl_cache=None, **kwargs)
+
+
+class TestSoapEnvelope(object):
+
+    def test_round_trip(self):
+        """OCI documents survive escaping into and out of an envelope"""
+        doc = u'<?xml version="1.0"?><a b="&amp;">\xe9 < \'"</a>'
+        envelope = soap_envelope(doc).replace(
+            "<in0", "<processOCIMessageReturn").replace(
+            "</in0>", "</processOCIMessageReturn>")
+        eq_(oci_response(envelope.encode('utf-8')), doc)
+
+    def test_fault(self):
+        """SOAP faults are reported"""
+        assert_raises(ValueError, oci_response,
+                      "<soapenv:Fault><faultstring>boom</faultstring>")
+
+
+def _capture_uploads(stub):
+    """Keeps the decoded file contents the stub receives."""
+    uploads = []
+
+    def _upload(session_id, command):
+        uploads.append(base64.b64decode(
+            command.findtext('uploadFile/fileContent')))
+        return response_command('SuccessResponse')
+    stub.responses['GroupAccessDeviceFileModifyRequest14sp8'] = _upload
+    return uploads
+
+
+class TestStreamedDocument(object):
+
+    def test_chunks(self):
+        """The file is encoded chunk by chunk, again on every iteration"""
+        content = os.urandom(100000)
+        document = StreamedDocument('<head>', io.BytesIO(content), '</head>',
+                                    chunk_size=3 * 1024)
+        for i in range(2):
+            chunks = list(document)
+            eq_(chunks[0], '<head>')
+            eq_(chunks[-1], '</head>')
+            ok_(max(len(c) for c in chunks) <= 4 * 1024)
+            eq_(''.join(chunks[1:-1]), base64.b64encode(content))
+        eq_(len(document), len(document.getvalue()))
+        eq_(document.read(10), '<head>' + base64.b64encode(content)[:4])
+        eq_(len(document.read()), len(document) - 10)
+        eq_(document.read(), '')
+        eq_(document.count('<head>'), 1)
+        ok_('[100000 bytes base64 encoded]' in str(document))
+
+    def test_path(self):
+        """Files are read from disk"""
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, 'abcd')
+            os.close(fd)
+            eq_(StreamedDocument('', path, '').getvalue(),
+                base64.b64encode('abcd'))
+        finally:
+            os.remove(path)
+
+
+def _best_time(oci, count, repeat=5):
+    """
+    Best time of several runs of 'count' commands, a single run may be
+    slowed down by other processes.
+    """
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        for j in range(count):
+            oci.user_delete("alice@example.com")
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+class TestTransports(object):
+
+    def test_raw(self):
+        """OciClient logs in and sends commands over the raw transport"""
+        oci = _oci_tool("raw")
+        ok_(isinstance(oci.transport, RawSoapTransport))
+        eq_(oci.service_provider, "Enterprise")
+        eq_(oci.group, "Group")
+        oci.user_delete("alice@example.com")
+        eq_(oci.transport._fallback, None)
+
+    def test_suds(self):
+        """The default transport is suds"""
+        oci = _oci_tool("suds")
+        ok_(isinstance(oci.transport, SudsTransport))
+        eq_(oci.group, "Group")
+
+    def test_fallback(self):
+        """The raw transport falls back to suds when it can not connect"""
+        used = []
+        stub = OciStub()
+
+        class Fallback(object):
+            def process(self, oci_command):
+                used.append(oci_command)
+                return stub.process(oci_command)
+
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        transport = RawSoapTransport("http://127.0.0.1:%d/" % port,
+                                     fallback=Fallback)
+        OciClient("admin", "secret", server.xsp, transport=transport)
+        eq_(len(used), 2)
+
+    def test_no_resend(self):
+        """Requests which reached the XSP are not sent again"""
+        used = []
+        transport = RawSoapTransport(server.xsp + "/nowhere",
+                                     fallback=lambda: used.append(1))
+        assert_raises(ValueError, transport.process, "<doc/>")
+        slow = OciStubServer(OciStub(latency=0.5)).start()
+        try:
+            transport = RawSoapTransport(
+                slow.xsp + "/webservice/services/ProvisioningService",
+                fallback=lambda: used.append(1), timeout=0.1)
+            assert_raises(requests.Timeout, transport.process, "<doc/>")
+        finally:
+            slow.stop()
+        eq_(used, [])
+
+    def test_relogin(self):
+        """Expired sessions are logged in again transparently"""
+        oci = _oci_tool("raw")
+        server.stub.sessions.clear()
+        oci.user_delete("alice@example.com")
+        eq_(server.stub.commands[-3:], ['AuthenticationRequest',
+                                        'LoginRequest14sp4',
+                                        'UserDeleteRequest'])
+
+    def test_upload(self):
+        """Uploads are streamed through the raw and suds transports"""
+        uploads = _capture_uploads(server.stub)
+        content = os.urandom(300000)
+        for transport in ["raw", "suds"]:
+            oci = _oci_tool(transport)
+            oci.group_device_upload_config_file('dev1', io.BytesIO(content),
+                                                chunk_size=3 * 4096)
+            ok_('[300000 bytes base64 encoded]' in str(oci.oci_command))
+            eq_(getattr(oci.transport, '_fallback', None), None)
+        eq_(uploads, [content, content])
+
+    def test_benchmark(self):
+        """The raw transport is cheaper than suds"""
+        timings = {}
+        for transport in ["suds", "raw"]:
+            oci = _oci_tool(transport)
+            timings[transport] = _best_time(oci, 50)
+        log.info("processOCIMessage x 50: suds %.3fs, raw %.3fs" %
+                 (timings["suds"], timings["raw"]))
+        ok_(timings["raw"] < timings["suds"], timings)
+
+
+class TestTcpTransport(object):
+
+    def setup(self):
+        self.server = OciStubTcpServer().start()
+
+    def teardown(self):
+        self.server.stop()
+
+    def _oci_tool(self):
+        return tools.create_oci_tool(username="admin", password="secret",
+                                     server="http://127.0.0.1",
+                                     transport="tcp",
+                                     oci_port=self.server.port)
+
+    def test_tcp(self):
+        """OciClient logs in and sends commands over native OCI-P"""
+        oci = self._oci_tool()
+        ok_(isinstance(oci.transport, TcpTransport))
+        eq_(oci.group, "Group")
+        oci.user_delete("alice@example.com")
+        eq_(self.server.stub.commands, ['AuthenticationRequest',
+                                        'LoginRequest14sp4',
+                                        'UserDeleteRequest'])
+        eq_(self.server.connections, 1)
+
+    def test_upload(self):
+        """Uploads are streamed over native OCI-P"""
+        uploads = _capture_uploads(self.server.stub)
+        content = os.urandom(100000)
+        self._oci_tool().group_device_upload_config_file(
+            'dev1', io.BytesIO(content))
+        eq_(uploads, [content])
+
+    def test_reconnect(self):
+        """A dropped connection is reopened and the session logged in again"""
+        oci = self._oci_tool()
+        oci.transport._sock.shutdown(socket.SHUT_RDWR)
+        for i in range(100):
+            if not self.server.stub.sessions:
+                break
+            time.sleep(0.01)
+        oci.user_delete("alice@example.com")
+        eq_(self.server.stub.commands, ['AuthenticationRequest',
+                                        'LoginRequest14sp4',
+                                        'UserDeleteRequest',
+                                        'AuthenticationRequest',
+                                        'LoginRequest14sp4',
+                                        'UserDeleteRequest'])
+        eq_(self.server.connections, 2)
+
+    def test_idle_close(self):
+        """A connection the server closed while idle is reopened"""
+        oci = self._oci_tool()
+        self.server._server.close_connections()
+        oci.user_delete("alice@example.com")
+        # The new connection has no session yet
+        eq_(self.server.stub.commands[2:], ['UserDeleteRequest',
+                                            'AuthenticationRequest',
+                                            'LoginRequest14sp4',
+                                            'UserDeleteRequest'])
+        eq_(self.server.connections, 2)
+
+    def test_no_resend(self):
+        """A document is not sent again when its response is lost"""
+        oci = self._oci_tool()
+
+        def _drop(session_id, command):
+            raise socket.error("dropped")
+        self.server.stub.responses['UserDeleteRequest'] = _drop
+        assert_raises(socket.error, oci.user_delete, "alice@example.com")
+        eq_(self.server.stub.commands.count('UserDeleteRequest'), 1)
+        eq_(self.server.connections, 1)
+
+    def test_benchmark(self):
+        """Native OCI-P is cheaper than SOAP"""
+        timings = {}
+        for transport, oci in [("raw", _oci_tool("raw")),
+                               ("tcp", self._oci_tool())]:
+            timings[transport] = _best_time(oci, 50)
+        log.info("OCI-P x 50: raw SOAP %.3fs, tcp %.3fs" %
+                 (timings["raw"], timings["tcp"]))
+        ok_(timings["tcp"] < timings["raw"], timings)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Test suite for OCI-P workflows"""
+from nose.tools import eq_, ok_
+
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_async import AsyncOciClient
+from reqaid.controllers.server.oci_workflow import Workflow
+from reqaid.controllers.server.oci_stub import OciStub, Rendezvous, \
+    error_command
+
+SCA_DEVICES = ['Business Communicator - PC', 'Connect - Mobile',
+               'Iris Messenger - Mobile', 'Business Communicator - Tablet']
+
+
+def _async_client(stub):
+    def factory(**kwargs):
+        return OciClient("admin", "secret", "", transport=stub)
+    return AsyncOciClient(factory, 4, username="admin", password="secret",
+                          server="http://xsp")
+
+
+class TestWorkflow(object):
+
+    def test_stages(self):
+        """Steps are staged after their dependencies"""
+        flow = Workflow()
+        a = flow.add('a', 'user_delete', ('alice@example.com',))
+        b = flow.add('b', 'user_delete', ('bob@example.com',))
+        flow.add('c', 'activate_imp', ('alice@example.com',), after=[a, b])
+        eq_([[s.name for s in stage] for stage in flow.stages()],
+            [['a', 'b'], ['c']])
+        ok_("c: activate_imp('alice@example.com')  (after a, b)" in
+            flow.describe())
+
+    def test_dry_run(self):
+        """A dry run sends nothing"""
+        stub = OciStub()
+        oci = OciClient("admin", "secret", "", transport=stub)
+        flow = oci.provision_user_with_devices_workflow(
+            "alice@example.com", "Polycom-550", SCA_DEVICES,
+            delete_existing=False)
+        commands = len(stub.commands)
+        result = flow.run(oci, dry_run=True)
+        eq_(len(stub.commands), commands)
+        ok_(result.ok)
+        eq_(len(flow.stages()), 2)
+
+    def test_concurrent(self):
+        """Independent devices are provisioned concurrently"""
+        rendezvous = Rendezvous(len(SCA_DEVICES))
+        stub = OciStub(responses={
+            'GroupAccessDeviceAddRequest14': rendezvous})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        flow = oci.provision_user_with_devices_workflow(
+            "alice@example.com", None, SCA_DEVICES, delete_existing=False)
+        with _async_client(stub) as async_oci:
+            result = flow.run(async_oci)
+        ok_(result.ok, result.report())
+        eq_(stub.commands.count('GroupAccessDeviceAddRequest14'), 4)
+        ok_(all(s.duration is not None for s in result.steps))
+        # All device additions were in flight at the same time
+        eq_(rendezvous.peak, len(SCA_DEVICES))
+
+    def test_failure(self):
+        """Steps after a failed step are skipped, others still run"""
+        stub = OciStub(responses={
+            'UserModifyRequest17sp4': error_command("failed")})
+        oci = OciClient("admin", "secret", "", transport=stub)
+        flow = Workflow()
+        flow.add('ep', 'user_primary_endpoint_delete', ('alice@example.com',))
+        flow.add('dev', 'group_access_device_delete', ('dev1',),
+                 after=['ep'])
+        flow.add('other', 'group_access_device_delete', ('dev2',))
+        result = flow.run(oci)
+        eq_([s.status for s in result.steps], ['failed', 'skipped', 'done'])
+        eq_(result.failed[0].name, 'ep')
+        ok_(not result.ok)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the OCI-P WSDL cache"""
+import os
+import shutil
+import tempfile
+from nose.tools import eq_, ok_
+
+from reqaid.controllers.server.oci_wsdl import WsdlCache
+from reqaid.controllers.server.oci_stub import OciStubServer, \
+    PROVISIONING_WSDL
+
+
+class TestWsdlCache(object):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = OciStubServer().start()
+        self.xsp = self.server.xsp
+        self.url = "%s/webservice/services/ProvisioningService?wsdl" % \
+                   self.xsp
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_client(self):
+        """Cached clients expose processOCIMessage"""
+        client = WsdlCache(self.directory).client(self.url)
+        ok_(hasattr(client.service, "processOCIMessage"))
+
+    def test_in_process_reuse(self):
+        """The WSDL is downloaded once per process"""
+        cache = WsdlCache(self.directory)
+        c1 = cache.client(self.url)
+        c2 = cache.client(self.url)
+        ok_(c1 is not c2)
+        ok_(c1.wsdl is c2.wsdl)
+        eq_(self.server.wsdl_requests, 1)
+
+    def test_disk_reuse(self):
+        """A new process loads the WSDL from disk without downloading it"""
+        WsdlCache(self.directory).client(self.url)
+        WsdlCache(self.directory).client(self.url)
+        eq_(self.server.wsdl_requests, 1)
+
+    def test_revalidation(self):
+        """An expired WSDL is downloaded again and replaced when changed"""
+        WsdlCache(self.directory).client(self.url)
+        cache = WsdlCache(self.directory, max_age=0)
+        c1 = cache.client(self.url)
+        eq_(self.server.wsdl_requests, 2)
+        entry = os.path.dirname(cache._meta_path(self.url))
+        eq_(len([f for f in os.listdir(entry) if f.endswith(".wsdl")]), 1)
+        # Unchanged, the parsed definition is kept
+        ok_(cache.client(self.url).wsdl is c1.wsdl)
+        self.server.wsdl = PROVISIONING_WSDL.replace(
+            "</wsdl:definitions>", "<!-- R22 -->\n</wsdl:definitions>")
+        c2 = cache.client(self.url)
+        eq_(self.server.wsdl_requests, 4)
+        eq_(len([f for f in os.listdir(entry) if f.endswith(".wsdl")]), 2)
+        ok_(c2.wsdl is not c1.wsdl)
+        ok_(c2.wsdl.url.endswith("%s.wsdl" % cache._read_meta(self.url)[
+            "sha1"]))
+
+    def test_in_process_expiry(self):
+        """A long lived cache revalidates its parsed definitions"""
+        cache = WsdlCache(self.directory, max_age=3600)
+        cache.client(self.url)
+        cache.client(self.url)
+        eq_(self.server.wsdl_requests, 1)
+        cache.max_age = 0
+        cache.client(self.url)
+        eq_(self.server.wsdl_requests, 2)
+
+    def test_prewarm(self):
+        """Prewarming stores the WSDL of given XSPs"""
+        WsdlCache(self.directory).prewarm(self.xsp)
+        eq_(self.server.wsdl_requests, 1)
+        WsdlCache(self.directory).client(self.url)
+        eq_(self.server.wsdl_requests, 1)
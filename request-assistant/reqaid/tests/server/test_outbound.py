@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the adaptive concurrency of outbound requests"""
+import time
+import threading
+from nose.tools import eq_, assert_raises
+
+from reqaid.controllers.server.outbound import OutboundScheduler, \
+    priority, BULK, INTERACTIVE, THROTTLED
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.oci_stub import OciStub, error_command
+
+
+def _hold(scheduler, host, release, level=None, started=None):
+    """Takes a slot in a thread until 'release' is set."""
+    def _run():
+        with scheduler.request(host, level):
+            if started is not None:
+                started.append(level)
+            release.wait(5)
+    t = threading.Thread(target=_run)
+    t.start()
+    return t
+
+
+class TestScheduler(object):
+
+    def test_increase(self):
+        """Timely responses grow the budget up to max_limit"""
+        scheduler = OutboundScheduler(initial_limit=2, max_limit=4)
+        for i in range(20):
+            with scheduler.request('xsp'):
+                pass
+        stats = scheduler.stats()['xsp']
+        eq_((stats['limit'], stats['ok'], stats['in_flight']), (4, 20, 0))
+
+    def test_decrease_once_per_round(self):
+        """Requests of one round decrease the budget once"""
+        scheduler = OutboundScheduler(initial_limit=8)
+        slots = [scheduler.request('xsp') for _ in range(3)]
+        for slot in slots:
+            slot.__enter__().outcome = THROTTLED
+        for slot in slots:
+            slot.__exit__(None, None, None)
+        eq_(scheduler.stats()['xsp']['limit'], 4)
+        assert_raises(ValueError, self._fail, scheduler)
+        eq_(scheduler.stats()['xsp']['limit'], 2)
+        eq_(scheduler.stats()['xsp']['error'], 1)
+        scheduler.configure(target_latency=0)
+        with scheduler.request('xsp'):
+            time.sleep(0.01)
+        eq_(scheduler.stats()['xsp']['limit'], 1)
+        eq_(scheduler.stats()['xsp']['slow'], 1)
+
+    def _fail(self, scheduler):
+        with scheduler.request('xsp'):
+            raise ValueError("connection refused")
+
+    def test_priority(self):
+        """Queued interactive requests go ahead of bulk ones"""
+        scheduler = OutboundScheduler(initial_limit=1, max_limit=1)
+        release = threading.Event()
+        started = []
+        threads = [_hold(scheduler, 'xsp', release)]
+        time.sleep(0.05)
+        threads.append(_hold(scheduler, 'xsp', release, BULK, started))
+        time.sleep(0.05)
+        threads.append(_hold(scheduler, 'xsp', release, INTERACTIVE,
+                             started))
+        time.sleep(0.05)
+        eq_(scheduler.stats()['xsp']['queued'], 2)
+        release.set()
+        for t in threads:
+            t.join()
+        eq_(started, [INTERACTIVE, BULK])
+
+    def test_queue_timeout(self):
+        """Requests waiting too long fail"""
+        scheduler = OutboundScheduler(initial_limit=1, max_limit=1,
+                                      queue_timeout=0.05)
+        release = threading.Event()
+        t = _hold(scheduler, 'xsp', release)
+        time.sleep(0.05)
+        with priority(BULK):
+            assert_raises(AssertionError, self._fail, scheduler)
+        release.set()
+        t.join()
+        eq_(scheduler.stats()['xsp']['queued'], 0)
+
+    def test_oci_client(self):
+        """OCI-P commands take slots, throttling errors shrink the budget"""
+        scheduler = OutboundScheduler(initial_limit=4)
+        stub = OciStub(responses={'UserDeleteRequest': error_command(
+            "[Error 5000] Too many requests, server busy")})
+        oci = OciClient("admin", "secret", "http://xsp", transport=stub,
+                        scheduler=scheduler)
+        assert_raises(AssertionError, oci.user_delete, 'alice@example.com')
+        stats = scheduler.stats()['xsp']
+        # Login grows the budget a little before it is halved
+        eq_((stats['ok'], stats['throttled'], int(stats['limit'])),
+            (2, 1, 2))
+
+    def test_disabled(self):
+        """A disabled scheduler does not limit"""
+        scheduler = OutboundScheduler(initial_limit=1, enabled=False)
+        with scheduler.request('xsp'):
+            with scheduler.request('xsp'):
+                pass
+        eq_(scheduler.stats(), {})
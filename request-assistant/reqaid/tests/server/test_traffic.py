@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the recording and replay of the BroadWorks traffic"""
+import os
+import json
+import time
+import shutil
+import tempfile
+from nose.tools import eq_, ok_, assert_raises
+
+from reqaid.controllers.server.traffic import TrafficRecorder, \
+    TrafficReplay, DM
+from reqaid.controllers.server.oci_tool import OciClient
+from reqaid.controllers.server.xsi_tool import XsiTool
+from reqaid.controllers.server.oci_stub import OciStub, response_command
+from reqaid.controllers.server.oci_standin import OciStandIn
+from reqaid.controllers.server.oci_numbers import number_pools
+
+
+def _numbers(session_id, command, _count=[0]):
+    """Another available number on every request."""
+    _count[0] += 1
+    return response_command('GroupDnGetAvailableListResponse',
+                            '<phoneNumber>+1-555000%d</phoneNumber>' %
+                            _count[0])
+
+
+class _Response(object):
+
+    status_code = 200
+    history = []
+
+    def __init__(self, content):
+        self.content = content
+
+
+def get(url, **kwargs):
+    """Stands for requests.get."""
+    return _Response('<MusicOnHold xmlns="http://schema.broadsoft.com/xsi">'
+                     '<active>true</active></MusicOnHold>')
+
+
+def get_binary(url, **kwargs):
+    """Stands for requests.get of a file which is not UTF-8 text."""
+    return _Response('\x1f\x8b\x08\x00\xff\xfe')
+
+
+class TestTraffic(object):
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'traffic.jsonl.gz')
+        number_pools.clear()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def _record(self):
+        recorder = TrafficRecorder(self.path)
+        stub = OciStub(responses={
+            'GroupDnGetAvailableListRequest': _numbers})
+        oci = OciClient("admin", "secret", "http://xsp",
+                        transport=recorder.transport(lambda: stub))
+        recorded = [oci.group_get_available_numbers() for _ in range(2)]
+        recorder.close()
+        return recorded
+
+    def test_oci(self):
+        """OCI-P responses are served in the recorded order"""
+        recorded = self._record()
+        replay = TrafficReplay(self.path)
+        oci = OciClient("admin", "secret", "http://xsp",
+                        transport=replay.transport())
+        eq_([oci.group_get_available_numbers() for _ in range(3)],
+            recorded + recorded[-1:])
+        ok_(oci.session_id in oci.oci_command)
+        assert_raises(AssertionError, oci.user_delete, 'alice@example.com')
+        eq_(replay.stats(), {'served': 5, 'missed': 1, 'recorded': 4})
+
+    def test_passthrough(self):
+        """Requests which were not recorded can go to the server"""
+        self._record()
+        replay = TrafficReplay(self.path, passthrough=True)
+        stub = OciStub()
+        oci = OciClient("admin2", "secret", "http://xsp",
+                        transport=replay.transport(lambda: stub))
+        oci.user_delete('alice@example.com')
+        ok_('UserDeleteRequest' in stub.commands)
+        eq_(replay.stats()['missed'], 3)
+
+    def test_latency(self):
+        """Responses can take their recorded time"""
+        recorder = TrafficRecorder(self.path)
+        recorder.record(DM, time.time() - 0.2, method='get',
+                        url='http://dm/config.xml', data=None, status=200,
+                        body='<config/>')
+        recorder.close()
+        replay = TrafficReplay(self.path, latency=0.5)
+        xsi = XsiTool("http://xsp", "alice", "secret", traffic=replay)
+        start = time.time()
+        eq_(xsi._dm_get('http://dm/', 'alice', 'secret').getroot().tag,
+            'config')
+        ok_(0.1 <= time.time() - start < 0.2)
+
+    def test_xsi(self):
+        """XSI requests are recorded, then served by XsiTool"""
+        path = os.path.join(self.tmp, 'traffic.jsonl')
+        recorder = TrafficRecorder(path)
+        xsi = XsiTool("http://xsp", "alice", "secret", traffic=recorder)
+        xsi._xsi_http(get, api_endpoint="services/musiconhold")
+        recorder.close()
+        with open(path) as f:
+            entry = json.loads(f.read())
+        eq_((entry['kind'], entry['method'], entry['status']),
+            ('xsi', 'get', 200))
+        # Replayed without the server
+        xsi.traffic = TrafficReplay(path)
+        eq_(xsi.get_moh(), True)
+        assert_raises(AssertionError, xsi.get_dnd)
+
+    def test_binary(self):
+        """Bodies which are not UTF-8 text are served as recorded"""
+        recorder = TrafficRecorder(self.path)
+        recorder.http(DM, get_binary)('http://dm/config.bin')
+        recorder.close()
+        replay = TrafficReplay(self.path)
+        eq_(replay.http(DM, get_binary)('http://dm/config.bin').content,
+            get_binary('http://dm/config.bin').content)
+
+    def test_workflow(self):
+        """A provisioning workflow is replayed despite its random values"""
+        recorder = TrafficRecorder(self.path)
+        standin = OciStandIn(passwords={'admin': 'secret'},
+                             numbers=['+1-5550000100', '+1-5550000101'],
+                             domains=['example.com'])
+        oci = OciClient("admin", "secret", "http://xsp",
+                        transport=recorder.transport(lambda: standin))
+        recorded = oci.create_ucone_test_user(
+            "Alice", "Anderson", "Welcom3",
+            sca_devices=['Business Communicator - PC'])
+        recorder.close()
+        number_pools.clear()
+        replay = TrafficReplay(self.path)
+        oci = OciClient("admin", "secret", "http://xsp",
+                        transport=replay.transport())
+        eq_(oci.create_ucone_test_user(
+            "Alice", "Anderson", "Welcom3",
+            sca_devices=['Business Communicator - PC']), recorded)
+        eq_(replay.stats()['missed'], 0)